@@ -0,0 +1,125 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ansible filters that look up software and patch metadata through an index."""
+
+from __future__ import annotations
+
+import collections
+import re
+
+from ansible.module_utils.common.text.converters import to_text
+
+try:
+    from ansible.module_utils.compat.version import LooseVersion
+except ImportError:
+    # ansible-core releases before 2.12 do not ship the compat copy.
+    from distutils.version import LooseVersion
+
+DOCUMENTATION = """
+  name: swlib_file_lists
+  short_description: Select the software, patch and OPatch files of a release
+  description:
+    - Returns the facts of roles/swlib/tasks/build_file_list.yml, i.e. gi_base_files,
+      rdbms_base_files, base_sw_file_list, patch_details_list, patch_file_list,
+      opatch_file_list and required_opatch_version, in one call.
+    - Each metadata list is indexed by version or release once per call, instead of
+      scanning every list for every fact.
+"""
+
+def _index(entries, key):
+    """Returns the entries grouped by the value of key, in their original order"""
+    index = collections.defaultdict(list)
+    for entry in entries:
+        index[entry.get(key)].append(entry)
+    return index
+
+
+def _unique(items):
+    """Returns the items without duplicates, in order, as the unique filter does"""
+    result = []
+    for item in items:
+        if item not in result:
+            result.append(item)
+    return result
+
+
+def _matches(value, word):
+    # The search test of the former selectattr chains: word matches anywhere
+    # in the text of value, e.g. EE in the edition list [EE, SE2].
+    return bool(re.search('\\b' + to_text(word) + '\\b', to_text(value)))
+
+
+def swlib_patches(patches, release, category=None, base=None):
+    """Returns the patches of release, optionally of the given categories and base version"""
+    categories = [category] if isinstance(category, str) else category
+    return [p for p in _index(patches, 'release').get(release, [])
+            if (categories is None or p.get('category') in categories) and (base is None or p.get('base') == base)]
+
+
+def swlib_file_lists(rdbms_software, gi_software, gi_interim_patches, rdbms_patches, gi_patches, opatch_patches,
+                     oracle_ver, oracle_rel, oracle_edition, os_version, gi_install=False, free_edition=False,
+                     patch_only=False):
+    """Returns the software, patch and OPatch files to install for a version and release"""
+    opatch_file_list = []
+    required_opatch_version = None
+    if not free_edition and oracle_rel != 'base':
+        opatch_file_list = [p.get('patchfile') for p in _index(opatch_patches, 'release').get(oracle_ver, [])]
+
+    gi_base_files = []
+    if gi_install and not patch_only:
+        gi_base_files = [f for entries in (gi_software, gi_interim_patches)
+                         for s in _index(entries, 'version').get(oracle_ver, []) for f in s.get('files', [])]
+
+    rdbms_base_files = []
+    if not patch_only:
+        version_sw = _index(rdbms_software, 'version').get(oracle_ver, [])
+        os_sw = ([s for s in version_sw if 'os_version' not in s]
+                 + [s for s in version_sw if 'os_version' in s and s['os_version'] == os_version]
+                 + [s for s in version_sw if 'os_version' in s and _matches(s['os_version'], os_version)])
+        edition_sw = ([s for s in os_sw if s.get('edition') == oracle_edition]
+                      + [s for s in os_sw if _matches(s.get('edition'), oracle_edition)])
+        rdbms_base_files = _unique(f for s in edition_sw for f in s.get('files', []))
+
+    patch_details_list = []
+    if gi_install:
+        patch_details_list = _unique(swlib_patches(gi_patches, oracle_rel))
+        patch_details_list = _unique(patch_details_list + swlib_patches(rdbms_patches, oracle_rel, 'RU_Combo'))
+    elif not free_edition:
+        patch_details_list = _unique(swlib_patches(rdbms_patches, oracle_rel, ['DB_OJVM_RU', 'DB_RU']))
+
+    if not free_edition and oracle_rel != 'base':
+        for version in (p['minimum_opatch'] for p in patch_details_list if p.get('minimum_opatch')):
+            if required_opatch_version is None or LooseVersion(str(version)) > LooseVersion(str(required_opatch_version)):
+                required_opatch_version = version
+
+    return {
+        'opatch_file_list': opatch_file_list,
+        'gi_base_files': gi_base_files,
+        'rdbms_base_files': rdbms_base_files,
+        'base_sw_file_list': [{'file_name': f.get('name'), 'alt_name': f.get('alt_name')}
+                              for f in gi_base_files + rdbms_base_files],
+        'patch_details_list': patch_details_list,
+        'patch_file_list': _unique(p.get('patchfile') for p in patch_details_list),
+        'required_opatch_version': required_opatch_version,
+    }
+
+
+class FilterModule:
+
+    def filters(self):
+        return {
+            'swlib_file_lists': swlib_file_lists,
+            'swlib_patches': swlib_patches,
+        }
@@ -0,0 +1,98 @@
+import glob
+import os
+import sys
+import unittest
+
+import yaml
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar, trust_as_template
+
+# The tests live outside of filter_plugins, because Ansible loads every Python
+# file in a filter plugin directory as a plugin.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import swlib_metadata  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# The selectattr chains that roles/swlib/tasks/build_file_list.yml used before
+# swlib_file_lists, each with the condition of its task, in the order of the tasks.
+SELECTATTR_FILE_LISTS = [
+    ('opatch_file_list', """{{ (opatch_patches | selectattr('release', 'equalto', oracle_ver) | map(attribute='patchfile') | list)
+                               if not free_edition and oracle_rel != 'base' else [] }}"""),
+    ('gi_base_files', """{{ ((gi_software + gi_interim_patches) | selectattr('version', 'equalto', oracle_ver)
+                            | map(attribute='files') | flatten) if gi_install and not patch_only else [] }}"""),
+    ('rdbms_version_sw', """{{ (rdbms_software | selectattr('os_version', 'undefined') | list)
+                               + (rdbms_software | selectattr('os_version', 'defined')
+                                  | selectattr('os_version', 'equalto', os_version) | list)
+                               + (rdbms_software | selectattr('os_version', 'defined')
+                                  | selectattr('os_version', 'search', '\\b' + os_version + '\\b') | list) }}"""),
+    ('rdbms_edition_sw', """{{ (rdbms_version_sw | selectattr('edition', 'equalto', oracle_edition) | list)
+                               + (rdbms_version_sw | selectattr('edition', 'search', '\\b' + oracle_edition + '\\b') | list) }}"""),
+    ('rdbms_base_files', """{{ (rdbms_edition_sw | selectattr('version', 'equalto', oracle_ver) | map(attribute='files')
+                               | flatten | unique) if not patch_only else [] }}"""),
+    ('patch_details_list', """{{ (((gi_patches | selectattr('release', 'equalto', oracle_rel) | list | unique)
+                                   + (rdbms_patches | selectattr('release', 'equalto', oracle_rel)
+                                      | selectattr('category', 'equalto', 'RU_Combo') | list)) | unique)
+                                 if gi_install else
+                                 (rdbms_patches | selectattr('release', 'equalto', oracle_rel)
+                                  | selectattr('category', 'in', ['DB_OJVM_RU','DB_RU']) | list | unique)
+                                 if not free_edition else [] }}"""),
+]
+
+
+def _load_metadata():
+    metadata = {}
+    for path in glob.glob(os.path.join(REPO_ROOT, 'roles', 'common', 'defaults', 'main', '*.yml')):
+        with open(path) as f:
+            metadata.update(yaml.safe_load(f))
+    return {key: metadata[key] for key in ('rdbms_software', 'gi_software', 'gi_interim_patches', 'rdbms_patches',
+                                           'gi_patches', 'opatch_patches')}
+
+
+class TestSwlibMetadata(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metadata = _load_metadata()
+
+    def _selectattr_file_lists(self, **variables):
+        variables = dict(self.metadata, **variables)
+        for key, template in SELECTATTR_FILE_LISTS:
+            variables[key] = Templar(loader=DataLoader(), variables=variables).template(trust_as_template(template))
+        return {key: variables[key] for key in ('opatch_file_list', 'gi_base_files', 'rdbms_base_files', 'patch_details_list')}
+
+    def _releases(self, version):
+        return ['base'] + [p['release'] for p in self.metadata['gi_patches'] if p.get('base') == version]
+
+    def test_file_lists_match_selectattr_chains(self):
+        versions = sorted({s['version'] for s in self.metadata['rdbms_software'] + self.metadata['gi_software']})
+        cases = [dict(oracle_ver=version, oracle_rel=release, oracle_edition=edition, os_version=os_version,
+                      gi_install=gi_install, free_edition=edition == 'FREE', patch_only=False)
+                 for version in versions for release in self._releases(version)[-2:]
+                 for edition in ('EE', 'SE2', 'FREE') for os_version in ('8', '9') for gi_install in (False, True)]
+        cases.append(dict(cases[-1], patch_only=True))
+        for case in cases:
+            with self.subTest(**case):
+                expected = self._selectattr_file_lists(**case)
+                actual = swlib_metadata.swlib_file_lists(**dict(self.metadata, **case))
+                for key, value in expected.items():
+                    self.assertEqual(actual[key], value, key)
+
+    def test_required_opatch_version_is_the_highest_minimum(self):
+        patches = [{'release': 'r1', 'category': 'DB_RU', 'patchfile': 'p%d.zip' % i, 'minimum_opatch': version}
+                   for i, version in enumerate(('12.2.0.1.9', '12.2.0.1.40', '', '12.2.0.1.37'))]
+        file_lists = swlib_metadata.swlib_file_lists([], [], [], patches, [], [], oracle_ver='19.3.0.0.0',
+                                                     oracle_rel='r1', oracle_edition='EE', os_version='8')
+        self.assertEqual(file_lists['required_opatch_version'], '12.2.0.1.40')
+        self.assertEqual(file_lists['patch_file_list'], ['p0.zip', 'p1.zip', 'p2.zip', 'p3.zip'])
+
+    def test_patches_keep_their_order_across_categories(self):
+        patches = [{'release': 'r1', 'category': c, 'base': 'b'} for c in ('DB_RU', 'RU_Combo', 'DB_OJVM_RU', 'DB_RU')]
+        self.assertEqual(swlib_metadata.swlib_patches(patches, 'r1', ['DB_OJVM_RU', 'DB_RU']),
+                         [patches[0], patches[2], patches[3]])
+        self.assertEqual(swlib_metadata.swlib_patches(patches, 'r1', 'RU_Combo', base='b'), [patches[1]])
+        self.assertEqual(swlib_metadata.swlib_patches(patches, 'r2'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
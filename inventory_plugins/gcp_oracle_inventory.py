@@ -2,82 +2,662 @@ DOCUMENTATION = r'''
     name: gcp_oracle_inventory
     plugin_type: inventory
     short_description: Returns Ansible inventory from a YAML configuration file
-    description: Returns Ansible inventory from a YAML configuration file
+    description:
+      - Returns Ansible inventory from a YAML configuration file.
+      - A fleet inventory file, whose name ends with C(gcp_oracle_fleet.yml), sets I(plugin) and lists
+        several configuration files, directories or glob patterns in I(config_file). Each
+        configuration file becomes a deployment with its own namespaced groups.
     options:
       plugin:
           description: Name of the plugin
           required: true
           choices: ['gcp_oracle_inventory']
       config_file:
-        description: Path to the YAML configuration file
+        description:
+          - Paths of the YAML configuration files.
+          - A directory stands for all C(gcp_oracle.yml*) files below it, a glob pattern for all
+            files it matches. Relative paths are relative to the fleet inventory file.
+        type: list
+        elements: str
         required: true
+      parse_workers:
+        description:
+          - Number of processes reading and validating the configuration files of a fleet
+            inventory in parallel. 0 uses one process per CPU.
+        type: int
+        default: 0
+    extends_documentation_fragment:
+      - inventory_cache
 '''
 
-from ansible.plugins.inventory import BaseInventoryPlugin
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable
 from ansible.errors import AnsibleParserError
+from ansible.inventory.group import to_safe_group_name
+from ansible.parsing.vault import is_encrypted
+import concurrent.futures
+import glob
+import hashlib
+import ipaddress
+import multiprocessing
+import re
 import yaml
 import os
 
 DEFAULT_HOSTGROUP_NAME = 'dbasm'
+# Name of the primary host of a Data Guard inventory, used by the dg-config
+# and db-copy roles to delegate tasks to the primary.
+PRIMARY_HOSTNAME = 'primary1'
+CONFIG_FILE_PREFIX = 'gcp_oracle.yml'
+FLEET_FILE_SUFFIXES = ('gcp_oracle_fleet.yml', 'gcp_oracle_fleet.yaml')
+# Fewer files than this are not worth starting worker processes for.
+PARALLEL_PARSE_MIN_FILES = 8
+# The variables that the toolkit's group_vars/all.yml defines. It takes
+# precedence over inventory group variables, but not over inventory host
+# variables, so config values of these names are set on the hosts. The tests
+# check that the list matches group_vars/all.yml.
+TOOLKIT_GROUP_VARS = frozenset((
+    'ansible_ssh_extra_args', 'ansible_ssh_private_key_file', 'ansible_ssh_user', 'arch_bu_start_min',
+    'asm_definition_file', 'asm_disk_input', 'asm_disks', 'asm_sid', 'backup_dest', 'charset', 'cluster_type',
+    'container_db', 'control_node_key_file', 'create_db', 'create_listener', 'data_destination',
+    'data_guard_protection_mode', 'data_mounts_definition_file', 'data_mounts_input', 'db_config_type', 'db_domain',
+    'db_name', 'db_password_secret', 'db_type', 'disable_firewall', 'enable_tls', 'firsttime_connect_user',
+    'free_edition', 'full_bu_level0_day', 'full_bu_level1_days', 'full_bu_start_hour', 'full_bu_start_min',
+    'gcsfuse_backup_bucket', 'gcsfuse_backup_bucket_folder', 'gcsfuse_backup_config', 'gcsfuse_backup_mount_path',
+    'gcsfuse_backup_path', 'gcsfuse_backup_temp_path', 'gi_install', 'grid_group', 'grid_user', 'home_name',
+    'install_rdbms', 'install_workload_agent', 'instance_num', 'instance_ssh_key', 'instance_ssh_user',
+    'listener_name', 'listener_port', 'log_transport_mode', 'logs_dir', 'memory_pct', 'minimum_ansible_version',
+    'ncharset', 'nfs_backup_config', 'nfs_backup_mount', 'ntp_preferred', 'ora_disk_management', 'oracle_edition',
+    'oracle_group', 'oracle_install_env_extras', 'oracle_metrics_secret', 'oracle_rel', 'oracle_root', 'oracle_sid',
+    'oracle_user', 'oracle_user_data_mounts', 'oracle_ver', 'oracle_ver_base', 'os_family_supported',
+    'os_min_supported_version', 'os_minimum_memory_mb', 'os_minimum_swap_mb', 'os_supported_architecture', 'pdb_count',
+    'pdb_prefix', 'pga_target_mb', 'proxy_setup', 'rac_cluster_nodes', 'real_time_apply', 'reco_destination',
+    'redologsize', 'rman_arch_redundancy', 'rman_archs_online_days', 'rman_db_bu_redundancy', 'role_separation',
+    'run_initial_bu', 'scripts_dir', 'sga_target_mb', 'swlib_gcs_service_account_file', 'swlib_mount_src',
+    'swlib_mount_type', 'swlib_path', 'swlib_path_default', 'swlib_unzip_path', 'tls_listener_port', 'u01_lun',
+    'use_omf', 'version_map',
+))
+# The Oracle versions of the ora_version shorthands, as version_map of group_vars/all.yml maps them
+VERSION_MAP = {
+    '26': '23.26.1.0.0',
+    '23': '23.0.0.0.0',
+    '21': '21.3.0.0.0',
+    '19': '19.3.0.0.0',
+    '18': '18.0.0.0.0',
+    '12': '12.2.0.1.0',
+    '12.2': '12.2.0.1.0',
+    '12.1': '12.1.0.2.0',
+    '11': '11.2.0.4.0',
+}
+# The libyaml based loader is several times faster than the pure Python one.
+YAML_SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Ansible's loader in a parse worker process, inherited from the parent
+_worker_loader = None
 
-class InventoryModule(BaseInventoryPlugin):
+
+# Rules for the values of a gcp_oracle.yml file, covering what
+# validate-config.yml checks. A rule has a type (str, int, bool, list, dict,
+# ip or hostname) and may set required, choices, ignore_case, pattern,
+# message (describing the pattern), allow_empty, min and max. A dict rule
+# lists the rules of its keys in fields, a list rule the rule of its
+# elements in items. Keys without a rule are accepted as they are.
+HOSTNAME_PATTERN = r'^[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*$'
+_DB_NAME_RULE = {'pattern': r'^[a-zA-Z][a-zA-Z0-9_$]*$', 'message': 'must start with a letter and contain only letters, digits, _ and $'}
+_SECRET_RULE = {'pattern': r'^projects/[^/]+/secrets/[^/]+/versions/[^/]+$', 'message': 'must have the format projects/<project>/secrets/<secret>/versions/<version>', 'allow_empty': True}
+_DESTINATION_RULE = {'pattern': r'^(/|\+)?[a-zA-Z0-9/_-]+$', 'message': 'must be a valid path or ASM diskgroup'}
+_COUNT_RULE = {'type': 'int', 'min': 0}
+_NODE_RULE = {'type': 'dict', 'fields': {
+    'node_name': {'type': 'hostname', 'required': True},
+    'host_ip': {'type': 'ip', 'required': True},
+    'vip_name': {'type': 'hostname'},
+    'vip_ip': {'type': 'ip'},
+}}
+_STANDBY_RULE = {'type': 'dict', 'fields': {
+    'instance_hostname': {'type': 'hostname', 'required': True},
+    'instance_ip_addr': {'type': 'ip', 'required': True},
+    'redo_transport': {'choices': ['SYNC', 'ASYNC', 'FASTSYNC'], 'ignore_case': True},
+    'db_unique_name': _DB_NAME_RULE,
+}}
+# Only the nodes are required: the inventory is also parsed for playbooks
+# other than the installation, e.g. for cleanup with a reduced config.
+_CLUSTER_RULE = {'type': 'dict', 'fields': {
+    'scan_name': {'type': 'hostname'},
+    'scan_port': {'type': 'int', 'min': 1024, 'max': 65535},
+    'scan_ip1': {'type': 'ip'},
+    'scan_ip2': {'type': 'ip'},
+    'scan_ip3': {'type': 'ip'},
+    'nodes': {'type': 'list', 'required': True, 'min': 1, 'items': _NODE_RULE},
+}}
+COMMON_CONFIG_SCHEMA = {
+    'ora_version': {'pattern': r'^(26|23\.26\.1\.0\.0|23(\.0\.0\.0\.0)?|21(\.3\.0\.0\.0)?|19(\.3\.0\.0\.0)?|18(\.0\.0\.0\.0)?|12(\.[12])?(\.2\.0\.1\.0|\.1\.0\.2\.0)?|11(\.2\.0\.4\.0)?)$', 'message': 'is not a supported Oracle version'},
+    'ora_release': {'pattern': r'^(base|latest|[0-9]{,2}\.[0-9]{,2}\.[0-9]{,2}\.[0-9]{,2}\.[0-9]{,6})$', 'message': 'must be base, latest or a release number'},
+    'ora_edition': {'choices': ['EE', 'SE', 'SE2', 'FREE']},
+    'ora_cluster_type': {'choices': ['NONE', 'RAC', 'DG']},
+    'ora_swlib_bucket': {'pattern': r'^(gs://|https?://)', 'message': 'must start with gs:// or http(s)://'},
+    'ora_swlib_type': {'choices': ['gcs', 'gcsfuse', 'nfs', 'gcsdirect', 'gcstransfer'], 'ignore_case': True},
+    'ora_disk_mgmt': {'choices': ['asmlib', 'asmudev', 'udev', 'fs'], 'ignore_case': True},
+    'ora_db_type': {'choices': ['multipurpose', 'data_warehousing', 'oltp'], 'ignore_case': True},
+    'ora_data_destination': _DESTINATION_RULE,
+    'ora_reco_destination': _DESTINATION_RULE,
+    'ora_asm_disks_json': {'type': 'list'},
+    'ora_data_mounts_json': {'type': 'list'},
+    '_db_password_secret': _SECRET_RULE,
+    'db_password_secret': _SECRET_RULE,
+    '_oracle_metrics_secret': _SECRET_RULE,
+    '_install_workload_agent': {'type': 'bool'},
+    'ora_data_guard_protection_mode': {'choices': ['Maximum Performance', 'Maximum Availability', 'Maximum Protection'], 'allow_empty': True},
+    'ora_db_name': _DB_NAME_RULE,
+    'db_name': _DB_NAME_RULE,
+    'ora_listener_name': _DB_NAME_RULE,
+    'ora_pdb_name_prefix': _DB_NAME_RULE,
+    'ora_listener_port': {'type': 'int', 'min': 1024, 'max': 65535},
+    'ora_pdb_count': _COUNT_RULE,
+    'ora_redo_log_size': {'pattern': r'^[0-9]+MB$', 'message': "must have the format '100MB'"},
+    'gcs_backup_config': {'pattern': r'^[a-zA-Z0-9]+$', 'message': 'must contain only letters and digits'},
+    '_nfs_backup_mount': {'pattern': r'^[!-~]*:[!-~]*$', 'message': 'must have the format <server>:<path>', 'allow_empty': True},
+    '_nfs_backup_config': {'choices': ['nfsv3', 'nfsv4'], 'allow_empty': True},
+    'ora_db_domain': {'pattern': r'^$|^[A-Za-z][A-Za-z0-9._-]{0,127}$', 'message': 'is not a valid domain name'},
+    'backup_redundancy': _COUNT_RULE,
+    'archive_redundancy': _COUNT_RULE,
+    'archive_online_days': _COUNT_RULE,
+    'compatible_rdbms': {'pattern': r'^(0|[0-9][0-9]\.[0-9].*)$', 'message': 'must be a version number such as 19.0.0'},
+    'swap_blk_device': {'pattern': r'^/dev/.+', 'message': 'must be a device path', 'allow_empty': True},
+    'ora_db_charset': {'pattern': r'^[A-Z0-9]+$', 'message': 'must contain only upper case letters and digits'},
+    'ora_db_ncharset': {'pattern': r'^[A-Z0-9]+$', 'message': 'must contain only upper case letters and digits'},
+    '_instance_ssh_user': {'pattern': r'^[a-z_][a-z0-9_-]{0,31}$', 'message': 'is not a valid user name'},
+    'ntp_pref': {'type': 'hostname'},
+    'instance_hostname': {'type': 'hostname'},
+    'instance_ip_addr': {'type': 'ip'},
+    'primary_ip_addr': {'type': 'ip'},
+}
+# The config schema of each cluster type, with the label used in messages
+CONFIG_SCHEMAS = {
+    'NONE': ('Single Instance', dict(COMMON_CONFIG_SCHEMA, **{
+        'instance_hostname': {'type': 'hostname', 'required': True},
+        'instance_ip_addr': {'type': 'ip', 'required': True},
+    })),
+    'DG': ('Data Guard', dict(COMMON_CONFIG_SCHEMA, **{
+        'instance_hostname': {'type': 'hostname', 'required': True},
+        'instance_ip_addr': {'type': 'ip', 'required': True},
+        'primary_ip_addr': {'type': 'ip', 'required': True},
+    })),
+    # A Data Guard configuration listing several standbys
+    'DG_STANDBYS': ('Data Guard', dict(COMMON_CONFIG_SCHEMA, **{
+        'primary_ip_addr': {'type': 'ip', 'required': True},
+        'standbys': {'type': 'list', 'required': True, 'min': 1, 'items': _STANDBY_RULE},
+    })),
+    'RAC': ('RAC', dict(COMMON_CONFIG_SCHEMA, **{
+        'cluster_config_json': {'type': 'list', 'required': True, 'min': 1, 'items': _CLUSTER_RULE},
+    })),
+}
+_TYPE_NAMES = {'str': 'a string', 'int': 'an integer', 'bool': 'a boolean', 'list': 'a list', 'dict': 'a mapping', 'ip': 'an IP address', 'hostname': 'a host name'}
+
+
+def _compile_rule(rule, label):
+    '''Compile a rule into a function(value, path, errors) appending the errors of a value'''
+    kind = rule.get('type', 'str')
+    checks = []
+
+    if kind in ('str', 'hostname'):
+        pattern = re.compile(HOSTNAME_PATTERN if kind == 'hostname' else rule.get('pattern', ''))
+        message = rule.get('message', 'is not %s' % _TYPE_NAMES[kind])
+        choices = rule.get('choices')
+        if rule.get('ignore_case') and choices:
+            choices = [c.lower() for c in choices]
+
+        def check_str(value, path, errors):
+            # YAML turns unquoted versions such as 19 into numbers, and values
+            # encrypted with Ansible Vault are decrypted by str().
+            if isinstance(value, (bool, list, dict)) or value is None:
+                return "must be %s, not %s" % (_TYPE_NAMES[kind], type(value).__name__)
+            text = str(value)
+            if rule.get('allow_empty') and text == '':
+                return None
+            if choices is not None:
+                if (text.lower() if rule.get('ignore_case') else text) not in choices:
+                    return "'%s' must be one of: %s" % (text, ', '.join(rule['choices']))
+            elif not pattern.match(text):
+                return "'%s' %s" % (text, message)
+            return None
+        checks.append(check_str)
+    elif kind == 'ip':
+        def check_ip(value, path, errors):
+            try:
+                ipaddress.ip_address(str(value) if not isinstance(value, (int, list, dict)) else None)
+            except ValueError:
+                return "'%s' is not an IP address" % value
+            return None
+        checks.append(check_ip)
+    elif kind == 'int':
+        low, high = rule.get('min'), rule.get('max')
+
+        def check_int(value, path, errors):
+            if isinstance(value, bool) or not (isinstance(value, int) or (isinstance(value, str) and value.isdigit())):
+                return "'%s' must be an integer" % value
+            if (low is not None and int(value) < low) or (high is not None and int(value) > high):
+                return '%s must be between %s and %s' % (value, low, high) if high is not None else '%s must be at least %s' % (value, low)
+            return None
+        checks.append(check_int)
+    elif kind == 'bool':
+        def check_bool(value, path, errors):
+            if not isinstance(value, bool) and str(value).lower() not in ('true', 'false'):
+                return "'%s' must be true or false" % value
+            return None
+        checks.append(check_bool)
+    elif kind == 'list':
+        item_check = _compile_rule(rule['items'], label) if 'items' in rule else None
+
+        def check_list(value, path, errors):
+            if not isinstance(value, list):
+                return 'must be a list, not %s' % type(value).__name__
+            if len(value) < rule.get('min', 0):
+                return 'must not be empty'
+            if item_check:
+                for i, item in enumerate(value):
+                    item_check(item, '%s[%d]' % (path, i), errors)
+            return None
+        checks.append(check_list)
+    elif kind == 'dict':
+        field_checks = _compile_fields(rule['fields'], label)
+
+        def check_dict(value, path, errors):
+            if not isinstance(value, dict):
+                return 'must be a mapping, not %s' % type(value).__name__
+            field_checks(value, path + '.', errors)
+            return None
+        checks.append(check_dict)
+
+    def check(value, path, errors):
+        for c in checks:
+            error = c(value, path, errors)
+            if error:
+                errors.append("Invalid value for '%s': %s." % (path, error))
+    return check
+
+
+def _compile_fields(fields, label):
+    '''Compile the rules of the keys of a mapping into a function(mapping, prefix, errors)'''
+    compiled = [(name, rule.get('required', False), _compile_rule(rule, label)) for name, rule in fields.items()]
+
+    def check(mapping, prefix, errors):
+        for name, required, check_value in compiled:
+            if name in mapping:
+                check_value(mapping[name], prefix + name, errors)
+            elif required:
+                errors.append("Missing required variable '%s%s' for %s installation." % (prefix, name, label))
+    return check
+
+
+def _is_true(value):
+    return value is True or str(value).lower() == 'true'
+
+
+def _version_tuple(version):
+    '''Return the leading numeric components of a version string'''
+    return tuple(int(part) for part in re.findall(r'\d+', str(version)))
+
+
+def _check_combinations(config):
+    '''Return the errors of combinations of values, as checked by validate-config.yml
+
+    Values that only the installation needs, such as ora_swlib_bucket, are
+    left to validate-config.yml, as the inventory is parsed for every playbook.
+    '''
+    errors = []
+    cluster_type = config.get('ora_cluster_type') or 'NONE'
+    edition = config.get('ora_edition') or 'EE'
+    disk_mgmt = 'fs' if edition == 'FREE' else str(config.get('ora_disk_mgmt') or 'udev').lower()
+    oracle_ver = VERSION_MAP.get(str(config['ora_version']), config['ora_version']) if config.get('ora_version') else '19.3.0.0.0'
+
+    if cluster_type == 'RAC' and disk_mgmt == 'fs':
+        errors.append("RAC deployments require shared storage and cannot use the 'fs' disk management type.")
+    if edition == 'FREE' and cluster_type != 'NONE':
+        errors.append("Oracle Free Edition ('FREE') only supports Single-Instance deployments. 'ora_cluster_type' must be 'NONE'.")
+    if edition == 'FREE' and config.get('ar_repo_url'):
+        errors.append('Artifact Registry repositories (ar_repo_url) are not supported with the Oracle Database free edition.')
+    if cluster_type == 'DG' and edition != 'EE':
+        errors.append('Data Guard deployments require Enterprise Edition.')
+    if config.get('primary_ip_addr') and config.get('instance_ip_addr') == config.get('primary_ip_addr'):
+        errors.append("'instance_ip_addr' and 'primary_ip_addr' cannot be the same.")
+    if disk_mgmt == 'fs':
+        for name in ('ora_data_destination', 'ora_reco_destination', '_backup_dest'):
+            if str(config.get(name, '')).startswith('+'):
+                errors.append("Invalid value for '%s': cannot specify an ASM diskgroup when ora_disk_mgmt is fs." % name)
+    if config.get('_oracle_metrics_secret') and not _is_true(config.get('_install_workload_agent', False)):
+        errors.append("'_install_workload_agent' must be true when '_oracle_metrics_secret' is set.")
+    for name in ('ora_asm_disks', 'ora_data_mounts'):
+        if name in config and name + '_json' in config:
+            errors.append("The variables '%s' and '%s_json' are mutually exclusive." % (name, name))
+    if config.get('gcs_backup_config') not in (None, 'manual') and str(config.get('gcs_backup_bucket', '')).endswith('/'):
+        errors.append("Invalid value for 'gcs_backup_bucket': must not end with a slash.")
+    if 'ora_db_container' in config and not _is_true(config['ora_db_container']) and _version_tuple(oracle_ver) >= (21,):
+        errors.append("Oracle 21c and newer require a Container Database. 'ora_db_container' must be true.")
+    compatible = config.get('compatible_rdbms')
+    if compatible and str(compatible) != '0' and _version_tuple(compatible) > _version_tuple(oracle_ver):
+        errors.append("'compatible_rdbms' %s cannot be a higher version than 'ora_version' %s." % (compatible, oracle_ver))
+
+    if cluster_type == 'RAC' and isinstance(config.get('cluster_config_json'), list):
+        errors.extend(_check_clusters(config['cluster_config_json']))
+    if cluster_type == 'DG' and isinstance(config.get('standbys'), list):
+        errors.extend(_check_standbys(config))
+    return errors
+
+
+def _duplicate_errors(values):
+    '''Return an error for each value used at more than one of the (path, value) pairs'''
+    errors = []
+    seen = {}
+    for path, value in values:
+        other = seen.setdefault(value, path)
+        if other != path:
+            errors.append("Duplicate value for '%s': '%s' is also used by '%s'." % (path, value, other))
+    return errors
+
+
+def _mapping_values(entries, keys):
+    '''Return the (path, value) pairs of keys in the (path, mapping) entries'''
+    return [('%s.%s' % (path, key), entry[key]) for path, entry in entries if isinstance(entry, dict) for key in keys if key in entry]
+
+
+def _cluster_group_suffix(index, cluster):
+    '''Return the suffix of the group of a cluster, its name or its position if it has none'''
+    return to_safe_group_name(str(cluster.get('cluster_name') or 'cluster%d' % (index + 1)), force=True, silent=True)
+
+
+def _check_clusters(clusters):
+    '''Return the conflicts between the clusters and nodes of a RAC configuration
+
+    The addresses and the host names of all clusters share one namespace
+    each, so e.g. a VIP of one cluster must not be a node IP of another.
+    '''
+    entries = [('cluster_config_json[%d]' % i, cluster) for i, cluster in enumerate(clusters)]
+    nodes = []
+    for path, cluster in entries:
+        cluster_nodes = cluster.get('nodes') if isinstance(cluster, dict) else None
+        nodes.extend(('%s.nodes[%d]' % (path, j), node) for j, node in enumerate(cluster_nodes if isinstance(cluster_nodes, list) else []))
+    errors = _duplicate_errors(_mapping_values(entries, ('scan_ip1', 'scan_ip2', 'scan_ip3')) + _mapping_values(nodes, ('host_ip', 'vip_ip')))
+    errors.extend(_duplicate_errors(_mapping_values(entries, ('scan_name',)) + _mapping_values(nodes, ('node_name', 'vip_name'))))
+    # Each cluster becomes a group named after it.
+    errors.extend(_duplicate_errors([('%s.cluster_name' % path, _cluster_group_suffix(i, cluster))
+                                     for i, (path, cluster) in enumerate(entries) if isinstance(cluster, dict)]))
+    return errors
+
+
+def _check_standbys(config):
+    '''Return the errors of the standbys list of a Data Guard configuration'''
+    errors = []
+    for name in ('instance_hostname', 'instance_ip_addr'):
+        if name in config:
+            errors.append("The variables '%s' and 'standbys' are mutually exclusive." % name)
+    entries = [('standbys[%d]' % i, s) for i, s in enumerate(config['standbys'])]
+    for key in ('instance_hostname', 'instance_ip_addr', 'db_unique_name'):
+        errors.extend(_duplicate_errors(_mapping_values(entries, (key,))))
+    for i, standby in enumerate(config['standbys']):
+        if not isinstance(standby, dict):
+            continue
+        hostname = standby.get('instance_hostname')
+        if hostname == PRIMARY_HOSTNAME:
+            errors.append("Invalid value for 'standbys[%d].instance_hostname': '%s' is the name of the primary host." % (i, hostname))
+        if standby.get('instance_ip_addr') == config.get('primary_ip_addr'):
+            errors.append("'standbys[%d].instance_ip_addr' and 'primary_ip_addr' cannot be the same." % i)
+        if len(config['standbys']) > 1 and 'db_unique_name' not in standby:
+            errors.append("Missing required variable 'standbys[%d].db_unique_name' for Data Guard installation with several standbys." % i)
+        # dg-config only sets up physical standbys that receive redo from the
+        # primary, so far sync instances and cascaded redo are rejected
+        # rather than silently configured as plain standbys.
+        if standby.get('role', 'physical_standby') != 'physical_standby':
+            errors.append("Invalid value for 'standbys[%d].role': '%s' is not supported, only physical_standby." % (i, standby['role']))
+        if standby.get('redo_source', PRIMARY_HOSTNAME) != PRIMARY_HOSTNAME:
+            errors.append("Invalid value for 'standbys[%d].redo_source': '%s' is not supported, standbys receive redo from %s."
+                          % (i, standby['redo_source'], PRIMARY_HOSTNAME))
+    return errors
+
+
+# Compiled once, when the plugin is loaded
+_CONFIG_VALIDATORS = {cluster_type: _compile_fields(schema, label) for cluster_type, (label, schema) in CONFIG_SCHEMAS.items()}
+
+
+def _init_parse_worker(loader):
+    '''Keep Ansible's loader, and its vault secrets, in a parse worker process'''
+    global _worker_loader
+    _worker_loader = loader
+
+
+def _load_configs_in_worker(paths):
+    '''Read and validate configuration files in a parse worker process
+
+    Returns a (config, vaulted, error message) tuple for each path.
+    '''
+    plugin = InventoryModule()
+    plugin.loader = _worker_loader
+    results = []
+    for path in paths:
+        try:
+            results.append((plugin._load_config_file(path), plugin.config_vaulted, None))
+        except AnsibleParserError as e:
+            results.append((None, False, str(e)))
+    return results
+
+
+class InventoryModule(BaseInventoryPlugin, Cacheable):
     NAME = 'gcp_oracle_inventory'
 
     def verify_file(self, path):
         '''Return true/false if this is possibly a valid file for this plugin to consume'''
         valid = False
-        if super(InventoryModule, self).verify_file(path):
-            if os.path.basename(path).startswith('gcp_oracle.yml'):
+        basename = os.path.basename(path)
+        if glob.has_magic(path):
+            # A glob pattern of configuration files passed directly as inventory source
+            if basename.startswith(CONFIG_FILE_PREFIX):
+                valid = any(os.path.isfile(p) for p in glob.iglob(path, recursive=True))
+        elif super(InventoryModule, self).verify_file(path):
+            if basename.startswith(CONFIG_FILE_PREFIX) or basename.endswith(FLEET_FILE_SUFFIXES):
                 valid = True
         return valid
 
     def parse(self, inventory, loader, path, cache=True):
         '''Return dynamic inventory from parsing the YAML file'''
         super(InventoryModule, self).parse(inventory, loader, path, cache)
+        # Until a fleet inventory file is read, the options only come from
+        # ansible.cfg and the environment.
+        self.set_options(direct={'plugin': self.NAME, 'config_file': [path]})
+        self._read_cache = cache
+        self.deployment = None
+        self._host_owners = {}
+        self._host_collisions = []
 
-        self._read_config_data(path)
-        self._validate_config_data()
+        if glob.has_magic(path):
+            self._parse_deployments([path], os.getcwd())
+            return
+
+        self.config_data = self._load_configs([path])[path]
+        if self.config_data.get('plugin') == self.NAME:
+            self.set_options(direct=self.config_data)
+            self._parse_deployments(self.get_option('config_file'), os.path.dirname(os.path.abspath(path)), exclude=path)
+            return
         self._populate_inventory()
 
+    def _parse_deployments(self, sources, basedir, exclude=None):
+        '''Populate one deployment per configuration file found in sources'''
+        paths = self._find_config_files(sources, basedir, exclude)
+        if not paths:
+            raise AnsibleParserError('No configuration files found in %s' % ', '.join(sources))
+
+        deployments = {}
+        for path in paths:
+            name = self._deployment_name(path)
+            if name in deployments:
+                raise AnsibleParserError("Configuration files '%s' and '%s' both map to deployment '%s'." % (deployments[name], path, name))
+            deployments[name] = path
+
+        configs = self._load_configs(paths)
+        for name, path in deployments.items():
+            self.deployment = name
+            self.config_data = configs[path]
+            self._populate_inventory()
+        self.deployment = None
+
+        if self._host_collisions:
+            raise AnsibleParserError('Hostname collisions between deployments: %s' % '; '.join(self._host_collisions))
+
+    def _find_config_files(self, sources, basedir, exclude=None):
+        '''Expand files, directories and glob patterns into a list of configuration files'''
+        paths = []
+        seen = set()
+        if exclude:
+            seen.add(os.path.realpath(exclude))
+        for source in sources:
+            source = os.path.join(basedir, os.path.expanduser(source))
+            if glob.has_magic(source):
+                candidates = sorted(p for p in glob.glob(source, recursive=True) if os.path.isfile(p))
+            elif os.path.isdir(source):
+                candidates = []
+                for root, dirs, files in os.walk(source):
+                    dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                    candidates.extend(os.path.join(root, f) for f in sorted(files) if f.startswith(CONFIG_FILE_PREFIX))
+            elif os.path.isfile(source):
+                candidates = [source]
+            else:
+                raise AnsibleParserError("Configuration file '%s' does not exist." % source)
+            for path in candidates:
+                if os.path.realpath(path) not in seen:
+                    seen.add(os.path.realpath(path))
+                    paths.append(path)
+        return paths
+
+    def _deployment_name(self, path):
+        '''Return the group name of the deployment described by a configuration file
+
+        The name is the suffix of a gcp_oracle.yml.<suffix> file name, or the
+        name of the directory holding the file otherwise.
+        '''
+        basename = os.path.basename(path)
+        name = ''
+        if basename.startswith(CONFIG_FILE_PREFIX):
+            name = basename[len(CONFIG_FILE_PREFIX):].lstrip('._-')
+        if not name:
+            name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        return to_safe_group_name(name, force=True, silent=True)
+
+    def _load_configs(self, paths):
+        '''Return the validated configuration of each file, keyed by path
+
+        With inventory caching enabled, a validated config is read from the
+        cache as long as the file is unchanged. The cache is not read when it
+        has to be refreshed, e.g. with --flush-cache. The remaining files are
+        read and validated by a pool of worker processes if there are many.
+        Configs read from files with Ansible Vault content are not cached, as
+        the cache would hold their decrypted values.
+        '''
+        use_cache = self.get_option('cache')
+        if use_cache:
+            self.load_cache_plugin()
+        configs = {}
+        vaulted = set()
+        missing = []
+        for path in paths:
+            if use_cache and self._read_cache:
+                try:
+                    configs[path] = self._cache[self.get_cache_key(path)]
+                    continue
+                except KeyError:
+                    pass
+            missing.append(path)
+
+        errors = []
+        workers = min(self.get_option('parse_workers') or os.cpu_count() or 1, len(missing))
+        if workers > 1 and len(missing) >= PARALLEL_PARSE_MIN_FILES:
+            # Ansible forks its own workers as well, so forking here is safe
+            # and avoids re-importing Ansible in every worker. Files are sent
+            # in chunks to keep the inter-process overhead low.
+            chunk_size = -(-len(missing) // (workers * 4))
+            chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+            # The loader is inherited by the forked workers, not pickled.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                                        initializer=_init_parse_worker, initargs=(self.loader,)) as pool:
+                for chunk, results in zip(chunks, pool.map(_load_configs_in_worker, chunks)):
+                    for path, (config, config_vaulted, error) in zip(chunk, results):
+                        if error is None:
+                            configs[path] = config
+                            if config_vaulted:
+                                vaulted.add(path)
+                        else:
+                            errors.append('%s: %s' % (path, error))
+        else:
+            for path in missing:
+                try:
+                    configs[path] = self._load_config_file(path)
+                    if self.config_vaulted:
+                        vaulted.add(path)
+                except AnsibleParserError as e:
+                    if len(paths) == 1:
+                        raise
+                    errors.append('%s: %s' % (path, e))
+        if errors:
+            raise AnsibleParserError('Invalid configuration files:\n%s' % '\n'.join(errors))
+
+        if use_cache:
+            for path in missing:
+                if path not in vaulted:
+                    self._cache[self.get_cache_key(path)] = configs[path]
+        return configs
+
+    def _load_config_file(self, path):
+        '''Read and validate a configuration file'''
+        self._read_config_data(path)
+        # A fleet inventory file only lists other configuration files.
+        if self.config_data.get('plugin') != self.NAME:
+            self._validate_config_data()
+        return self.config_data
+
+    def get_cache_key(self, path):
+        '''Return a cache key that changes whenever the configuration file changes'''
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            raise AnsibleParserError('Error reading YAML configuration file: %s' % e)
+        return '%s_%d_%s' % (super(InventoryModule, self).get_cache_key(path), mtime, digest[:16])
+
     def _read_config_data(self, path):
-        '''Read the YAML configuration file'''
+        '''Read the YAML configuration file
+
+        A file encrypted with Ansible Vault or holding vaulted values is read
+        with Ansible's loader, which decrypts it, and config_vaulted is set.
+        Other files are read with the faster libyaml loader if it is
+        available.
+        '''
+        self.config_vaulted = False
         try:
-            with open(path, 'r') as f:
-                self.config_data = yaml.safe_load(f)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if self.loader is not None and (is_encrypted(data) or b'!vault' in data):
+                self.config_vaulted = True
+                # The loader's default caching keeps the file in memory for
+                # this process only. The cache modes such as 'vaulted' are
+                # not known to older Ansible, which treats them as true.
+                self.config_data = self.loader.load_from_file(path)
+            else:
+                self.config_data = yaml.load(data, Loader=YAML_SAFE_LOADER)
             if not isinstance(self.config_data, dict):
                 raise AnsibleParserError('Invalid YAML configuration: Expected a dictionary but got %s' % type(self.config_data))
         except Exception as e:
             raise AnsibleParserError('Error reading YAML configuration file: %s' % e)
 
     def _validate_config_data(self):
-        '''Validate that all required configuration variables are present'''
-        cluster_type = self.config_data.get('ora_cluster_type')
-
-        if cluster_type == 'RAC':
-            if 'cluster_config_json' not in self.config_data:
-                raise AnsibleParserError("Missing required variable 'cluster_config_json' for RAC installation.")
-            cluster_config = self.config_data['cluster_config_json']
-            if not isinstance(cluster_config, list) or not cluster_config:
-                raise AnsibleParserError("'cluster_config_json' must be a non-empty list for RAC installation.")
-            for i, cluster in enumerate(cluster_config):
-                if 'nodes' not in cluster or not isinstance(cluster['nodes'], list) or not cluster['nodes']:
-                    raise AnsibleParserError("Each cluster in 'cluster_config_json' must have a non-empty 'nodes' list. Check cluster #%d." % (i+1))
-                for j, node in enumerate(cluster['nodes']):
-                    if 'node_name' not in node:
-                        raise AnsibleParserError("Missing 'node_name' for node #%d in cluster #%d." % (j+1, i+1))
-                    if 'host_ip' not in node:
-                        raise AnsibleParserError("Missing 'host_ip' for node #%d in cluster #%d." % (j+1, i+1))
-
-        elif cluster_type == 'DG':
-            required_vars = ['instance_hostname', 'instance_ip_addr', 'primary_ip_addr']
-            for var in required_vars:
-                if var not in self.config_data:
-                    raise AnsibleParserError("Missing required variable '%s' for Data Guard installation." % var)
-        else: # Single Instance
-            required_vars = ['instance_hostname', 'instance_ip_addr']
-            for var in required_vars:
-                if var not in self.config_data:
-                    raise AnsibleParserError("Missing required variable '%s' for Single Instance installation." % var)
+        '''Validate the configuration against the schema of its cluster type
+
+        All errors are collected and reported together.
+        '''
+        schema = self.config_data.get('ora_cluster_type')
+        if schema == 'DG' and 'standbys' in self.config_data:
+            schema = 'DG_STANDBYS'
+        validate = _CONFIG_VALIDATORS.get(schema, _CONFIG_VALIDATORS['NONE'])
+        errors = []
+        validate(self.config_data, '', errors)
+        errors.extend(_check_combinations(self.config_data))
+        if errors:
+            raise AnsibleParserError('Invalid configuration:\n%s' % '\n'.join('  - %s' % e for e in errors))
 
     def _populate_inventory(self):
         '''Populate the inventory based on the user-provided cluster-type'''
@@ -88,80 +668,141 @@ class InventoryModule(BaseInventoryPlugin):
         else:
             self._populate_si_inventory()
 
+    def _add_group(self, name):
+        '''Add a group of the current deployment and return its name
+
+        In a fleet inventory the groups of a deployment are namespaced, e.g.
+        db1_dbasm, and are children of both the shared group, so that playbooks
+        targeting dbasm still work, and of the deployment group db1.
+        '''
+        if not self.deployment:
+            self.inventory.add_group(name)
+            return name
+        group = '%s_%s' % (self.deployment, name)
+        for parent in (name, self.deployment):
+            self.inventory.add_group(parent)
+            self.inventory.add_group(group)
+            self.inventory.add_child(parent, group)
+        return group
+
+    def _add_host(self, hostname, group):
+        '''Add a host to a group, recording collisions between deployments'''
+        owner = self._host_owners.setdefault(hostname, self.deployment)
+        if owner != self.deployment:
+            self._host_collisions.append("host '%s' is defined by deployments '%s' and '%s'" % (hostname, owner, self.deployment))
+        self.inventory.add_host(hostname, group=group)
+        return self.inventory.get_host(hostname)
+
     def _populate_si_inventory(self):
         '''Populate a single instance inventory'''
-        self.inventory.add_group(DEFAULT_HOSTGROUP_NAME)
+        group = self._add_group(DEFAULT_HOSTGROUP_NAME)
         hostname = self.config_data.get('instance_hostname')
         ssh_host = self.config_data.get('instance_ip_addr')
-        self.inventory.add_host(hostname, group=DEFAULT_HOSTGROUP_NAME)
-        host = self.inventory.get_host(hostname)
+        host = self._add_host(hostname, group)
         host.set_variable('ansible_ssh_host', ssh_host)
-        self._set_common_variables(hostname)
+        self._set_shared_variables(group, [host], self.config_data)
 
     def _populate_dg_inventory(self):
-        '''Populate a Data Guard inventory'''
-        # Standby host (uses instance_hostname and instance_ip_addr from gcp_oracle.yml)
-        self.inventory.add_group(DEFAULT_HOSTGROUP_NAME)
-        standby_hostname = self.config_data.get('instance_hostname')
-        standby_ssh_host = self.config_data.get('instance_ip_addr')
-        self.inventory.add_host(standby_hostname, group=DEFAULT_HOSTGROUP_NAME)
-        standby_host = self.inventory.get_host(standby_hostname)
-        standby_host.set_variable('ansible_ssh_host', standby_ssh_host)
-        standby_host.set_variable('is_standby_node', True)
-        self._set_common_variables(standby_hostname)
+        '''Populate a Data Guard inventory
+
+        The standbys are the single instance_hostname of the config or the
+        entries of its standbys list. The standbys form the dbasm group, so
+        that they are all set up in parallel.
+        '''
+        standbys = self.config_data.get('standbys')
+        if standbys is None:
+            # Single standby (uses instance_hostname and instance_ip_addr from gcp_oracle.yml)
+            standbys = [{'instance_hostname': self.config_data.get('instance_hostname'),
+                         'instance_ip_addr': self.config_data.get('instance_ip_addr')}]
+            listed = False
+        else:
+            listed = True
+        shared_vars = {k: v for k, v in self.config_data.items() if k != 'standbys'}
+
+        group = self._add_group(DEFAULT_HOSTGROUP_NAME)
+        hosts = []
+        for standby in standbys:
+            host = self._add_host(standby['instance_hostname'], group)
+            hosts.append(host)
+            host.set_variable('ansible_ssh_host', standby['instance_ip_addr'])
+            host.set_variable('is_standby_node', True)
+            if listed:
+                # These override the defaults of the dg-config role for this host.
+                if 'db_unique_name' in standby:
+                    host.set_variable('standby_name', standby['db_unique_name'])
+                if 'redo_transport' in standby:
+                    host.set_variable('log_transport_mode', standby['redo_transport'].upper())
+        # The primary is not in this group, so it does not get these.
+        self._set_shared_variables(group, hosts, shared_vars)
 
         # Primary host (hardcoded as 'primary1', uses primary_ip_addr from gcp_oracle.yml)
-        self.inventory.add_group('primary')
+        primary_group = self._add_group('primary')
         primary_ssh_host = self.config_data.get('primary_ip_addr')
-        self.inventory.add_host('primary1', group='primary')
-        primary_host = self.inventory.get_host('primary1')
+        primary_host = self._add_host(PRIMARY_HOSTNAME, primary_group)
         primary_host.set_variable('ansible_ssh_host', primary_ssh_host)
         primary_host.set_variable('is_primary_node', True)
 
-        # Explicitly set connection vars for both hosts
+        # Explicitly set connection vars for all hosts
         ssh_user = self.config_data.get('_instance_ssh_user')
         ssh_key = self.config_data.get('_instance_ssh_key')
-        if ssh_user:
-            standby_host.set_variable('ansible_ssh_user', ssh_user)
-            primary_host.set_variable('ansible_ssh_user', ssh_user)
-        if ssh_key:
-            standby_host.set_variable('ansible_ssh_private_key_file', ssh_key)
-            primary_host.set_variable('ansible_ssh_private_key_file', ssh_key)
+        for host in [primary_host] + hosts:
+            if ssh_user:
+                host.set_variable('ansible_ssh_user', ssh_user)
+            if ssh_key:
+                host.set_variable('ansible_ssh_private_key_file', ssh_key)
 
 
     def _populate_rac_inventory(self):
-        '''Populate a RAC inventory'''
-        self.inventory.add_group(DEFAULT_HOSTGROUP_NAME)
+        '''Populate a RAC inventory
+
+        Each cluster of cluster_config_json gets a child group of dbasm named
+        after it, e.g. dbasm_cluster1, with its nodes and its cluster-wide
+        parameters, so that several clusters can be provisioned in one run.
+        '''
+        group = self._add_group(DEFAULT_HOSTGROUP_NAME)
         cluster_config = self.config_data.get('cluster_config_json', [])
 
-        # Remove the large cluster_config_json from each host
+        # Remove the large cluster_config_json from the shared variables
         common_vars = {k: v for k, v in self.config_data.items() if k != 'cluster_config_json'}
 
-        for cluster in cluster_config:
+        hosts = []
+        for i, cluster in enumerate(cluster_config):
+            cluster_group = '%s_%s' % (group, _cluster_group_suffix(i, cluster))
+            self.inventory.add_group(cluster_group)
+            self.inventory.groups[group].add_child_group(self.inventory.groups[cluster_group])
             for node in cluster.get('nodes', []):
                 hostname = node.get('node_name')
                 ssh_host = node.get('host_ip')
-                self.inventory.add_host(hostname, group=DEFAULT_HOSTGROUP_NAME)
-                host = self.inventory.get_host(hostname)
+                host = self._add_host(hostname, cluster_group)
+                hosts.append(host)
 
                 # Set node-specific vars from the cluster config
                 host.set_variable('ansible_ssh_host', ssh_host)
                 host.set_variable('vip_name', node.get('vip_name'))
                 host.set_variable('vip_ip', node.get('vip_ip'))
 
-                # Set common vars from the top-level config
-                for key, value in common_vars.items():
-                    host.set_variable(key, value)
-
-            # Set cluster-wide parameters as group variables for the 'dbasm' group
+            # Set cluster-wide parameters as group variables of the cluster's group.
+            # The roles find the nodes of a host's cluster through rac_cluster_group.
+            cluster_vars = self.inventory.groups[cluster_group]
             for key, value in cluster.items():
                 if key != 'nodes':
-                    self.inventory.groups[DEFAULT_HOSTGROUP_NAME].set_variable(key, value)
-
-    def _set_common_variables(self, hostname):
-        '''Set common variables for a host'''
-        host = self.inventory.get_host(hostname)
-        if host:
-            # Set all config values as host variables
-            for key, value in self.config_data.items():
-                host.set_variable(key, value)
+                    cluster_vars.set_variable(key, value)
+            cluster_vars.set_variable('rac_cluster_group', cluster_group)
+
+        self._set_shared_variables(group, hosts, common_vars)
+
+    def _set_shared_variables(self, group, hosts, variables):
+        '''Set variables shared by all hosts of a deployment once on its group
+
+        Variables that the toolkit's group_vars/all.yml also defines, such as
+        enable_tls, are set on each host instead: group_vars/all.yml takes
+        precedence over inventory group variables, but not over inventory
+        host variables.
+        '''
+        inventory_group = self.inventory.groups[group]
+        for key, value in variables.items():
+            if key in TOOLKIT_GROUP_VARS:
+                for host in hosts:
+                    host.set_variable(key, value)
+            else:
+                inventory_group.set_variable(key, value)
@@ -1,17 +1,34 @@
 import unittest
+import copy
 from unittest.mock import patch
 import os
 import json
+import yaml
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
 
-from gcp_oracle_inventory import InventoryModule
 from ansible.errors import AnsibleParserError
+from ansible.inventory.data import InventoryData
+from ansible.inventory.helpers import get_group_vars
 from ansible.inventory.manager import InventoryManager
 from ansible.parsing.dataloader import DataLoader
+from ansible.parsing.vault import VaultLib, VaultSecret
+from ansible.plugins.loader import inventory_loader
+from ansible.utils.vars import combine_vars
+
+# Load the plugin the way Ansible does, so that its options are registered.
+inventory_loader.add_directory(os.path.dirname(os.path.abspath(__file__)))
 
 class TestGcpOracleInventory(unittest.TestCase):
 
     def setUp(self):
-        self.inventory_module = InventoryModule()
+        self.inventory_module = inventory_loader.get('gcp_oracle_inventory')
         self.loader = DataLoader()
         self.testdata_path = os.path.join(os.path.dirname(__file__), 'testdata')
         self.maxDiff = None
@@ -56,6 +73,35 @@ class TestGcpOracleInventory(unittest.TestCase):
 
         return result
 
+    def _get_effective_vars(self, inventory):
+        """
+        Returns the variables of each host after merging the variables of its
+        groups and its own variables, as Ansible does.
+        """
+        result = {}
+        for host_name, host in inventory.hosts.items():
+            host_vars = combine_vars(get_group_vars(host.get_groups()), host.get_vars())
+            host_vars.pop('inventory_file', None)
+            host_vars.pop('inventory_dir', None)
+            result[host_name] = host_vars
+        return result
+
+    def _run_effective_vars_test_case(self, config_name):
+        """
+        Compares the effective host variables to a snapshot recorded when all
+        configuration values were still set on every host.
+        """
+        inventory = InventoryManager(loader=self.loader, sources=[])
+        self.inventory_module.inventory = inventory
+        config_file = os.path.join(self.testdata_path, 'inputs', f'{config_name}.yml')
+        expected_json_file = os.path.join(self.testdata_path, 'snapshots', f'{config_name}.effective.json')
+
+        self.inventory_module.parse(inventory, self.loader, config_file)
+
+        with open(expected_json_file, 'r') as f:
+            expected_vars = json.load(f)
+        self.assertDictEqual(self._get_effective_vars(inventory), expected_vars)
+
     def _run_test_case(self, config_name):
         """
         Runs a test case by parsing an inventory config and comparing
@@ -99,6 +145,95 @@ class TestGcpOracleInventory(unittest.TestCase):
     def test_rac_inventory(self):
         self._run_test_case('rac')
 
+    def test_rac_multi_cluster_inventory(self):
+        self._run_test_case('rac_multi_cluster')
+
+    def test_rac_clusters_get_their_own_groups(self):
+        inventory = InventoryManager(loader=self.loader, sources=[])
+        self.inventory_module.inventory = inventory
+        self.inventory_module.parse(inventory, self.loader, os.path.join(self.testdata_path, 'inputs', 'rac_multi_cluster.yml'))
+
+        effective_vars = self._get_effective_vars(inventory)
+        for cluster in ('east', 'west'):
+            nodes = ['rac-%s-node1' % cluster, 'rac-%s-node2' % cluster]
+            for node in nodes:
+                self.assertEqual(effective_vars[node]['cluster_name'], 'rac-%s' % cluster)
+                group = effective_vars[node]['rac_cluster_group']
+                self.assertEqual([h.name for h in inventory.groups[group].get_hosts()], nodes)
+        self.assertEqual(len(inventory.groups['dbasm'].get_hosts()), 4)
+
+    def test_data_guard_multi_standby_inventory(self):
+        self._run_test_case('data_guard_multi_standby')
+
+    def test_far_sync_and_cascaded_redo_are_rejected(self):
+        """
+        dg-config only sets up physical standbys that receive redo from the
+        primary, so other topologies must not pass as plain standbys.
+        """
+        with self.assertRaises(AnsibleParserError) as cm:
+            self.inventory_module._read_config_data(os.path.join(self.testdata_path, 'inputs', 'data_guard_cascaded.yml'))
+            self.inventory_module._validate_config_data()
+        message = str(cm.exception)
+        self.assertIn("Invalid value for 'standbys[0].role': 'far_sync' is not supported, only physical_standby.", message)
+        self.assertIn("Invalid value for 'standbys[1].redo_source': 'far-sync-1' is not supported, standbys receive redo from primary1.", message)
+        self.assertIn("Invalid value for 'standbys[2].redo_source': 'standby-1' is not supported", message)
+
+    def test_single_instance_effective_vars(self):
+        self._run_effective_vars_test_case('single_instance')
+
+    def test_data_guard_primary_effective_vars(self):
+        self._run_effective_vars_test_case('data_guard_primary')
+
+    def test_data_guard_standby_effective_vars(self):
+        self._run_effective_vars_test_case('data_guard_standby')
+
+    def test_rac_effective_vars(self):
+        self._run_effective_vars_test_case('rac')
+
+    def test_shared_config_is_stored_once_on_group(self):
+        inventory = InventoryManager(loader=self.loader, sources=[])
+        self.inventory_module.inventory = inventory
+        config_file = os.path.join(self.testdata_path, 'inputs', 'rac.yml')
+
+        self.inventory_module.parse(inventory, self.loader, config_file)
+
+        self.assertEqual(inventory.groups['dbasm'].get_vars()['ora_swlib_bucket'], 'gs://my-swlib-bucket')
+        for host in inventory.hosts.values():
+            self.assertNotIn('ora_swlib_bucket', host.get_vars())
+
+    def test_variables_of_toolkit_group_vars_stay_host_variables(self):
+        """
+        Variables that group_vars/all.yml also defines must keep overriding it,
+        which only inventory host variables do.
+        """
+        inventory = InventoryManager(loader=self.loader, sources=[])
+        self.inventory_module.inventory = inventory
+        self.inventory_module.deployment = None
+        self.inventory_module._host_owners = {}
+        self.inventory_module._host_collisions = []
+        self.inventory_module.config_data = {
+            'ora_cluster_type': 'NONE', 'instance_hostname': 'tls-host', 'instance_ip_addr': '10.0.0.5',
+            'enable_tls': True, 'ora_version': '19',
+        }
+
+        self.inventory_module._populate_inventory()
+
+        host = inventory.get_host('tls-host')
+        self.assertTrue(host.get_vars()['enable_tls'])
+        self.assertNotIn('enable_tls', inventory.groups['dbasm'].get_vars())
+        self.assertEqual(inventory.groups['dbasm'].get_vars()['ora_version'], '19')
+
+    def test_toolkit_group_vars_match_group_vars_all(self):
+        """
+        The plugin lists the variables and the version map of group_vars/all.yml
+        instead of reading the file, so the lists must follow changes to it.
+        """
+        plugin_module = sys.modules[type(self.inventory_module).__module__]
+        with open(os.path.join(os.path.dirname(__file__), '..', 'group_vars', 'all.yml')) as f:
+            group_vars = yaml.safe_load(f)
+        self.assertEqual(plugin_module.TOOLKIT_GROUP_VARS, set(group_vars))
+        self.assertEqual(plugin_module.VERSION_MAP, {str(k): v for k, v in group_vars['version_map'].items()})
+
     def test_data_guard_inventory_variable_separation(self):
         """
         Tests that for a Data Guard setup, the primary host does not get
@@ -117,8 +252,9 @@ class TestGcpOracleInventory(unittest.TestCase):
         self.assertIsNotNone(primary_host, "Primary host 'primary1' should exist")
         self.assertIsNotNone(standby_host, "Standby host 'standby-1' should exist")
 
-        primary_vars = primary_host.get_vars()
-        standby_vars = standby_host.get_vars()
+        effective_vars = self._get_effective_vars(inventory)
+        primary_vars = effective_vars['primary1']
+        standby_vars = effective_vars['standby-1']
 
         # 1. Verify Primary Host
         # It should have its own SSH host IP
@@ -174,3 +310,632 @@ class TestGcpOracleInventory(unittest.TestCase):
         with self.assertRaises(AnsibleParserError) as cm:
             self.inventory_module._validate_config_data()
         self.assertIn("Missing required variable 'cluster_config_json'", str(cm.exception))
+
+    def test_all_errors_are_reported_with_their_paths(self):
+        config = _rac_config('db1')
+        config['ora_listener_port'] = 80
+        config['ora_disk_mgmt'] = 'FS'
+        config['cluster_config_json'][0]['nodes'][1]['host_ip'] = '10.2.0.300'
+        config['cluster_config_json'][0]['nodes'][1]['node_name'] = 'db1-node1'
+        del config['cluster_config_json'][0]['nodes'][0]['host_ip']
+        self.inventory_module.config_data = config
+        with self.assertRaises(AnsibleParserError) as cm:
+            self.inventory_module._validate_config_data()
+        message = str(cm.exception)
+        self.assertIn("Invalid value for 'ora_listener_port': 80 must be between 1024 and 65535.", message)
+        self.assertIn("Invalid value for 'cluster_config_json[0].nodes[1].host_ip': '10.2.0.300' is not an IP address.", message)
+        self.assertIn("Missing required variable 'cluster_config_json[0].nodes[0].host_ip' for RAC installation.", message)
+        self.assertIn("Duplicate value for 'cluster_config_json[0].nodes[1].node_name': 'db1-node1' is also used by 'cluster_config_json[0].nodes[0].node_name'.", message)
+        self.assertIn("RAC deployments require shared storage", message)
+
+    def test_configs_without_installation_values_are_accepted(self):
+        """
+        The inventory is parsed for every playbook, e.g. by cleanup-oracle.sh,
+        whose config has no ora_swlib_bucket. RAC clusters only need their nodes.
+        """
+        cleanup = {'ora_cluster_type': 'NONE', 'instance_hostname': 'db1-host', 'instance_ip_addr': '10.1.0.1',
+                   'ora_edition': 'EE', 'ora_version': '19'}
+        rac = {'ora_cluster_type': 'RAC', 'cluster_config_json': [
+            {'nodes': [{'node_name': 'db1-node1', 'host_ip': '10.2.0.1'}]},
+            {'nodes': [{'node_name': 'db2-node1', 'host_ip': '10.2.1.1'}]},
+        ]}
+        for config in (cleanup, rac):
+            inventory = InventoryManager(loader=self.loader, sources=[])
+            self.inventory_module.inventory = inventory
+            self.inventory_module.deployment = None
+            self.inventory_module._host_owners = {}
+            self.inventory_module._host_collisions = []
+            self.inventory_module.config_data = config
+            self.inventory_module._validate_config_data()
+            self.inventory_module._populate_inventory()
+        self.assertEqual(inventory.groups['dbasm_cluster2'].get_vars()['rac_cluster_group'], 'dbasm_cluster2')
+        self.assertEqual([h.name for h in inventory.groups['dbasm_cluster1'].get_hosts()], ['db1-node1'])
+
+    def test_addresses_and_names_conflicting_across_clusters_raise_error(self):
+        config = _rac_config('db1')
+        other = copy.deepcopy(config['cluster_config_json'][0])
+        other['nodes'][0]['node_name'] = 'db1-node1-vip'
+        other['nodes'][1].update(node_name='db2-node2', vip_name='db2-node2-vip', host_ip='10.2.0.9')
+        other['scan_name'] = 'db2-scan'
+        other['scan_ip1'] = '10.3.0.2'
+        config['cluster_config_json'].append(other)
+        self.inventory_module.config_data = config
+        with self.assertRaises(AnsibleParserError) as cm:
+            self.inventory_module._validate_config_data()
+        message = str(cm.exception)
+        self.assertIn("Duplicate value for 'cluster_config_json[1].nodes[0].node_name': 'db1-node1-vip' is also used by 'cluster_config_json[0].nodes[0].vip_name'.", message)
+        self.assertIn("Duplicate value for 'cluster_config_json[0].nodes[1].vip_ip': '10.3.0.2' is also used by 'cluster_config_json[1].scan_ip1'.", message)
+        self.assertIn("Duplicate value for 'cluster_config_json[1].nodes[1].vip_ip': '10.3.0.2' is also used by 'cluster_config_json[1].scan_ip1'.", message)
+        self.assertIn("Duplicate value for 'cluster_config_json[1].scan_ip2': '10.4.0.2' is also used by 'cluster_config_json[0].scan_ip2'.", message)
+        self.assertIn("Duplicate value for 'cluster_config_json[1].cluster_name': 'db1_cluster' is also used by 'cluster_config_json[0].cluster_name'.", message)
+        self.assertNotIn("'cluster_config_json[1].nodes[1].host_ip'", message)
+
+    def test_invalid_values_and_combinations_raise_error(self):
+        self.inventory_module.config_data = dict(_si_config('db1'), ora_edition='FREE', ora_cluster_type='DG',
+                                                 instance_hostname='bad_host', primary_ip_addr='10.9.9.9',
+                                                 ora_db_container=False, ora_version=23, ora_swlib_type='S3')
+        with self.assertRaises(AnsibleParserError) as cm:
+            self.inventory_module._validate_config_data()
+        message = str(cm.exception)
+        self.assertIn("Invalid value for 'instance_hostname': 'bad_host' is not a host name.", message)
+        self.assertIn("Invalid value for 'ora_swlib_type': 'S3' must be one of: gcs, gcsfuse, nfs, gcsdirect, gcstransfer.", message)
+        self.assertIn("Oracle Free Edition ('FREE') only supports Single-Instance deployments.", message)
+        self.assertIn('Data Guard deployments require Enterprise Edition.', message)
+        self.assertIn("'ora_db_container' must be true.", message)
+
+    def test_valid_configs_pass_validation(self):
+        for name in ('single_instance', 'data_guard_primary', 'data_guard_standby', 'rac'):
+            self.inventory_module._read_config_data(os.path.join(self.testdata_path, 'inputs', f'{name}.yml'))
+            self.inventory_module._validate_config_data()
+        self.inventory_module.config_data = dict(_si_config('db1'), ora_version=19, ora_listener_port='1522',
+                                                 ora_disk_mgmt='FS', compatible_rdbms='19.0.0')
+        self.inventory_module._validate_config_data()
+
+    def test_invalid_standbys_raise_error(self):
+        self.inventory_module.config_data = {
+            'ora_cluster_type': 'DG', 'primary_ip_addr': '10.0.0.1', 'ora_swlib_bucket': 'gs://my-swlib-bucket',
+            'standbys': [
+                {'instance_hostname': 'standby-1', 'instance_ip_addr': '10.0.0.2', 'db_unique_name': 'ORCL_S1',
+                 'redo_source': 'primary1'},
+                {'instance_hostname': 'standby-2', 'instance_ip_addr': '10.0.0.2', 'redo_transport': 'BULK'},
+                {'instance_hostname': 'primary1', 'instance_ip_addr': '10.0.0.1', 'db_unique_name': 'ORCL_S1'},
+            ],
+        }
+        with self.assertRaises(AnsibleParserError) as cm:
+            self.inventory_module._validate_config_data()
+        message = str(cm.exception)
+        self.assertIn("Invalid value for 'standbys[1].redo_transport': 'BULK' must be one of: SYNC, ASYNC, FASTSYNC.", message)
+        self.assertIn("Duplicate value for 'standbys[1].instance_ip_addr': '10.0.0.2' is also used by 'standbys[0].instance_ip_addr'.", message)
+        self.assertIn("Duplicate value for 'standbys[2].db_unique_name': 'ORCL_S1' is also used by 'standbys[0].db_unique_name'.", message)
+        self.assertIn("Missing required variable 'standbys[1].db_unique_name'", message)
+        self.assertIn("'standbys[2].instance_hostname': 'primary1' is the name of the primary host.", message)
+        self.assertIn("'standbys[2].instance_ip_addr' and 'primary_ip_addr' cannot be the same.", message)
+        self.assertNotIn('standbys[0].redo_source', message)
+
+    def test_vault_encrypted_config_is_decrypted(self):
+        secrets = [('default', VaultSecret(b'secret'))]
+        self.loader.set_vault_secrets(secrets)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        config_file = os.path.join(tmpdir, 'gcp_oracle.yml')
+        with open(os.path.join(self.testdata_path, 'inputs', 'single_instance.yml'), 'rb') as f:
+            encrypted = VaultLib(secrets).encrypt(f.read())
+        with open(config_file, 'wb') as f:
+            f.write(encrypted)
+        inventory = InventoryManager(loader=self.loader, sources=[])
+
+        self.inventory_module.parse(inventory, self.loader, config_file)
+
+        host_vars = self._get_effective_vars(inventory)['oracle-si-host']
+        self.assertEqual(host_vars['ora_swlib_bucket'], 'gs://my-swlib-bucket')
+
+
+class TestGcpOracleInventoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = DataLoader()
+        self.testdata_path = os.path.join(os.path.dirname(__file__), 'testdata')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.config_file = os.path.join(self.tmpdir, 'gcp_oracle.yml')
+        shutil.copy(os.path.join(self.testdata_path, 'inputs', 'single_instance.yml'), self.config_file)
+        env = patch.dict(os.environ, {
+            'ANSIBLE_INVENTORY_CACHE': 'True',
+            'ANSIBLE_INVENTORY_CACHE_PLUGIN': 'jsonfile',
+            'ANSIBLE_INVENTORY_CACHE_CONNECTION': os.path.join(self.tmpdir, 'cache'),
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _parse(self, cache=True):
+        """
+        Parses the config file with a new plugin instance, like a separate
+        ansible-playbook run, and returns the plugin and the inventory.
+        """
+        plugin = inventory_loader.get('gcp_oracle_inventory')
+        inventory = InventoryManager(loader=self.loader, sources=[])
+        with patch.object(plugin, '_read_config_data', wraps=plugin._read_config_data) as read, \
+                patch.object(plugin, '_validate_config_data', wraps=plugin._validate_config_data) as validate:
+            plugin.parse(inventory, self.loader, self.config_file, cache=cache)
+        # InventoryManager writes the cache after every parse.
+        if plugin.get_option('cache'):
+            plugin.update_cache_if_changed()
+        return inventory, read.called or validate.called
+
+    def test_warm_run_skips_parsing_and_validation(self):
+        cold_inventory, parsed = self._parse()
+        self.assertTrue(parsed)
+
+        warm_inventory, parsed = self._parse()
+        self.assertFalse(parsed)
+        self.assertEqual(warm_inventory.get_host('oracle-si-host').get_vars(),
+                         cold_inventory.get_host('oracle-si-host').get_vars())
+
+    def test_changed_file_invalidates_cache(self):
+        self._parse()
+        with open(self.config_file, 'a') as f:
+            f.write('db_name: NEWDB\n')
+
+        inventory, parsed = self._parse()
+        self.assertTrue(parsed)
+        self.assertEqual(inventory.get_host('oracle-si-host').get_vars()['db_name'], 'NEWDB')
+
+        inventory, parsed = self._parse()
+        self.assertFalse(parsed)
+        self.assertEqual(inventory.get_host('oracle-si-host').get_vars()['db_name'], 'NEWDB')
+
+    def test_flush_cache_refreshes_entry(self):
+        self._parse()
+
+        _, parsed = self._parse(cache=False)
+        self.assertTrue(parsed)
+
+    def test_vaulted_config_is_not_cached(self):
+        """
+        The cache would hold the decrypted config, so a jsonfile cache would
+        write the secrets of a vaulted file to disk in plaintext.
+        """
+        secrets = [('default', VaultSecret(b'secret'))]
+        self.loader.set_vault_secrets(secrets)
+        with open(self.config_file, 'rb') as f:
+            encrypted = VaultLib(secrets).encrypt(f.read())
+        with open(self.config_file, 'wb') as f:
+            f.write(encrypted)
+
+        inventory, parsed = self._parse()
+        self.assertTrue(parsed)
+        self.assertEqual(inventory.get_host('oracle-si-host').get_vars()['ansible_ssh_host'], '10.0.0.1')
+        _, parsed = self._parse()
+        self.assertTrue(parsed)
+        for root, _, files in os.walk(os.path.join(self.tmpdir, 'cache')):
+            for name in files:
+                with open(os.path.join(root, name)) as f:
+                    self.assertNotIn('my-swlib-bucket', f.read())
+
+    def test_cache_is_disabled_by_default(self):
+        with patch.dict(os.environ, {'ANSIBLE_INVENTORY_CACHE': 'False'}):
+            self._parse()
+            _, parsed = self._parse()
+        self.assertTrue(parsed)
+
+
+def _si_config(name):
+    return {
+        'ora_cluster_type': 'NONE',
+        'instance_hostname': '%s-host' % name,
+        'instance_ip_addr': '10.1.%d.%d' % (zlib.crc32(name.encode()) % 250, len(name)),
+        'ora_swlib_bucket': 'gs://my-swlib-bucket',
+        'db_name': name.upper()[:8],
+    }
+
+
+def _rac_config(name, nodes=2):
+    return {
+        'ora_cluster_type': 'RAC',
+        'ora_swlib_bucket': 'gs://my-swlib-bucket',
+        'db_name': name.upper()[:8],
+        'cluster_config_json': [{
+            'scan_name': '%s-scan' % name,
+            'scan_port': 1521,
+            'cluster_name': '%s-cluster' % name,
+            'cluster_domain': 'home',
+            'public_net': 'eth1',
+            'private_net': 'vxlan0',
+            'scan_ip1': '10.4.0.1',
+            'scan_ip2': '10.4.0.2',
+            'scan_ip3': '10.4.0.3',
+            'dg_name': 'DATA',
+            'nodes': [
+                {'node_name': '%s-node%d' % (name, i), 'host_ip': '10.2.0.%d' % i,
+                 'vip_name': '%s-node%d-vip' % (name, i), 'vip_ip': '10.3.0.%d' % i}
+                for i in range(1, nodes + 1)
+            ],
+        }],
+    }
+
+
+def _write_config(path, config):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f)
+
+
+def _write_fleet(directory, count):
+    """
+    Writes count deployments as directory/db<N>/gcp_oracle.yml, alternating
+    between Single Instance and RAC configurations.
+    """
+    for i in range(count):
+        name = 'db%d' % i
+        config = _si_config(name) if i % 2 else _rac_config(name)
+        _write_config(os.path.join(directory, name, 'gcp_oracle.yml'), config)
+
+
+# Synthetic configurations of increasing scale: (name, cluster type, hosts per
+# cluster or standbys, clusters, additional shared variables).
+SCALE_SCENARIOS = [
+    ('si-vars100', 'NONE', 1, 1, 100),
+    ('si-vars1000', 'NONE', 1, 1, 1000),
+    ('dg-standbys4', 'DG', 4, 1, 100),
+    ('dg-standbys16', 'DG', 16, 1, 100),
+    ('rac-1x4', 'RAC', 4, 1, 100),
+    ('rac-1x32', 'RAC', 32, 1, 100),
+    ('rac-8x16', 'RAC', 16, 8, 100),
+    ('rac-8x16-vars1000', 'RAC', 16, 8, 1000),
+]
+
+
+def _scaled_config(cluster_type, hosts, clusters, variables):
+    """
+    Returns a valid configuration of the cluster type with the given number of
+    hosts per cluster (standbys for Data Guard), clusters and additional
+    shared variables.
+    """
+    if cluster_type == 'NONE':
+        config = _si_config('scale')
+    elif cluster_type == 'DG':
+        config = {
+            'ora_cluster_type': 'DG', 'primary_ip_addr': '10.0.0.1', 'ora_swlib_bucket': 'gs://my-swlib-bucket',
+            'db_name': 'SCALE',
+            'standbys': [{'instance_hostname': 'standby-%d' % i, 'instance_ip_addr': '10.1.0.%d' % i,
+                          'db_unique_name': 'SCALE_S%d' % i} for i in range(1, hosts + 1)],
+        }
+    else:
+        config = _rac_config('scale', nodes=hosts)
+        config['cluster_config_json'] = [dict(
+            config['cluster_config_json'][0],
+            scan_name='scale-scan%d' % c, cluster_name='scale-cluster%d' % c,
+            scan_ip1='10.4.%d.1' % c, scan_ip2='10.4.%d.2' % c, scan_ip3='10.4.%d.3' % c,
+            nodes=[{'node_name': 'scale-c%d-node%d' % (c, i), 'host_ip': '10.2.%d.%d' % (c, i),
+                    'vip_name': 'scale-c%d-node%d-vip' % (c, i), 'vip_ip': '10.3.%d.%d' % (c, i)}
+                   for i in range(1, hosts + 1)],
+        ) for c in range(clusters)]
+    config.update({'setting_%d' % n: 'value-%d' % n for n in range(variables)})
+    return config
+
+
+class TestGcpOracleFleetInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = DataLoader()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write_fleet_file(self, config_file, **options):
+        path = os.path.join(self.tmpdir, 'prod.gcp_oracle_fleet.yml')
+        _write_config(path, dict(plugin='gcp_oracle_inventory', config_file=config_file, **options))
+        return path
+
+    def _parse(self, path):
+        plugin = inventory_loader.get('gcp_oracle_inventory')
+        self.assertTrue(plugin.verify_file(path))
+        inventory = InventoryData()
+        plugin.parse(inventory, self.loader, path)
+        return inventory
+
+    def _hostvars(self, inventory):
+        return {name: host.get_vars() for name, host in inventory.hosts.items()}
+
+    def test_fleet_file_loads_directory_into_namespaced_groups(self):
+        testdata = os.path.join(os.path.dirname(__file__), 'testdata', 'inputs')
+        shutil.copy(os.path.join(testdata, 'single_instance.yml'), os.path.join(self.tmpdir, 'gcp_oracle.yml.si1'))
+        shutil.copy(os.path.join(testdata, 'rac.yml'), os.path.join(self.tmpdir, 'gcp_oracle.yml.rac1'))
+        shutil.copy(os.path.join(testdata, 'data_guard_standby.yml'), os.path.join(self.tmpdir, 'gcp_oracle.yml.dg1'))
+
+        inventory = self._parse(self._write_fleet_file(['.']))
+
+        groups = inventory.groups
+        self.assertEqual(sorted(g.name for g in groups['dbasm'].child_groups), ['dg1_dbasm', 'rac1_dbasm', 'si1_dbasm'])
+        self.assertEqual([g.name for g in groups['primary'].child_groups], ['dg1_primary'])
+        self.assertEqual(sorted(g.name for g in groups['dg1'].child_groups), ['dg1_dbasm', 'dg1_primary'])
+        self.assertEqual(sorted(h.name for h in groups['dbasm'].get_hosts()),
+                         ['oracle-si-host', 'rac-node1', 'rac-node2', 'standby-1'])
+        self.assertEqual([h.name for h in groups['rac1'].get_hosts()], ['rac-node1', 'rac-node2'])
+        # Cluster-wide variables stay within the deployment.
+        cluster_group = groups['rac1_dbasm'].child_groups[0]
+        self.assertEqual(cluster_group.name, 'rac1_dbasm_test_rac_cluster')
+        self.assertEqual(cluster_group.get_vars()['scan_name'], 'scan.test-rac.internal')
+        self.assertEqual(groups['dbasm'].get_vars(), {})
+        self.assertTrue(inventory.get_host('standby-1').get_vars()['is_standby_node'])
+
+    def test_glob_source(self):
+        for name in ('alpha', 'beta'):
+            _write_config(os.path.join(self.tmpdir, 'gcp_oracle.yml.%s' % name), _si_config(name))
+
+        inventory = self._parse(os.path.join(self.tmpdir, 'gcp_oracle.yml.*'))
+
+        self.assertEqual([h.name for h in inventory.groups['alpha_dbasm'].get_hosts()], ['alpha-host'])
+        self.assertEqual([h.name for h in inventory.groups['beta'].get_hosts()], ['beta-host'])
+
+    def test_glob_without_matches_is_not_verified(self):
+        plugin = inventory_loader.get('gcp_oracle_inventory')
+        self.assertFalse(plugin.verify_file(os.path.join(self.tmpdir, 'gcp_oracle.yml.*')))
+
+    def test_hostname_collisions_are_reported(self):
+        for name in ('db1', 'db2', 'db3'):
+            config = _si_config(name)
+            config['instance_hostname'] = 'shared-host'
+            _write_config(os.path.join(self.tmpdir, name, 'gcp_oracle.yml'), config)
+
+        with self.assertRaises(AnsibleParserError) as cm:
+            self._parse(self._write_fleet_file([self.tmpdir]))
+        message = str(cm.exception)
+        self.assertIn("host 'shared-host' is defined by deployments 'db1' and 'db2'", message)
+        self.assertIn("host 'shared-host' is defined by deployments 'db1' and 'db3'", message)
+
+    def test_duplicate_deployment_names_are_rejected(self):
+        _write_config(os.path.join(self.tmpdir, 'a', 'db1', 'gcp_oracle.yml'), _si_config('a'))
+        _write_config(os.path.join(self.tmpdir, 'b', 'db1', 'gcp_oracle.yml'), _si_config('b'))
+
+        with self.assertRaises(AnsibleParserError) as cm:
+            self._parse(self._write_fleet_file(['a', 'b']))
+        self.assertIn("both map to deployment 'db1'", str(cm.exception))
+
+    def test_invalid_configs_are_reported_with_their_paths(self):
+        _write_fleet(self.tmpdir, 10)
+        for name in ('db3', 'db7'):
+            _write_config(os.path.join(self.tmpdir, name, 'gcp_oracle.yml'), {'ora_cluster_type': 'NONE'})
+
+        with self.assertRaises(AnsibleParserError) as cm:
+            self._parse(self._write_fleet_file([self.tmpdir], parse_workers=4))
+        message = str(cm.exception)
+        self.assertIn(os.path.join(self.tmpdir, 'db3', 'gcp_oracle.yml'), message)
+        self.assertIn(os.path.join(self.tmpdir, 'db7', 'gcp_oracle.yml'), message)
+
+    def test_parallel_parse_matches_sequential_parse(self):
+        _write_fleet(self.tmpdir, 40)
+
+        sequential = self._parse(self._write_fleet_file([self.tmpdir], parse_workers=1))
+        parallel = self._parse(self._write_fleet_file([self.tmpdir], parse_workers=4))
+
+        self.assertEqual(len(parallel.groups['dbasm'].child_groups), 40)
+        self.assertEqual(self._hostvars(parallel), self._hostvars(sequential))
+
+
+class TestGcpOracleInventoryScale(unittest.TestCase):
+    """
+    Checks the structure of the inventories of the SCALE_SCENARIOS configurations,
+    which are too large for snapshot files.
+    """
+
+    def test_scaled_configs_build_expected_inventory(self):
+        loader = DataLoader()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name, cluster_type, hosts, clusters, variables in SCALE_SCENARIOS:
+            with self.subTest(name):
+                config_file = os.path.join(tmpdir, name, 'gcp_oracle.yml')
+                _write_config(config_file, _scaled_config(cluster_type, hosts, clusters, variables))
+                plugin = inventory_loader.get('gcp_oracle_inventory')
+                inventory = InventoryManager(loader=loader, sources=[])
+                plugin.parse(inventory, loader, config_file)
+
+                # Data Guard adds the primary to the standbys.
+                self.assertEqual(len(inventory.hosts), hosts * clusters + (cluster_type == 'DG'))
+                self.assertEqual(len(inventory.groups['dbasm'].get_hosts()), hosts * clusters)
+                if cluster_type == 'RAC':
+                    self.assertEqual(len(inventory.groups['dbasm'].child_groups), clusters)
+                # Shared variables are stored once, whatever the number of hosts.
+                self.assertEqual(inventory.groups['dbasm'].get_vars()['setting_%d' % (variables - 1)],
+                                 'value-%d' % (variables - 1))
+                for host in inventory.hosts.values():
+                    self.assertNotIn('setting_0', host.get_vars())
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkInventoryScale(unittest.TestCase):
+    """
+    Measures the parse time and peak memory of InventoryModule.parse and the
+    time of `ansible-inventory --list` for each of the SCALE_SCENARIOS, and
+    compares them to the baseline in testdata/benchmarks/baseline.json.
+
+    `ansible-inventory --list` mostly measures the start of Ansible, so its
+    median time is compared as list_ratio, relative to the median time of
+    listing a static one-host inventory in the same run. list_ms is only
+    reported.
+
+    A measurement that exceeds its baseline by more than BENCHMARK_THRESHOLD
+    (default 0.3, i.e. 30%), and by more than the noise floor of its metric,
+    fails the benchmark. Parse times depend on the machine,
+    so record a baseline on yours with UPDATE_BENCHMARK_BASELINE=1 before
+    changing the plugin.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s inventory_plugins -k BenchmarkInventoryScale
+    """
+
+    baseline_file = os.path.join(os.path.dirname(__file__), 'testdata', 'benchmarks', 'baseline.json')
+    # Differences below these are measurement noise, whatever the threshold.
+    noise_floor = {'parse_ms': 2, 'peak_kib': 32, 'list_ratio': 0.15}
+    list_runs = 5
+
+    def _list_ms(self, source):
+        """Returns the median time in ms of `ansible-inventory --list` over list_runs runs."""
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        timings = []
+        for _ in range(self.list_runs):
+            start = time.perf_counter()
+            subprocess.run(['ansible-inventory', '-i', source, '--list'], cwd=repo_root,
+                           stdin=subprocess.DEVNULL, capture_output=True, check=True)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def _measure(self, config_file, reference_ms):
+        loader = DataLoader()
+        plugin = inventory_loader.get('gcp_oracle_inventory')
+
+        def parse():
+            plugin.parse(InventoryManager(loader=loader, sources=[]), loader, config_file)
+
+        parse()
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            parse()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            parse()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        list_ms = self._list_ms(config_file)
+        return {'parse_ms': round(min(timings) * 1000, 2), 'peak_kib': peak // 1024,
+                'list_ratio': round(list_ms / reference_ms, 2), 'list_ms': round(list_ms, 1)}
+
+    def test_inventory_scale_benchmark(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        # The cost of starting ansible-inventory on this machine
+        reference_ms = self._list_ms('localhost,')
+        results = {}
+        for name, cluster_type, hosts, clusters, variables in SCALE_SCENARIOS:
+            config_file = os.path.join(tmpdir, name, 'gcp_oracle.yml')
+            _write_config(config_file, _scaled_config(cluster_type, hosts, clusters, variables))
+            results[name] = self._measure(config_file, reference_ms)
+
+        if os.environ.get('UPDATE_BENCHMARK_BASELINE'):
+            os.makedirs(os.path.dirname(self.baseline_file), exist_ok=True)
+            with open(self.baseline_file, 'w') as f:
+                json.dump({name: {key: value for key, value in measurements.items() if key in self.noise_floor}
+                           for name, measurements in results.items()}, f, indent=4)
+                f.write('\n')
+        with open(self.baseline_file, 'r') as f:
+            baseline = json.load(f)
+
+        threshold = float(os.environ.get('BENCHMARK_THRESHOLD', '0.3'))
+        regressions = []
+        print('\nansible-inventory --list of localhost: %.1f ms' % reference_ms)
+        print('%-20s %16s %16s %16s %10s' % ('scenario', 'parse ms', 'peak KiB', 'list ratio', 'list ms'))
+        for name, measurements in results.items():
+            expected = baseline.get(name, {})
+            print('%-20s %16s %16s %16s %10s' % ((name,) + tuple(
+                '%s (%+d%%)' % (measurements[key], (measurements[key] / expected[key] - 1) * 100)
+                if expected.get(key) else measurements[key] for key in ('parse_ms', 'peak_kib', 'list_ratio'))
+                + (measurements['list_ms'],)))
+            regressions.extend('%s %s: %s, baseline %s' % (name, key, measurements[key], expected[key])
+                               for key in self.noise_floor
+                               if expected.get(key) and measurements[key] > expected[key] * (1 + threshold)
+                               and measurements[key] - expected[key] > self.noise_floor[key])
+        self.assertFalse(regressions, 'Regressions of more than %d%%:\n  ' % (threshold * 100) + '\n  '.join(regressions))
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkFleetParse(unittest.TestCase):
+    """
+    Compares the parse time of a fleet of 500 deployments with one and with
+    several parse workers.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s inventory_plugins -k Benchmark
+    """
+
+    def test_fleet_parse_benchmark(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        _write_fleet(os.path.join(tmpdir, 'deployments'), 500)
+        loader = DataLoader()
+        for workers in (1, 4, 0):
+            fleet_file = os.path.join(tmpdir, 'fleet.gcp_oracle_fleet.yml')
+            _write_config(fleet_file, {'plugin': 'gcp_oracle_inventory', 'config_file': ['deployments'],
+                                       'parse_workers': workers})
+            plugin = inventory_loader.get('gcp_oracle_inventory')
+            inventory = InventoryData()
+            start = time.perf_counter()
+            plugin.parse(inventory, loader, fleet_file)
+            elapsed = time.perf_counter() - start
+            print('\n500 deployments, parse_workers=%d (%d CPUs): %.3fs, %d hosts'
+                  % (workers, os.cpu_count(), elapsed, len(inventory.hosts)))
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkYamlLoading(unittest.TestCase):
+    """
+    Compares the time to read a large configuration file, a RAC cluster of 64
+    nodes with 500 ASM disks and 100 data mounts, with the pure Python YAML
+    loader, the libyaml loader the plugin uses and Ansible's loader.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s inventory_plugins -k Benchmark
+    """
+
+    def test_yaml_loading_benchmark(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        config_file = os.path.join(tmpdir, 'gcp_oracle.yml')
+        config = _rac_config('db1', nodes=64)
+        config['ora_asm_disks_json'] = [
+            {'diskgroup': 'DATA', 'disks': [{'name': 'DATA%d' % i, 'blk_device': '/dev/disk/by-id/google-data-%d' % i}]}
+            for i in range(500)
+        ]
+        config['ora_data_mounts_json'] = [
+            {'purpose': 'software', 'blk_device': '/dev/disk/by-id/google-mount-%d' % i, 'name': 'u%02d' % i,
+             'fstype': 'xfs', 'mount_point': '/u%02d' % i, 'mount_opts': 'nofail'}
+            for i in range(100)
+        ]
+        _write_config(config_file, config)
+
+        def read_with_pure_python_loader(path):
+            with open(path, 'r') as f:
+                return yaml.safe_load(f)
+
+        def read_with_ansible_loader(path):
+            return DataLoader().load_from_file(path, cache='none')
+
+        plugin = inventory_loader.get('gcp_oracle_inventory')
+        for label, read in (('yaml.safe_load', read_with_pure_python_loader),
+                            ('plugin (libyaml: %s)' % yaml.__with_libyaml__, plugin._read_config_data),
+                            ('Ansible DataLoader', read_with_ansible_loader)):
+            start = time.perf_counter()
+            for _ in range(20):
+                read(config_file)
+            elapsed = (time.perf_counter() - start) / 20
+            print('\n%d KiB config, %s: %.1fms' % (os.path.getsize(config_file) // 1024, label, elapsed * 1000))
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkInventoryList(unittest.TestCase):
+    """
+    Measures `ansible-inventory --list` on a fleet of 100 RAC deployments of
+    8 nodes each, with 200 additional shared configuration variables.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s inventory_plugins -k Benchmark
+    """
+
+    def test_inventory_list_benchmark(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for i in range(100):
+            config = _rac_config('db%d' % i, nodes=8)
+            config.update({'setting_%d' % n: 'value-%d' % n for n in range(200)})
+            _write_config(os.path.join(tmpdir, 'deployments', 'db%d' % i, 'gcp_oracle.yml'), config)
+        fleet_file = os.path.join(tmpdir, 'fleet.gcp_oracle_fleet.yml')
+        _write_config(fleet_file, {'plugin': 'gcp_oracle_inventory', 'config_file': ['deployments']})
+
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        start = time.perf_counter()
+        result = subprocess.run(['ansible-inventory', '-i', fleet_file, '--list'], cwd=repo_root,
+                                capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(json.loads(result.stdout)['_meta']['hostvars']), 800)
+        print('\nansible-inventory --list, 100 RAC deployments, 800 hosts: %.3fs, %d bytes of output'
+              % (elapsed, len(result.stdout)))
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ansible module that checks the presence and MD5 hashes of software library files."""
+
+from __future__ import annotations
+
+import base64
+import concurrent.futures
+import hashlib
+import json
+import os
+import subprocess
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = """
+module: swlib_objects
+short_description: Check the files of the software library in one task
+description:
+  - Looks up all base software, patch and OPatch files of the software library at once
+    and compares their MD5 hashes with the expected ones.
+  - A Cloud Storage location is read with a single C(gcloud storage objects list). If the
+    listing is not permitted, the objects are described by concurrent C(gcloud) calls.
+  - A local directory stands in for the bucket, e.g. to test the checks without Cloud Storage.
+options:
+  source:
+    description: The bucket and path of the software library, with or without C(gs://),
+      or the absolute path of a local directory.
+    type: str
+    required: true
+  base_files:
+    description: Base software files, with C(name) and C(md5sum) and optionally C(alt_name)
+      and C(alt_md5sum), checked when C(name) does not exist.
+    type: list
+    elements: dict
+    default: []
+  patches:
+    description: Patches, with C(patchfile), C(md5sum) and C(category).
+    type: list
+    elements: dict
+    default: []
+  opatch_files:
+    description: OPatch files, which are only checked for existence, as the same file name
+      has different hashes across OPatch versions.
+    type: list
+    elements: str
+    default: []
+  workers:
+    description: Number of concurrent metadata requests or local hash computations.
+    type: int
+    default: 16
+"""
+
+RETURN = """
+objects:
+  description: The MD5 hash and size of each file found, by file name.
+  type: dict
+errors:
+  description: One message for each missing file or MD5 mismatch.
+  type: list
+  elements: str
+"""
+
+_READ_SIZE = 1024 * 1024
+
+
+def _is_local(source):
+    return os.path.isabs(source)
+
+
+def _local_object(path):
+    """Returns the base64 MD5 hash, as Cloud Storage reports it, and the size of a file"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+            md5.update(chunk)
+    return {'md5': base64.b64encode(md5.digest()).decode('ascii'), 'size': os.path.getsize(path)}
+
+
+def _gcs_object(resource):
+    # gcloud reports the fields in camel case or snake case, depending on its version.
+    return {'md5': resource.get('md5_hash', resource.get('md5Hash')), 'size': int(resource.get('size', 0))}
+
+
+def _list_bucket(source):
+    """Returns the objects below source by name relative to it, or None if they cannot be listed"""
+    prefix = source.partition('/')[2].strip('/')
+    result = subprocess.run(['gcloud', 'storage', 'objects', 'list', 'gs://%s/**' % source.rstrip('/'), '--format=json'],
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    objects = {}
+    for resource in json.loads(result.stdout or '[]'):
+        name = resource.get('name', '')
+        if prefix:
+            if not name.startswith(prefix + '/'):
+                continue
+            name = name[len(prefix) + 1:]
+        objects[name] = _gcs_object(resource)
+    return objects
+
+
+def _describe_object(source, name):
+    result = subprocess.run(['gcloud', 'storage', 'objects', 'describe', 'gs://%s/%s' % (source.rstrip('/'), name),
+                             '--format=json'], stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    return _gcs_object(json.loads(result.stdout)) if result.returncode == 0 else None
+
+
+def lookup_objects(source, names, workers=16):
+    """Returns the MD5 hash and size of each of the names that exists in source"""
+    names = sorted(set(names))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        if _is_local(source):
+            paths = {name: os.path.join(source, name) for name in names}
+            found = [name for name in names if os.path.isfile(paths[name])]
+            return dict(zip(found, executor.map(lambda name: _local_object(paths[name]), found)))
+        source = source[len('gs://'):] if source.startswith('gs://') else source
+        listing = _list_bucket(source)
+        if listing is not None:
+            return {name: listing[name] for name in names if name in listing}
+        described = executor.map(lambda name: _describe_object(source, name), names)
+        return {name: obj for name, obj in zip(names, described) if obj is not None}
+
+
+def check_files(source, base_files=(), patches=(), opatch_files=(), workers=16):
+    """Returns the objects found and the errors of the checks, in the order of the files"""
+    names = [f[key] for f in base_files for key in ('name', 'alt_name') if f.get(key)]
+    names += [p['patchfile'] for p in patches] + list(opatch_files)
+    objects = lookup_objects(source, names, workers)
+
+    errors = []
+    for f in base_files:
+        name, expected_md5 = f['name'], f.get('md5sum')
+        if name not in objects and f.get('alt_name'):
+            name, expected_md5 = f['alt_name'], f.get('alt_md5sum')
+        if name not in objects:
+            errors.append('ERROR locating %s%s' % (f['name'], ' or %s' % f['alt_name'] if f.get('alt_name') else ''))
+        elif objects[name]['md5'] != expected_md5:
+            errors.append('ERROR in %s md5: expected %s, but got %s for %s' % (f['name'], expected_md5, objects[name]['md5'], name))
+    for p in patches:
+        obj = objects.get(p['patchfile'])
+        if obj is None:
+            errors.append('ERROR: %s patch %s: not found' % (p.get('category', ''), p['patchfile']))
+        elif obj['md5'] != p.get('md5sum'):
+            errors.append('ERROR: %s patch %s: md5 expected %s, but got %s'
+                          % (p.get('category', ''), p['patchfile'], p.get('md5sum'), obj['md5']))
+    for name in opatch_files:
+        if objects.get(name, {}).get('size', 0) <= 0:
+            errors.append('ERROR locating OPatch %s' % name)
+    return objects, errors
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            source=dict(type='str', required=True),
+            base_files=dict(type='list', elements='dict', default=[]),
+            patches=dict(type='list', elements='dict', default=[]),
+            opatch_files=dict(type='list', elements='str', default=[]),
+            workers=dict(type='int', default=16),
+        ),
+        supports_check_mode=True,
+    )
+    try:
+        objects, errors = check_files(module.params['source'], module.params['base_files'], module.params['patches'],
+                                      module.params['opatch_files'], module.params['workers'])
+    except OSError as e:
+        module.fail_json(msg='Cannot read the software library %s: %s' % (module.params['source'], e))
+    module.exit_json(changed=False, objects=objects, errors=errors)
+
+
+if __name__ == '__main__':
+    main()
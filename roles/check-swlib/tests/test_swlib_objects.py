@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'library'))
+import swlib_objects  # noqa: E402
+
+# Stands in for gcloud, serving the objects of the bucket from the directory
+# FAKE_GCS_DIR, in which each bucket is a subdirectory. FAKE_GCS_LOG records
+# each call and FAKE_GCS_DENY_LIST makes listings fail.
+FAKE_GCLOUD = textwrap.dedent('''\
+    #!%s
+    import base64, hashlib, json, os, sys
+    root = os.environ['FAKE_GCS_DIR']
+    with open(os.environ['FAKE_GCS_LOG'], 'a') as log:
+        log.write(' '.join(sys.argv[1:4]) + '\\n')
+
+    def resource(bucket, name):
+        with open(os.path.join(root, bucket, name), 'rb') as f:
+            data = f.read()
+        return {'name': name, 'size': str(len(data)),
+                'md5_hash': base64.b64encode(hashlib.md5(data).digest()).decode()}
+
+    bucket, _, path = sys.argv[4][len('gs://'):].partition('/')
+    if sys.argv[3] == 'list':
+        if os.environ.get('FAKE_GCS_DENY_LIST'):
+            sys.exit('AccessDeniedException: 403')
+        names = [os.path.relpath(os.path.join(d, f), os.path.join(root, bucket))
+                 for d, _, files in os.walk(os.path.join(root, bucket)) for f in files]
+        print(json.dumps([resource(bucket, n) for n in sorted(names)]))
+    elif os.path.isfile(os.path.join(root, bucket, path)):
+        print(json.dumps(resource(bucket, path)))
+    else:
+        sys.exit('NotFoundException: 404')
+''' % sys.executable)
+
+
+def _md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+class TestSwlibObjects(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.gcs_dir = os.path.join(self.tmpdir, 'gcs')
+        self.swlib = os.path.join(self.gcs_dir, 'my-bucket', 'swlib')
+        os.makedirs(self.swlib)
+        for name, data in (('base.zip', b'base'), ('alt_base.zip', b'alt'), ('p1.zip', b'patch1'),
+                           ('p2.zip', b'corrupt'), ('opatch.zip', b'opatch')):
+            with open(os.path.join(self.swlib, name), 'wb') as f:
+                f.write(data)
+        with open(os.path.join(self.gcs_dir, 'my-bucket', 'outside.zip'), 'wb') as f:
+            f.write(b'outside')
+
+        self.base_files = [
+            {'name': 'base.zip', 'md5sum': _md5(b'base')},
+            {'name': 'renamed.zip', 'md5sum': 'x', 'alt_name': 'alt_base.zip', 'alt_md5sum': _md5(b'alt')},
+            {'name': 'missing.zip', 'md5sum': 'x', 'alt_name': 'missing_alt.zip', 'alt_md5sum': 'x'},
+        ]
+        self.patches = [
+            {'category': 'RU', 'patchfile': 'p1.zip', 'md5sum': _md5(b'patch1')},
+            {'category': 'RU', 'patchfile': 'p2.zip', 'md5sum': _md5(b'patch2')},
+        ]
+        self.opatch_files = ['opatch.zip', 'outside.zip']
+
+    def _fake_gcloud(self, **env):
+        bin_dir = os.path.join(self.tmpdir, 'bin')
+        os.makedirs(bin_dir, exist_ok=True)
+        gcloud = os.path.join(bin_dir, 'gcloud')
+        with open(gcloud, 'w') as f:
+            f.write(FAKE_GCLOUD)
+        os.chmod(gcloud, 0o755)
+        self.log = os.path.join(self.tmpdir, 'gcloud.log')
+        env = dict(env, PATH=bin_dir + os.pathsep + os.environ['PATH'], FAKE_GCS_DIR=self.gcs_dir, FAKE_GCS_LOG=self.log)
+        patcher = patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _calls(self):
+        with open(self.log) as f:
+            return f.read().splitlines()
+
+    def _check(self, source):
+        return swlib_objects.check_files(source, self.base_files, self.patches, self.opatch_files, workers=4)
+
+    def _assert_errors(self, objects, errors):
+        self.assertEqual(objects['base.zip'], {'md5': _md5(b'base'), 'size': 4})
+        self.assertEqual(errors, [
+            'ERROR locating missing.zip or missing_alt.zip',
+            'ERROR: RU patch p2.zip: md5 expected %s, but got %s' % (_md5(b'patch2'), _md5(b'corrupt')),
+            'ERROR locating OPatch outside.zip',
+        ])
+
+    def test_local_directory(self):
+        self._assert_errors(*self._check(self.swlib))
+
+    def test_bucket_is_listed_once(self):
+        self._fake_gcloud()
+        self._assert_errors(*self._check('my-bucket/swlib'))
+        self.assertEqual(self._calls(), ['storage objects list'])
+
+    def test_objects_are_described_when_listing_is_denied(self):
+        self._fake_gcloud(FAKE_GCS_DENY_LIST='1')
+        self._assert_errors(*self._check('gs://my-bucket/swlib/'))
+        calls = self._calls()
+        self.assertEqual(calls[0], 'storage objects list')
+        # One call for each distinct file name.
+        self.assertEqual(calls[1:], ['storage objects describe'] * 9)
+
+    def test_bucket_root(self):
+        self._fake_gcloud()
+        objects, errors = swlib_objects.check_files('my-bucket', opatch_files=['outside.zip', 'swlib/p1.zip'])
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(objects), ['outside.zip', 'swlib/p1.zip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
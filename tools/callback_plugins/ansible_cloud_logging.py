@@ -2,14 +2,22 @@
 
 from __future__ import annotations  # required for annotations in TypeDicts
 
+import argparse
 import atexit
+import bisect
 import datetime
 import getpass
+import gzip
+import heapq
+import http.server
 import os
 import queue
 import json
+import random
+import socket
 import sys
 import threading
+import time
 from typing import Any, Dict, Optional, TypedDict
 import uuid
 
@@ -22,12 +30,48 @@ from ansible import context
 # You must run the plugin within Ansible for the imports to work correctly.
 # Ansible sets up the import paths and injects collection-based utilities at runtime.
 # See more details here: https://docs.ansible.com/ansible/latest/dev_guide/developing_module_utilities.html#using-and-developing-module-utilities.
+from ansible.errors import AnsibleRequiredOptionError
 from ansible.module_utils.parsing import convert_bool
+from ansible.playbook.handler import Handler
 from ansible.plugins import callback
-from ansible_collections.google.cloud.plugins.module_utils.gcp_utils import GcpSession
+
+try:
+  from ansible_collections.google.cloud.plugins.module_utils.gcp_utils import GcpSession
+except ImportError:
+  # Outside Ansible, e.g. when main() replays spool files, the collection is
+  # only found once Ansible's collection loader is set up by _gcp_session_class().
+  GcpSession = None
 
 
 MAX_RESULT_SIZE = 256 * 1024  # 256 KB
+# Oversized string fields and lists of lines in a task result are cut down to
+# this many characters, half of them from the head and half from the tail.
+MAX_RESULT_FIELD_SIZE = 16 * 1024  # 16 KB
+# Output fields truncated in each item of a looped task's results. The items
+# share MAX_RESULT_SIZE, leaving half of it for their other fields.
+LOOP_ITEM_OUTPUT_FIELDS = ("stdout", "stdout_lines", "stderr")
+# Cloud Logging rejects entries:write requests larger than 10 MB.
+MAX_REQUEST_SIZE = 10 * 1000 * 1000
+ENTRIES_WRITE_URL = "https://logging.googleapis.com/v2/entries:write"
+_ENTRIES_PREFIX = b'{"entries":['
+_ENTRIES_SUFFIX = b"]}"
+_JSON_SEPARATORS = (",", ":")
+# Level 6 is the zlib default and compresses JSON log entries nearly as well
+# as level 9 at a fraction of the CPU cost.
+GZIP_COMPRESS_LEVEL = 6
+# Status codes of entries:write responses that are worth retrying.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+# Number of slowest items listed in the summary of a looped task.
+LOOP_SLOWEST_ITEMS = 5
+# Loop item labels are cut down to this many characters.
+MAX_ITEM_LABEL_SIZE = 256
+# Histogram buckets in seconds of the metrics endpoint.
+TASK_DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+SINK_WRITE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_ENTRIES_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000)
+# A send() blocked on a full queue checks this often, in seconds, whether the
+# consumers are still alive to make room.
+QUEUE_PUT_CHECK_INTERVAL = 0.5
 
 DOCUMENTATION = """
   name: ansible_cloud_logging
@@ -35,7 +79,7 @@ DOCUMENTATION = """
   options:
     project:
       description: The Google Cloud project ID where logs will be sent.
-      required: true
+        Required if the C(cloud_logging) sink is enabled.
       type: str
       env:
         - name: ANSIBLE_CLOUD_LOGGING_PROJECT
@@ -80,6 +124,240 @@ DOCUMENTATION = """
       ini:
         - section: cloud_logging
           key: enable_async_logging
+    batch_max_entries:
+      description: Maximum number of log entries sent in a single entries:write
+        request when async logging is enabled.
+      type: int
+      default: 500
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_BATCH_MAX_ENTRIES
+      ini:
+        - section: cloud_logging
+          key: batch_max_entries
+    batch_max_bytes:
+      description: Maximum size in bytes of a single entries:write request body.
+        Values above the Cloud Logging request limit of 10 MB are capped.
+      type: int
+      default: 5242880
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_BATCH_MAX_BYTES
+      ini:
+        - section: cloud_logging
+          key: batch_max_bytes
+    batch_linger_ms:
+      description: Maximum time in milliseconds the background thread waits for
+        more log entries before sending a partially filled batch.
+      type: int
+      default: 500
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_BATCH_LINGER_MS
+      ini:
+        - section: cloud_logging
+          key: batch_linger_ms
+    sender_workers:
+      description: Number of background threads sending log entries when async
+        logging is enabled.
+      type: int
+      default: 2
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SENDER_WORKERS
+      ini:
+        - section: cloud_logging
+          key: sender_workers
+    queue_max_size:
+      description: Maximum number of log messages waiting to be sent when async
+        logging is enabled. 0 means unbounded.
+      type: int
+      default: 10000
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_QUEUE_MAX_SIZE
+      ini:
+        - section: cloud_logging
+          key: queue_max_size
+    queue_overflow_policy:
+      description: What to do with a new log message when the queue is full.
+        C(block) pauses Ansible until there is room, C(drop_oldest) discards the
+        oldest queued message and C(spill) writes the new message to the spool
+        file in I(spool_dir).
+      type: str
+      default: block
+      choices: [block, drop_oldest, spill]
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_QUEUE_OVERFLOW_POLICY
+      ini:
+        - section: cloud_logging
+          key: queue_overflow_policy
+    shutdown_timeout:
+      description: Maximum time in seconds the end of the playbook waits for
+        queued log messages to be sent. Messages left after the deadline are
+        spilled with the C(spill) policy and dropped otherwise.
+      type: float
+      default: 30
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SHUTDOWN_TIMEOUT
+      ini:
+        - section: cloud_logging
+          key: shutdown_timeout
+    spool_dir:
+      description: Directory for spool files holding log entries that were not
+        sent. Each playbook execution writes to C(<execution UUID>.jsonl).
+      type: path
+      default: ~/.ansible/cloud_logging_spool
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SPOOL_DIR
+      ini:
+        - section: cloud_logging
+          key: spool_dir
+    max_retries:
+      description: Number of times a batch is retried after a connection error
+        or a 408, 429 or 5xx response before it is written to the spool file.
+      type: int
+      default: 5
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_MAX_RETRIES
+      ini:
+        - section: cloud_logging
+          key: max_retries
+    retry_base_delay:
+      description: Initial delay in seconds between retries. The delay doubles
+        with every attempt and is randomized with full jitter.
+      type: float
+      default: 0.5
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_RETRY_BASE_DELAY
+      ini:
+        - section: cloud_logging
+          key: retry_base_delay
+    retry_max_delay:
+      description: Maximum delay in seconds between retries, including delays
+        requested by a Retry-After response header.
+      type: float
+      default: 30
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_RETRY_MAX_DELAY
+      ini:
+        - section: cloud_logging
+          key: retry_max_delay
+    compress_requests:
+      description: If enabled, entries:write request bodies are gzip-compressed
+        and sent with a C(gzip) Content-Encoding header.
+      type: bool
+      default: False
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_COMPRESS_REQUESTS
+      ini:
+        - section: cloud_logging
+          key: compress_requests
+    compress_min_bytes:
+      description: Request bodies smaller than this many bytes are sent
+        uncompressed even if I(compress_requests) is enabled.
+      type: int
+      default: 4096
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_COMPRESS_MIN_BYTES
+      ini:
+        - section: cloud_logging
+          key: compress_min_bytes
+    profile_dir:
+      description: If set, a timing profile of the playbook is written to this
+        directory when the playbook ends. It consists of
+        C(<execution UUID>.profile.json), with per-role, per-task and per-host
+        wall-clock totals and the critical path, and
+        C(<execution UUID>.trace.json), a Chrome trace-event file.
+      type: path
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_PROFILE_DIR
+      ini:
+        - section: cloud_logging
+          key: profile_dir
+    loop_events:
+      description: How the items of looped tasks are logged. With C(aggregate)
+        only the task end entry is sent and it carries a C(loop) summary with
+        the number of items, the failed and skipped items and the slowest
+        items. C(items) additionally sends one entry per loop item with its
+        result and timing.
+      type: str
+      default: aggregate
+      choices: [aggregate, items]
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_LOOP_EVENTS
+      ini:
+        - section: cloud_logging
+          key: loop_events
+    metrics_port:
+      description: If set, the plugin serves live metrics of the playbook in the
+        Prometheus text format on C(http://<metrics_address>:<metrics_port>/metrics)
+        while the playbook runs. The metrics cover task counts and durations per
+        role and host, the queue depth and the write latency and failures of
+        every sink. 0 disables the endpoint.
+      type: int
+      default: 0
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_METRICS_PORT
+      ini:
+        - section: cloud_logging
+          key: metrics_port
+    metrics_address:
+      description: Address the metrics endpoint listens on.
+      type: str
+      default: 127.0.0.1
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_METRICS_ADDRESS
+      ini:
+        - section: cloud_logging
+          key: metrics_address
+    sinks:
+      description: Destinations for the log entries. Every batch of entries is
+        written to all listed sinks. C(cloud_logging) sends them to Google Cloud
+        Logging, C(file) appends them to the rotating JSONL file
+        I(sink_file_path), C(stdout) prints them and C(unix_socket) streams
+        them to I(sink_socket_path) as newline-delimited JSON.
+      type: list
+      elements: str
+      default: [cloud_logging]
+      choices: [cloud_logging, file, stdout, unix_socket]
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SINKS
+      ini:
+        - section: cloud_logging
+          key: sinks
+    sink_file_path:
+      description: Path of the JSONL file written by the C(file) sink.
+      type: path
+      default: ~/.ansible/cloud_logging/ansible_cloud_logging.jsonl
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SINK_FILE_PATH
+      ini:
+        - section: cloud_logging
+          key: sink_file_path
+    sink_file_max_bytes:
+      description: Size in bytes at which the C(file) sink rotates its file.
+        0 disables rotation.
+      type: int
+      default: 104857600
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SINK_FILE_MAX_BYTES
+      ini:
+        - section: cloud_logging
+          key: sink_file_max_bytes
+    sink_file_backup_count:
+      description: Number of rotated files the C(file) sink keeps.
+      type: int
+      default: 5
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SINK_FILE_BACKUP_COUNT
+      ini:
+        - section: cloud_logging
+          key: sink_file_backup_count
+    sink_socket_path:
+      description: Path of the Unix domain socket the C(unix_socket) sink
+        connects to.
+      type: path
+      env:
+        - name: ANSIBLE_CLOUD_LOGGING_SINK_SOCKET_PATH
+      ini:
+        - section: cloud_logging
+          key: sink_socket_path
 """
 
 
@@ -92,6 +370,125 @@ def _print_uuid(execution_id: str) -> None:
   print(f"\nPlaybook execution UUID: {execution_id}\n")
 
 
+class EncodedJSON(bytes):
+  """UTF-8 encoded JSON value that has already been serialized.
+
+  CloudLoggingCollector._encode_entry() splices it into the log entry as is,
+  so large task results are serialized exactly once.
+  """
+
+
+def _truncate_value(value: Any, limit: int = MAX_RESULT_FIELD_SIZE) -> Any:
+  """Cuts a long string or list of strings down to its head and tail.
+
+  Args:
+    value: A task result field.
+    limit: Maximum number of characters to keep.
+
+  Returns:
+    The value itself if it is short enough or not a string or list of
+    strings, otherwise a truncated copy with a marker in the middle.
+  """
+  half = limit // 2
+  if isinstance(value, str):
+    if len(value) <= limit:
+      return value
+    return (
+        f"{value[:half]}\n... {len(value) - 2 * half} characters omitted ...\n"
+        f"{value[-half:]}"
+    )
+  if isinstance(value, list) and value and all(isinstance(v, str) for v in value):
+    if sum(len(v) for v in value) <= limit:
+      return value
+    head, size = [], 0
+    for line in value:
+      if size + len(line) > half:
+        break
+      head.append(line)
+      size += len(line)
+    tail, size = [], 0
+    for line in reversed(value[len(head):]):
+      if size + len(line) > half:
+        break
+      tail.append(line)
+      size += len(line)
+    omitted = len(value) - len(head) - len(tail)
+    return head + [f"... {omitted} lines omitted ..."] + tail[::-1]
+  return value
+
+
+def _truncate_loop_items(items: list[Any]) -> list[Any]:
+  """Truncates the output fields of each item of a looped task's results.
+
+  Args:
+    items: The results list of a looped task.
+
+  Returns:
+    A copy of the items whose LOOP_ITEM_OUTPUT_FIELDS are cut down to an
+    equal share of MAX_RESULT_SIZE.
+  """
+  limit = min(
+      MAX_RESULT_FIELD_SIZE,
+      MAX_RESULT_SIZE // (2 * len(items) * len(LOOP_ITEM_OUTPUT_FIELDS)),
+  )
+  return [
+      {
+          k: _truncate_value(v, limit) if k in LOOP_ITEM_OUTPUT_FIELDS else v
+          for k, v in item.items()
+      }
+      if isinstance(item, dict)
+      else item
+      for item in items
+  ]
+
+
+def _estimate_result_size(result: dict[str, Any]) -> int:
+  """Returns a cheap lower bound of the serialized size of a task result."""
+  size = 0
+  for value in result.values():
+    if isinstance(value, str):
+      size += len(value)
+    elif isinstance(value, list):
+      size += sum(len(v) for v in value if isinstance(v, str))
+  return size
+
+
+def _encode_result(result: dict[str, Any]) -> EncodedJSON:
+  """Serializes a task result once, truncating it if it is too large.
+
+  Results that would exceed MAX_RESULT_SIZE get their large top-level fields,
+  such as stdout_lines or stderr, and the output fields of each loop item
+  truncated by head and tail. If that is not enough, the result is replaced
+  by a warning.
+
+  Args:
+    result: The result dictionary of a task.
+
+  Returns:
+    The compact UTF-8 JSON encoding of the (possibly truncated) result.
+  """
+  # Skip serializing the full result if its text alone is already too large.
+  if _estimate_result_size(result) <= MAX_RESULT_SIZE:
+    encoded = json.dumps(result, separators=_JSON_SEPARATORS).encode("utf-8")
+    if len(encoded) <= MAX_RESULT_SIZE:
+      return EncodedJSON(encoded)
+  truncated = {
+      k: _truncate_loop_items(v)
+      if k == "results" and isinstance(v, list) and v
+      else _truncate_value(v)
+      for k, v in result.items()
+  }
+  encoded = json.dumps(truncated, separators=_JSON_SEPARATORS).encode("utf-8")
+  if len(encoded) <= MAX_RESULT_SIZE:
+    return EncodedJSON(encoded)
+  return EncodedJSON(
+      json.dumps(
+          {"warning": f"Result omitted because it exceeded {MAX_RESULT_SIZE} bytes"},
+          separators=_JSON_SEPARATORS,
+      ).encode("utf-8")
+  )
+
+
 class PlaybookStartMessage(TypedDict):
   """Defines the serializable message for a playbook start event.
 
@@ -138,9 +535,7 @@ class PlaybookTaskStartMessage(TypedDict):
     name: Name of the task.
     host: Hostname of the host where the task is executed.
     start_time: Timestamp when the task execution started.
-    end_time: Timestamp when the task execution ended.
-    status: Status of the task (OK, FAILED, SKIPPED, etc.)
-    result: Dictionary containing the execution result.
+    handler: Flag to indicate if the task is a handler.
   """
   id: str
   event_type: str
@@ -148,6 +543,7 @@ class PlaybookTaskStartMessage(TypedDict):
   name: str
   host: str
   start_time: str
+  handler: bool
   # WLM fields
   deployment_name: str
   state: str
@@ -168,8 +564,10 @@ class PlaybookTaskEndMessage(TypedDict):
     start_time: Timestamp when the task execution started.
     end_time: Timestamp when the task execution ended.
     status: Status of the task (OK, FAILED, SKIPPED, etc.)
-    result: Dictionary containing the execution result.
+    result: Pre-encoded JSON of the execution result.
     error_message: either result.stderr or result.msg depending on what ansible module failed.
+    handler: Flag to indicate if the task is a handler.
+    loop: Summary of the loop items, only set for looped tasks.
   """
 
   id: str
@@ -180,8 +578,145 @@ class PlaybookTaskEndMessage(TypedDict):
   start_time: str
   end_time: str
   status: str
-  result: dict[str, Any]
+  result: EncodedJSON
   error_message: str
+  handler: bool
+  loop: LoopSummary
+
+
+class PlaybookTaskItemMessage(TypedDict):
+  """Defines the serializable message for one item of a looped task.
+
+  params:
+    id: Unique ID of the playbook execution.
+    event_type: Type of the event.
+    task_id: Unique ID of the task.
+    name: Name of the task.
+    host: Hostname of the host where the task is executed.
+    item: Label of the loop item.
+    start_time: Timestamp when the item started, see LoopAggregator.
+    end_time: Timestamp when the item ended.
+    duration_seconds: Execution time of the item.
+    status: Status of the item (ok, failed, skipped).
+    result: Pre-encoded JSON of the item result.
+    deployment_name: Name of the deployment passed in by Terraform.
+  """
+
+  id: str
+  event_type: str
+  task_id: str
+  name: str
+  host: str
+  item: str
+  start_time: str
+  end_time: str
+  duration_seconds: float
+  status: str
+  result: EncodedJSON
+  deployment_name: str
+
+
+class PlaybookHandlerNotifyMessage(TypedDict):
+  """Defines the serializable message for a handler notification.
+
+  params:
+    id: Unique ID of the playbook execution.
+    event_type: Type of the event.
+    name: Name of the notified handler.
+    host: Hostname of the host the handler is notified for.
+    timestamp: Timestamp of the notification.
+    deployment_name: Name of the deployment passed in by Terraform.
+  """
+
+  id: str
+  event_type: str
+  name: str
+  host: str
+  timestamp: str
+  deployment_name: str
+
+
+class LoopSummary(TypedDict):
+  """Defines the aggregated items of one looped task on one host.
+
+  params:
+    items: Number of loop items.
+    failed: Number of failed items.
+    skipped: Number of skipped items.
+    duration_seconds: Sum of the execution times of all items.
+    slowest_items: The slowest items with their label, status and duration,
+      slowest first.
+  """
+
+  items: int
+  failed: int
+  skipped: int
+  duration_seconds: float
+  slowest_items: list[dict[str, Any]]
+
+
+class LoopAggregator:
+  """Summarizes the items of one looped task on one host.
+
+  Ansible reports each loop item when it ends, without its start time. The
+  items of a loop run one after another on a host, so each item is timed
+  from the end of the previous item, or from the start of the task for the
+  first one. Only the slowest items are kept, so memory does not grow with
+  the length of the loop.
+  """
+
+  def __init__(self, start: float, slowest: int = LOOP_SLOWEST_ITEMS):
+    self.last_end = start
+    self.slowest = slowest
+    self.items = 0
+    self.failed = 0
+    self.skipped = 0
+    self.duration = 0.0
+    # Min-heap of (duration, negated sequence number, label, status), so that
+    # of two equally slow items the earlier one is kept.
+    self._slowest: list[tuple[float, int, str, str]] = []
+
+  def add(self, item: str, status: str, end: float) -> tuple[float, float]:
+    """Records a finished loop item.
+
+    Args:
+      item: Label of the loop item.
+      status: Status of the item (ok, failed, skipped).
+      end: POSIX timestamp when the item ended.
+
+    Returns:
+      The POSIX start timestamp and the duration of the item.
+    """
+    start = self.last_end
+    duration = max(0.0, end - start)
+    self.last_end = max(end, start)
+    self.items += 1
+    self.duration += duration
+    if status == "failed":
+      self.failed += 1
+    elif status == "skipped":
+      self.skipped += 1
+    entry = (duration, -self.items, item, status)
+    if len(self._slowest) < self.slowest:
+      heapq.heappush(self._slowest, entry)
+    elif self.slowest:
+      heapq.heappushpop(self._slowest, entry)
+    return start, duration
+
+  def summary(self) -> LoopSummary:
+    """Returns the summary of all items recorded so far."""
+    return LoopSummary(
+        items=self.items,
+        failed=self.failed,
+        skipped=self.skipped,
+        duration_seconds=round(self.duration, 3),
+        slowest_items=[
+            {"item": item, "status": status, "duration_seconds": round(duration, 3)}
+            for duration, _, item, status in sorted(
+                self._slowest, key=lambda e: (-e[0], -e[1])
+            )
+        ],
+    )
 
 
 class PlaybookEndMessage(TypedDict):
@@ -210,17 +745,393 @@ class PlaybookEndMessage(TypedDict):
   file_name: str
 
 
+class EntrySpool:
+  """Append-only JSONL file holding encoded log entries that were not sent.
+
+  Each line is one complete Cloud Logging entry as produced by
+  CloudLoggingCollector._encode_entry(), so the file can be replayed
+  without knowing which playbook event produced it.
+
+  Attributes:
+    path: Path of the JSONL spool file.
+  """
+
+  def __init__(self, path: str):
+    """Initializes the EntrySpool instance.
+
+    Args:
+      path: Path of the JSONL spool file. Parent directories are created on
+        the first write.
+    """
+    self.path = path
+    self._lock = threading.Lock()
+
+  def append(self, entries: list[bytes]) -> None:
+    """Appends encoded log entries to the spool file.
+
+    Args:
+      entries: Log entries as returned by CloudLoggingCollector._encode_entry().
+    """
+    with self._lock:
+      os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+      with open(self.path, "ab") as f:
+        for entry in entries:
+          f.write(entry + b"\n")
+
+
+class LogSink:
+  """Destination for encoded log entries.
+
+  Subclasses implement write(), which receives batches of log entries as
+  produced by CloudLoggingCollector._encode_entry(). A CloudLoggingCollector
+  fans every batch out to all of its sinks.
+
+  Attributes:
+    name: Name of the sink used in error messages and in the sinks option.
+    spool_failures: If True, batches this sink fails to write are appended to
+      the spool so they can be replayed to Cloud Logging later.
+  """
+
+  name = "sink"
+  spool_failures = False
+
+  def write(self, entries: list[bytes]) -> bool:
+    """Writes a batch of encoded log entries.
+
+    Args:
+      entries: Log entries as returned by CloudLoggingCollector._encode_entry().
+
+    Returns:
+      True if the batch was written.
+    """
+    raise NotImplementedError
+
+  def abandon(self) -> None:
+    """Tells the sink to give up on pending retries, called after the shutdown deadline."""
+
+  def close(self) -> None:
+    """Releases files or connections held by the sink."""
+
+
+def _gcp_session_class() -> type:
+  """Returns the GcpSession class of the google.cloud collection.
+
+  Sets up Ansible's collection loader first if the collection could not be
+  imported with the plugin, so that the configured collections paths are used.
+
+  Raises:
+    ImportError: If the google.cloud collection is not installed.
+  """
+  if GcpSession is not None:
+    return GcpSession
+  # ansible-core releases before 2.15 set up the collection loader when
+  # ansible.plugins.loader is imported.
+  from ansible.plugins import loader
+  from ansible.utils.collection_loader import AnsibleCollectionConfig
+
+  if (
+      hasattr(loader, "init_plugin_loader")
+      and AnsibleCollectionConfig.collection_finder is None
+  ):
+    loader.init_plugin_loader()
+  try:
+    from ansible_collections.google.cloud.plugins.module_utils import gcp_utils
+  except ImportError as e:
+    raise ImportError(
+        "The cloud_logging sink requires the google.cloud Ansible collection."
+        " Install it with: ansible-galaxy collection install google.cloud"
+    ) from e
+  return gcp_utils.GcpSession
+
+
+class CloudLoggingSink(LogSink):
+  """Sends log entries to Google Cloud Logging with entries:write requests.
+
+  The entries are already serialized, so the request body is assembled by
+  joining them instead of serializing the whole batch a second time.
+
+  Batches that fail with a connection error or a retryable status code are
+  retried up to max_retries times with capped exponential backoff and full
+  jitter, honouring the Retry-After response header.
+
+  If compress_requests is enabled, request bodies of at least
+  compress_min_bytes bytes are gzip-compressed.
+
+  Attributes:
+    max_retries: Number of retries for a batch that failed with a transient error.
+    retry_base_delay: Initial delay in seconds between retries.
+    retry_max_delay: Maximum delay in seconds between retries.
+    entries_write_url: URL of the entries:write API method.
+    compress_requests: If True, request bodies are gzip-compressed.
+    compress_min_bytes: Request bodies smaller than this are not compressed.
+    params: Parameters for the GcpSession class.
+    gcp_session: Handles authenticated communication with the Google Cloud Logging API.
+  """
+
+  name = "cloud_logging"
+  spool_failures = True
+
+  def __init__(
+      self,
+      max_retries: int = 5,
+      retry_base_delay: float = 0.5,
+      retry_max_delay: float = 30.0,
+      entries_write_url: str = ENTRIES_WRITE_URL,
+      compress_requests: bool = False,
+      compress_min_bytes: int = 4096,
+  ):
+    """Initializes the CloudLoggingSink instance.
+
+    Args:
+      max_retries: Number of retries for a batch that failed with a transient error.
+      retry_base_delay: Initial delay in seconds between retries.
+      retry_max_delay: Maximum delay in seconds between retries.
+      entries_write_url: URL of the entries:write API method.
+      compress_requests: If True, request bodies are gzip-compressed.
+      compress_min_bytes: Request bodies smaller than this are not compressed.
+    """
+    self.max_retries = max(0, max_retries)
+    self.retry_base_delay = retry_base_delay
+    self.retry_max_delay = retry_max_delay
+    self.entries_write_url = entries_write_url
+    self.compress_requests = compress_requests
+    self.compress_min_bytes = compress_min_bytes
+    # Set once the collector gave up on its consumers, so that retrying
+    # workers stop sleeping and let the batch be spooled right away.
+    self._abandoned = threading.Event()
+    self.params = {
+        "auth_kind": "application",
+        "scopes": "https://www.googleapis.com/auth/logging.write",
+    }
+    self.gcp_session = _gcp_session_class()(self, "logging")
+
+  def fail_json(self, **kwargs) -> None:
+    raise RuntimeError(kwargs.get("msg", "An error occurred, but no message was provided"))
+
+  def abandon(self) -> None:
+    self._abandoned.set()
+
+  def _retry_delay(self, attempt: int, resp: Any) -> float:
+    """Returns the number of seconds to wait before the next attempt.
+
+    Args:
+      attempt: Number of the attempt that just failed, starting at 0.
+      resp: The failed response, or None after a connection error.
+    """
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+      try:
+        return min(float(retry_after), self.retry_max_delay)
+      except ValueError:
+        # Retry-After may also be an HTTP date, fall back to backoff then.
+        pass
+    return random.uniform(
+        0, min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+    )
+
+  def write(self, entries: list[bytes]) -> bool:
+    """Sends a batch of encoded log entries to Google Cloud Logging.
+
+    Args:
+      entries: Log entries as returned by CloudLoggingCollector._encode_entry().
+
+    Returns:
+      True if the batch was accepted by Google Cloud Logging.
+    """
+    body = _ENTRIES_PREFIX + b",".join(entries) + _ENTRIES_SUFFIX
+    headers = {"Content-Type": "application/json"}
+    if self.compress_requests and len(body) >= self.compress_min_bytes:
+      body = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+      headers["Content-Encoding"] = "gzip"
+    for attempt in range(self.max_retries + 1):
+      try:
+        resp = self.gcp_session.full_post(
+            self.entries_write_url,
+            data=body,
+            headers=headers,
+        )
+      except RuntimeError as e:
+        # GcpSession reports connection errors through fail_json().
+        resp, error = None, str(e)
+      else:
+        if resp.status_code == 200:
+          return True
+        error = f"Received status code: {resp.status_code}\nResponse: {resp.text}"
+        if resp.status_code not in RETRYABLE_STATUS_CODES:
+          break
+      if attempt == self.max_retries or self._abandoned.wait(
+          self._retry_delay(attempt, resp)
+      ):
+        break
+    print(error)
+    return False
+
+
+class JsonlFileSink(LogSink):
+  """Appends log entries to a JSONL file, one entry per line.
+
+  The file is rotated like logging.handlers.RotatingFileHandler does: once
+  it would grow beyond max_bytes it is renamed to <path>.1, older files are
+  shifted up to <path>.<backup_count> and the oldest file is removed.
+
+  Attributes:
+    path: Path of the JSONL file.
+    max_bytes: Size in bytes at which the file is rotated, 0 disables rotation.
+    backup_count: Number of rotated files to keep.
+  """
+
+  name = "file"
+
+  def __init__(self, path: str, max_bytes: int = 0, backup_count: int = 0):
+    """Initializes the JsonlFileSink instance.
+
+    Args:
+      path: Path of the JSONL file. Parent directories are created if needed.
+      max_bytes: Size in bytes at which the file is rotated, 0 disables rotation.
+      backup_count: Number of rotated files to keep.
+    """
+    self.path = path
+    self.max_bytes = max_bytes
+    self.backup_count = backup_count
+    self._lock = threading.Lock()
+    self._file = None
+
+  def _rotate(self) -> None:
+    """Shifts the rotated files and starts a new file."""
+    self._file.close()
+    self._file = None
+    if self.backup_count > 0:
+      for i in range(self.backup_count - 1, 0, -1):
+        if os.path.exists(f"{self.path}.{i}"):
+          os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+      os.replace(self.path, f"{self.path}.1")
+    else:
+      os.remove(self.path)
+
+  def write(self, entries: list[bytes]) -> bool:
+    data = b"".join(entry + b"\n" for entry in entries)
+    with self._lock:
+      try:
+        if self._file is None:
+          os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+          self._file = open(self.path, "ab")
+        if (
+            self.max_bytes
+            and self._file.tell()
+            and self._file.tell() + len(data) > self.max_bytes
+        ):
+          self._rotate()
+          self._file = open(self.path, "ab")
+        self._file.write(data)
+        self._file.flush()
+      except OSError as e:
+        print(f"Could not write log entries to {self.path}: {e}")
+        return False
+    return True
+
+  def close(self) -> None:
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+
+
+class StdoutSink(LogSink):
+  """Writes log entries to standard output, one JSON entry per line."""
+
+  name = "stdout"
+
+  def __init__(self, stream: Optional[Any] = None):
+    """Initializes the StdoutSink instance.
+
+    Args:
+      stream: Binary stream to write to, defaults to sys.stdout.buffer.
+    """
+    self._stream = stream
+    self._lock = threading.Lock()
+
+  def write(self, entries: list[bytes]) -> bool:
+    stream = self._stream or sys.stdout.buffer
+    with self._lock:
+      stream.write(b"".join(entry + b"\n" for entry in entries))
+      stream.flush()
+    return True
+
+
+class UnixSocketSink(LogSink):
+  """Streams log entries as newline-delimited JSON to a Unix domain socket.
+
+  The connection is opened on the first write and re-established once if
+  a write fails, for example because the local collector was restarted.
+
+  Attributes:
+    path: Path of the Unix domain socket.
+  """
+
+  name = "unix_socket"
+
+  def __init__(self, path: str):
+    """Initializes the UnixSocketSink instance.
+
+    Args:
+      path: Path of the Unix domain socket.
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._sock = None
+
+  def write(self, entries: list[bytes]) -> bool:
+    data = b"".join(entry + b"\n" for entry in entries)
+    with self._lock:
+      for attempt in range(2):
+        try:
+          if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(self.path)
+          self._sock.sendall(data)
+          return True
+        except OSError as e:
+          error = e
+          # socket.socket() itself may have failed, e.g. out of descriptors.
+          if self._sock is not None:
+            self._sock.close()
+          self._sock = None
+    print(f"Could not write log entries to socket {self.path}: {error}")
+    return False
+
+  def close(self) -> None:
+    with self._lock:
+      if self._sock is not None:
+        self._sock.close()
+        self._sock = None
+
+
 class CloudLoggingCollector:
-  """Provides a thread for collecting and sending logs to Google Cloug Logging.
+  """Provides a pool of threads for collecting log messages and writing them to sinks.
 
   Create a new CloudLoggingCollector instance by passing the project and
   the log_name. Log messages can be submitted using CloudLoggingCollector.send(msg). 
   If enable_async_logging is set to True, messages are queued and processed by 
-  a background thread started via start_consuming(). Otherwise, messages are sent synchronously. 
-  The separate worker thread running in the background will consume the queue 
-  until a "None" message has been received. Make sure to run start_consuming() 
+  sender_workers background threads started via start_consuming(). Otherwise, messages are sent synchronously. 
+  The worker threads running in the background block on the queue until wait()
+  queues one shutdown sentinel per worker behind the remaining messages. Make sure to run start_consuming() 
   after initializing the instance of CloudLoggingCollector to start all necessary worker threads.
 
+  Each worker drains the queue into batches and writes each batch to every
+  sink, by default a CloudLoggingSink that sends it with a single
+  entries:write request. A batch is written as soon as it holds
+  batch_max_entries entries, when adding the next entry would exceed
+  batch_max_bytes, or when batch_linger_ms has passed since the first entry
+  of the batch was dequeued.
+
+  The queue holds at most queue_max_size messages. When it is full,
+  overflow_policy decides what happens to a new message: "block" waits for
+  a free slot, "drop_oldest" discards the oldest queued message and "spill"
+  appends the new message to the on-disk spool instead of queueing it.
+
+  Batches that a Cloud Logging sink fails to send are appended to the spool,
+  which can be replayed later with replay().
+
   Attributes:
     project: The Google Cloud project ID where logs will be sent.
     log_name: The log ID of the log entry name.
@@ -228,18 +1139,42 @@ class CloudLoggingCollector:
       to avoid blocking Ansible execution. If False, messages are sent
       synchronously as they are emitted.
     ignore_gcp_api_errors: If enabled, GCP API errors are ignored and do not cause Ansible to fail.
-    params: Parameters for the GcpSession class.
+    batch_max_entries: Maximum number of entries per entries:write request.
+    batch_max_bytes: Maximum size in bytes of an entries:write request body.
+    batch_linger_ms: Maximum time in milliseconds to wait for a batch to fill up.
+    sender_workers: Number of background threads sending batches.
+    overflow_policy: One of OVERFLOW_POLICIES, applied when the queue is full.
+    shutdown_timeout: Maximum time in seconds wait() blocks for the queue to drain.
+    sinks: Destinations every batch of log entries is written to.
+    metrics: Registry the pipeline metrics are recorded in, if any.
+    spool: Holds entries that could not be queued or sent.
+    dropped: Number of messages discarded because of the overflow policy or
+      the shutdown deadline.
+    spilled: Number of messages written to the spool.
+    fatal_error: Set once a batch could not be sent and GCP API errors are not
+      ignored. The playbook is terminated on the callback thread.
     queue: Holds log messages when async logging is enabled.
-    gcp_session: Handles authenticated communication with the Google Cloud Logging API.
-    consumer: Background thread that processes log messages from the queue.
+    consumers: Background threads that process log messages from the queue.
   """
 
+  OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
   def __init__(
       self,
       project: str,
       log_name: str,
       enable_async_logging: bool,
       ignore_gcp_api_errors: bool = False,
+      batch_max_entries: int = 500,
+      batch_max_bytes: int = 5 * 1024 * 1024,
+      batch_linger_ms: int = 500,
+      sender_workers: int = 2,
+      queue_max_size: int = 10000,
+      overflow_policy: str = "block",
+      shutdown_timeout: float = 30.0,
+      spool_path: str = "",
+      sinks: Optional[list[LogSink]] = None,
+      metrics: Optional[Metrics] = None,
   ):
     """Initializes the CloudLoggingCollector instance.
 
@@ -250,41 +1185,139 @@ class CloudLoggingCollector:
         to avoid blocking Ansible execution. If False, messages are sent
         synchronously as they are emitted.
       ignore_gcp_api_errors: If enabled, GCP API errors are ignored and do not cause Ansible to fail.
+        Errors of local sinks never cause Ansible to fail.
+      batch_max_entries: Maximum number of entries per entries:write request.
+      batch_max_bytes: Maximum size in bytes of an entries:write request body,
+        capped at MAX_REQUEST_SIZE.
+      batch_linger_ms: Maximum time in milliseconds to wait for a batch to fill up.
+      sender_workers: Number of background threads sending batches.
+      queue_max_size: Maximum number of queued messages. 0 means unbounded.
+      overflow_policy: One of OVERFLOW_POLICIES, applied when the queue is full.
+      shutdown_timeout: Maximum time in seconds wait() blocks for the queue to drain.
+      spool_path: Path of the JSONL file holding entries that could not be
+        queued or sent. Failed entries are discarded if it is empty.
+      sinks: Destinations every batch of log entries is written to. Defaults
+        to a single CloudLoggingSink.
+      metrics: Registry to record the queue depth, batch sizes and sink write
+        latencies in. No metrics are recorded if it is None.
+
+    Raises:
+      ValueError: If overflow_policy is unknown or "spill" is used without a spool_path.
     """
+    if overflow_policy not in self.OVERFLOW_POLICIES:
+      raise ValueError(
+          f"Unknown overflow policy '{overflow_policy}', expected one of"
+          f" {', '.join(self.OVERFLOW_POLICIES)}"
+      )
+    if overflow_policy == "spill" and not spool_path:
+      raise ValueError("The 'spill' overflow policy requires a spool path")
     self.project = project
     self.log_name = log_name
     self.enable_async_logging = enable_async_logging
     self.ignore_gcp_api_errors = ignore_gcp_api_errors
-    self.params = {
-        "auth_kind": "application",
-        "scopes": "https://www.googleapis.com/auth/logging.write",
-    }
-    self.gcp_session = GcpSession(self, "logging")
+    self.batch_max_entries = max(1, batch_max_entries)
+    self.batch_max_bytes = min(batch_max_bytes, MAX_REQUEST_SIZE)
+    self.batch_linger_ms = max(0, batch_linger_ms)
+    self.sender_workers = max(1, sender_workers)
+    self.overflow_policy = overflow_policy
+    self.shutdown_timeout = shutdown_timeout
+    self.sinks = sinks if sinks is not None else [CloudLoggingSink()]
+    self.spool = EntrySpool(spool_path) if spool_path else None
+    self.dropped = 0
+    self.spilled = 0
+    self._counter_lock = threading.Lock()
+    self._put_lock = threading.Lock()
+    self._closing = threading.Event()
+    self.fatal_error = threading.Event()
+    # Queued once per consumer by wait(), behind the last log message.
+    self._shutdown = object()
+    self.consumers = []
     if self.enable_async_logging:
-      self.queue = queue.Queue()
-
-  def fail_json(self, **kwargs) -> None:
-    raise RuntimeError(kwargs.get("msg", "An error occurred, but no message was provided"))
+      self.queue = queue.Queue(maxsize=max(0, queue_max_size))
+    self.metrics = metrics
+    if self.metrics is not None:
+      self._register_metrics()
+
+  def _register_metrics(self) -> None:
+    """Declares the pipeline metrics in self.metrics."""
+    self.metrics.function(
+        "ansible_cloud_logging_queue_depth",
+        "gauge",
+        "Number of log messages waiting to be sent.",
+        lambda: self.queue.qsize() if self.enable_async_logging else 0,
+    )
+    self.metrics.function(
+        "ansible_cloud_logging_dropped_total",
+        "counter",
+        "Number of log messages discarded by the overflow policy or the shutdown deadline.",
+        lambda: self.dropped,
+    )
+    self.metrics.function(
+        "ansible_cloud_logging_spilled_total",
+        "counter",
+        "Number of log messages written to the spool.",
+        lambda: self.spilled,
+    )
+    self.metrics.counter(
+        "ansible_cloud_logging_entries_total",
+        "Number of log entries written to a sink, by outcome.",
+        ("sink", "outcome"),
+    )
+    self.metrics.histogram(
+        "ansible_cloud_logging_sink_write_seconds",
+        "Time it took a sink to write a batch, including retries.",
+        SINK_WRITE_BUCKETS,
+        ("sink",),
+    )
+    self.metrics.histogram(
+        "ansible_cloud_logging_batch_entries",
+        "Number of log entries per batch.",
+        BATCH_ENTRIES_BUCKETS,
+    )
 
   def start_consuming(self) -> None:
-    """Starts the background consumer thread.
+    """Starts the background consumer threads.
 
     If enable_async_logging is False, the method, is a no-op.
     """
     if self.enable_async_logging:
-      self.consumer = threading.Thread(target=self.consume)
-      self.consumer.start()
+      for i in range(self.sender_workers):
+        # Daemon threads never keep the Ansible process alive once wait()
+        # gave up on them after the shutdown deadline.
+        consumer = threading.Thread(
+            target=self.consume, name=f"cloud-logging-sender-{i}", daemon=True
+        )
+        consumer.start()
+        self.consumers.append(consumer)
 
-  def _send(
+  def _count(self, dropped: int = 0, spilled: int = 0) -> None:
+    """Updates the dropped and spilled counters from any thread."""
+    with self._counter_lock:
+      self.dropped += dropped
+      self.spilled += spilled
+
+  def _encode_entry(
       self,
       payload: (
           PlaybookStartMessage
           | PlaybookTaskStartMessage
           | PlaybookTaskEndMessage
+          | PlaybookTaskItemMessage
+          | PlaybookHandlerNotifyMessage
           | PlaybookEndMessage
       ),
-  ) -> None:
-    """Sends a log entry to Google Cloud Logging."""
+  ) -> bytes:
+    """Wraps a payload into a log entry and serializes it to JSON.
+
+    Args:
+      payload: The payload to be sent to Google Cloud Logging.
+
+    Returns:
+      The compact UTF-8 encoded JSON representation of the log entry.
+    """
+    result = payload.get("result")
+    if isinstance(result, EncodedJSON):
+      payload = {k: v for k, v in payload.items() if k != "result"}
     entry = {
         "logName": f"projects/{self.project}/logs/{self.log_name}",
         "resource": {
@@ -295,23 +1328,116 @@ class CloudLoggingCollector:
         },
         "jsonPayload": payload,
     }
-    entries = {"entries": [entry]}
-    resp = self.gcp_session.full_post(
-        "https://logging.googleapis.com/v2/entries:write",
-        json=entries,
-    )
-    if resp.status_code != 200:
-      print(
-          f"Received status code: {resp.status_code}\n"
-          f"Response: {resp.json()}"
-      )
-      if not self.ignore_gcp_api_errors:
-        print(
-            "The Ansible playbook execution was terminated due to an error"
-            " encountered while attempting to send execution logs to Google Cloud Logging.",
-            file=sys.stderr,
+    encoded = json.dumps(entry, separators=_JSON_SEPARATORS).encode("utf-8")
+    if not isinstance(result, EncodedJSON):
+      return encoded
+    # jsonPayload is the last key of the entry, so the encoding ends with the
+    # closing braces of the payload and the entry.
+    return encoded[:-2] + b',"result":' + result + b"}}"
+
+  def _send(self, entries: list[bytes]) -> bool:
+    """Writes a batch of encoded log entries to every sink.
+
+    If a sink with spool_failures set fails, the entries are appended to the
+    spool.
+
+    Args:
+      entries: Log entries as returned by _encode_entry().
+
+    Returns:
+      True if every sink wrote the batch.
+    """
+    spool = False
+    ok = True
+    if self.metrics is not None:
+      self.metrics.observe("ansible_cloud_logging_batch_entries", len(entries))
+    for sink in self.sinks:
+      start = time.monotonic()
+      written = sink.write(entries)
+      if self.metrics is not None:
+        self.metrics.observe(
+            "ansible_cloud_logging_sink_write_seconds",
+            time.monotonic() - start,
+            (sink.name,),
         )
-        sys.exit(1)
+        self.metrics.inc(
+            "ansible_cloud_logging_entries_total",
+            (sink.name, "written" if written else "failed"),
+            len(entries),
+        )
+      if not written:
+        ok = False
+        spool = spool or sink.spool_failures
+    if not spool:
+      return ok
+    if self.spool is not None:
+      self.spool.append(entries)
+      self._count(spilled=len(entries))
+    if not self.ignore_gcp_api_errors:
+      # Exiting here would only end a sender thread, so the playbook is
+      # terminated by check_fatal_error() on the callback thread.
+      self.fatal_error.set()
+    return False
+
+  def check_fatal_error(self) -> None:
+    """Terminates the playbook once a batch could not be sent.
+
+    Must be called from the Ansible callback thread. Queued messages are
+    handed to wait() first, so that they are spooled with the "spill"
+    overflow policy.
+
+    Raises:
+      SystemExit: If fatal_error is set.
+    """
+    if not self.fatal_error.is_set():
+      return
+    if self.enable_async_logging and not self._closing.is_set():
+      self.wait()
+    print(
+        "The Ansible playbook execution was terminated due to an error"
+        " encountered while attempting to send execution logs to Google Cloud Logging.",
+        file=sys.stderr,
+    )
+    sys.exit(1)
+
+  def replay(self, path: str) -> tuple[int, int]:
+    """Writes the entries of a spool file to the sinks.
+
+    Entries that are sent are removed from the file; the file is deleted once
+    it is empty.
+
+    Args:
+      path: Path of a spool file written by EntrySpool.
+
+    Returns:
+      The number of entries that were sent and the number that failed again.
+    """
+    with open(path, "rb") as f:
+      entries = [line.rstrip(b"\n") for line in f if line.strip()]
+    failed = []
+    batch = []
+    batch_bytes = len(_ENTRIES_PREFIX) + len(_ENTRIES_SUFFIX)
+    for entry in entries + [None]:
+      if batch and (
+          entry is None
+          or len(batch) >= self.batch_max_entries
+          or batch_bytes + len(entry) + 1 > self.batch_max_bytes
+      ):
+        if not self._send(batch):
+          failed.extend(batch)
+        batch = []
+        batch_bytes = len(_ENTRIES_PREFIX) + len(_ENTRIES_SUFFIX)
+      if entry is not None:
+        batch.append(entry)
+        batch_bytes += len(entry) + 1
+    if not failed:
+      os.remove(path)
+    else:
+      with open(path + ".tmp", "wb") as f:
+        for entry in failed:
+          f.write(entry + b"\n")
+      os.replace(path + ".tmp", path)
+    return len(entries) - len(failed), len(failed)
 
   def send(
       self,
@@ -319,37 +1445,518 @@ class CloudLoggingCollector:
           PlaybookStartMessage
           | PlaybookTaskStartMessage
           | PlaybookTaskEndMessage
+          | PlaybookTaskItemMessage
+          | PlaybookHandlerNotifyMessage
           | PlaybookEndMessage
-          | None
       ),
   ) -> None:
     """Public send method to add a new log message to the queue.
 
     Args:
       payload: The payload to be sent to Google Cloug Logging.
+
+    Raises:
+      SystemExit: If a batch could not be sent and GCP API errors are not
+        ignored.
     """
-    if self.enable_async_logging:
-      self.queue.put(payload)
+    self.check_fatal_error()
+    if not self.enable_async_logging:
+      self._send([self._encode_entry(payload)])
+      self.check_fatal_error()
+      return
+    if self.overflow_policy == "block":
+      while True:
+        try:
+          self.queue.put(payload, timeout=QUEUE_PUT_CHECK_INTERVAL)
+          return
+        except queue.Full:
+          self.check_fatal_error()
+          if not any(consumer.is_alive() for consumer in self.consumers):
+            break
+      # No consumer is left to make room.
+      if self.spool is not None:
+        self.spool.append([self._encode_entry(payload)])
+        self._count(spilled=1)
+      else:
+        self._count(dropped=1)
+      return
+    try:
+      self.queue.put_nowait(payload)
       return
-    self._send(payload)
+    except queue.Full:
+      pass
+    if self.overflow_policy == "spill":
+      self.spool.append([self._encode_entry(payload)])
+      self._count(spilled=1)
+      return
+    # drop_oldest: the lock keeps concurrent producers from evicting more
+    # messages than necessary to make room.
+    with self._put_lock:
+      while True:
+        try:
+          self.queue.put_nowait(payload)
+          return
+        except queue.Full:
+          try:
+            self.queue.get_nowait()
+            self._count(dropped=1)
+          except queue.Empty:
+            pass
+
+  def _get(self, timeout: float) -> Optional[dict[str, Any]]:
+    """Dequeues a message or the shutdown sentinel, returning None on timeout."""
+    try:
+      return self.queue.get(timeout=timeout)
+    except queue.Empty:
+      return None
 
   def consume(self):
-    """Consumes messages from the queue and sends them to Google Cloug Logging."""
-    while True:
-      msg = self.queue.get()
-      # if msg is None ensures that we break out of the loop to finish the
-      # consumer thread, because join() only finishes when the consumer thread
-      # is dead.
-      if msg is None:
+    """Consumes messages from the queue and writes them to the sinks in batches.
+
+    Runs until it dequeues the shutdown sentinel queued by wait().
+    """
+    # An entry that did not fit into the previous batch starts the next one.
+    pending = None
+    stopping = False
+    while not stopping:
+      if pending is None:
+        msg = self.queue.get()
+        if msg is self._shutdown:
+          break
+        pending = self._encode_entry(msg)
+      batch = [pending]
+      # Account for the request envelope and the separating commas.
+      batch_bytes = len(_ENTRIES_PREFIX) + len(_ENTRIES_SUFFIX) + len(pending)
+      pending = None
+      deadline = time.monotonic() + self.batch_linger_ms / 1000
+      while len(batch) < self.batch_max_entries:
+        # Once the playbook has ended no new messages arrive, so there is no
+        # point in lingering for a fuller batch.
+        timeout = 0.0 if self._closing.is_set() else deadline - time.monotonic()
+        msg = self._get(timeout=max(0.0, timeout))
+        if msg is None:
+          break
+        if msg is self._shutdown:
+          stopping = True
+          break
+        entry = self._encode_entry(msg)
+        if batch_bytes + len(entry) + 1 > self.batch_max_bytes:
+          pending = entry
+          break
+        batch.append(entry)
+        batch_bytes += len(entry) + 1
+      self._send(batch)
+      if self.fatal_error.is_set():
+        # The playbook is being terminated, wait() takes care of the rest.
         break
-      self._send(msg)
-      self.queue.task_done()
 
-  def wait(self):
-    """Waits for the consumer thread to finish."""
-    # join() only finishes when the consumer thread finishes not when the queue
-    # itself is empty.
-    self.consumer.join()
+  def wait(self) -> None:
+    """Waits for the consumer threads to drain the queue and finish.
+
+    Blocks for at most shutdown_timeout seconds. Messages still queued after
+    the deadline are spilled to the spool if the "spill" overflow policy is
+    used, and dropped otherwise.
+    """
+    if not self.enable_async_logging:
+      self._close_sinks()
+      return
+    self._closing.set()
+    deadline = time.monotonic() + self.shutdown_timeout
+    for _ in self.consumers:
+      if not any(consumer.is_alive() for consumer in self.consumers):
+        break
+      try:
+        self.queue.put(
+            self._shutdown, timeout=max(0.0, deadline - time.monotonic())
+        )
+      except queue.Full:
+        break
+    for consumer in self.consumers:
+      consumer.join(timeout=max(0.0, deadline - time.monotonic()))
+    if not any(consumer.is_alive() for consumer in self.consumers):
+      self._close_sinks()
+    else:
+      for sink in self.sinks:
+        sink.abandon()
+    # Left behind by consumers that gave up on a fatal error or are stuck.
+    leftover = []
+    while (msg := self._get(timeout=0.0)) is not None:
+      if msg is not self._shutdown:
+        leftover.append(msg)
+    if not leftover:
+      return
+    if self.spool is not None and self.overflow_policy == "spill":
+      self.spool.append([self._encode_entry(msg) for msg in leftover])
+      self._count(spilled=len(leftover))
+    else:
+      self._count(dropped=len(leftover))
+
+  def _close_sinks(self) -> None:
+    """Closes all sinks once no worker uses them anymore."""
+    for sink in self.sinks:
+      sink.close()
+
+
+class TaskTiming(TypedDict):
+  """Defines the compact timing record of one task on one host.
+
+  params:
+    task_id: Unique ID of the task.
+    name: Name of the task.
+    role: Name of the role the task belongs to, empty for play-level tasks.
+    host: Hostname of the host where the task is executed.
+    start: POSIX timestamp when the task execution started.
+    end: POSIX timestamp when the task execution ended.
+    status: Status of the task (ok, failed, skipped, unreachable).
+  """
+
+  task_id: str
+  name: str
+  role: str
+  host: str
+  start: float
+  end: float
+  status: str
+
+
+class TaskProfiler:
+  """Aggregates task timings into a profile report and a Chrome trace.
+
+  The profile covers per-role and per-task wall-clock totals, the skew
+  between hosts and the critical path through the play. The critical path
+  is reconstructed backwards from the task that finished last: each step is
+  the task that finished most recently before the current one started, which
+  is what the current task was waiting for under both the linear and the
+  free strategy.
+
+  Attributes:
+    timings: Timing records in the order the tasks finished.
+  """
+
+  def __init__(self):
+    """Initializes the TaskProfiler instance."""
+    self.timings = []
+
+  def record(self, timing: TaskTiming) -> None:
+    """Adds the timing record of a finished task.
+
+    Args:
+      timing: The timing of one task on one host.
+    """
+    self.timings.append(timing)
+
+  def _critical_path(self) -> list[TaskTiming]:
+    """Returns the chain of tasks that determined the play's duration."""
+    by_end = sorted(self.timings, key=lambda t: t["end"])
+    ends = [t["end"] for t in by_end]
+    path = []
+    i = len(by_end) - 1
+    while i >= 0:
+      current = by_end[i]
+      path.append(current)
+      # Latest task that ended no later than the current one started.
+      i = bisect.bisect_right(ends, current["start"], hi=i) - 1
+    return path[::-1]
+
+  def report(self) -> dict[str, Any]:
+    """Builds the profile report.
+
+    Returns:
+      A JSON-serializable dictionary with wall-clock totals per role, task
+      and host, and the critical path. Durations are in seconds.
+    """
+    if not self.timings:
+      return {"wall_clock_seconds": 0, "roles": [], "tasks": [], "hosts": [], "critical_path": {}}
+
+    tasks = {}
+    for t in self.timings:
+      tasks.setdefault(t["task_id"], []).append(t)
+    task_rows = []
+    roles = {}
+    for task_id, runs in tasks.items():
+      durations = {r["host"]: r["end"] - r["start"] for r in runs}
+      slowest_host = max(durations, key=durations.get)
+      wall_clock = max(r["end"] for r in runs) - min(r["start"] for r in runs)
+      row = {
+          "task_id": task_id,
+          "name": runs[0]["name"],
+          "role": runs[0]["role"],
+          "hosts": len(runs),
+          "wall_clock_seconds": wall_clock,
+          "total_seconds": sum(durations.values()),
+          "max_seconds": durations[slowest_host],
+          "min_seconds": min(durations.values()),
+          "skew_seconds": durations[slowest_host] - min(durations.values()),
+          "slowest_host": slowest_host,
+      }
+      task_rows.append(row)
+      role = roles.setdefault(
+          row["role"],
+          {"role": row["role"], "tasks": 0, "wall_clock_seconds": 0.0, "total_seconds": 0.0},
+      )
+      role["tasks"] += 1
+      role["wall_clock_seconds"] += wall_clock
+      role["total_seconds"] += row["total_seconds"]
+
+    hosts = {}
+    for t in self.timings:
+      host = hosts.setdefault(t["host"], {"host": t["host"], "tasks": 0, "busy_seconds": 0.0})
+      host["tasks"] += 1
+      host["busy_seconds"] += t["end"] - t["start"]
+    least_busy = min(h["busy_seconds"] for h in hosts.values())
+    for host in hosts.values():
+      host["skew_seconds"] = host["busy_seconds"] - least_busy
+
+    path = self._critical_path()
+    path_seconds = sum(t["end"] - t["start"] for t in path)
+    return {
+        "wall_clock_seconds": (
+            max(t["end"] for t in self.timings) - min(t["start"] for t in self.timings)
+        ),
+        "roles": sorted(roles.values(), key=lambda r: r["wall_clock_seconds"], reverse=True),
+        "tasks": sorted(task_rows, key=lambda r: r["wall_clock_seconds"], reverse=True),
+        "hosts": sorted(hosts.values(), key=lambda h: h["busy_seconds"], reverse=True),
+        "critical_path": {
+            "task_seconds": path_seconds,
+            # Time between the tasks on the path, spent in the controller.
+            "overhead_seconds": (path[-1]["end"] - path[0]["start"]) - path_seconds,
+            "tasks": [
+                {
+                    "task_id": t["task_id"],
+                    "name": t["name"],
+                    "role": t["role"],
+                    "host": t["host"],
+                    "seconds": t["end"] - t["start"],
+                }
+                for t in path
+            ],
+        },
+    }
+
+  def trace(self) -> dict[str, Any]:
+    """Builds a Chrome trace-event file, viewable in chrome://tracing or Perfetto.
+
+    Returns:
+      A JSON-serializable dictionary in the trace-event format with one
+      thread per host.
+    """
+    if not self.timings:
+      return {"traceEvents": []}
+    origin = min(t["start"] for t in self.timings)
+    thread_ids = {}
+    events = []
+    for t in sorted(self.timings, key=lambda t: t["start"]):
+      tid = thread_ids.setdefault(t["host"], len(thread_ids) + 1)
+      events.append({
+          "name": t["name"],
+          "cat": t["role"] or "play",
+          "ph": "X",
+          "ts": round((t["start"] - origin) * 1e6),
+          "dur": round((t["end"] - t["start"]) * 1e6),
+          "pid": 1,
+          "tid": tid,
+          "args": {"task_id": t["task_id"], "status": t["status"]},
+      })
+    for host, tid in thread_ids.items():
+      events.append(
+          {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": host}}
+      )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+  def write(self, directory: str, execution_id: str) -> tuple[str, str]:
+    """Writes the profile report and the Chrome trace.
+
+    Args:
+      directory: Output directory, created if it does not exist.
+      execution_id: The UUID of the playbook execution, used in file names.
+
+    Returns:
+      The paths of the report and the trace file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    report_path = os.path.join(directory, f"{execution_id}.profile.json")
+    trace_path = os.path.join(directory, f"{execution_id}.trace.json")
+    with open(report_path, "w") as f:
+      json.dump(self.report(), f, indent=2)
+    with open(trace_path, "w") as f:
+      json.dump(self.trace(), f)
+    return report_path, trace_path
+
+
+def _format_metric_value(value: float) -> str:
+  """Formats a sample value, omitting the fraction of whole numbers."""
+  if float(value).is_integer():
+    return str(int(value))
+  return repr(float(value))
+
+
+def _format_metric_labels(labels: dict[str, str]) -> str:
+  """Formats labels as {name="value",...} with escaped values."""
+  if not labels:
+    return ""
+  pairs = []
+  for name, value in labels.items():
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs.append(f'{name}="{value}"')
+  return "{" + ",".join(pairs) + "}"
+
+
+class Metrics:
+  """Thread-safe registry of metrics rendered in the Prometheus text format.
+
+  Counters and histograms are declared once with their label names and then
+  updated with the label values in the same order. Function metrics read
+  their value when they are rendered, e.g. the current queue depth.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # Maps a metric name to its type, help text, label names, buckets,
+    # value function and the samples per tuple of label values.
+    self._metrics: dict[str, dict[str, Any]] = {}
+
+  def _declare(
+      self,
+      name: str,
+      kind: str,
+      help_text: str,
+      labelnames: tuple[str, ...] = (),
+      buckets: tuple[float, ...] = (),
+      fn: Optional[Any] = None,
+  ) -> None:
+    with self._lock:
+      self._metrics.setdefault(
+          name,
+          {
+              "type": kind,
+              "help": help_text,
+              "labelnames": tuple(labelnames),
+              "buckets": tuple(sorted(buckets)),
+              "fn": fn,
+              "samples": {},
+          },
+      )
+
+  def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+    """Declares a counter."""
+    self._declare(name, "counter", help_text, labelnames)
+
+  def histogram(
+      self,
+      name: str,
+      help_text: str,
+      buckets: tuple[float, ...],
+      labelnames: tuple[str, ...] = (),
+  ) -> None:
+    """Declares a histogram with the given upper bucket bounds."""
+    self._declare(name, "histogram", help_text, labelnames, buckets=buckets)
+
+  def function(self, name: str, kind: str, help_text: str, fn: Any) -> None:
+    """Declares an unlabelled counter or gauge whose value is returned by fn."""
+    self._declare(name, kind, help_text, fn=fn)
+
+  def inc(self, name: str, labels: tuple[str, ...] = (), value: float = 1) -> None:
+    """Adds value to the counter sample with the given label values."""
+    with self._lock:
+      samples = self._metrics[name]["samples"]
+      samples[labels] = samples.get(labels, 0) + value
+
+  def observe(self, name: str, value: float, labels: tuple[str, ...] = ()) -> None:
+    """Records value in the histogram sample with the given label values."""
+    with self._lock:
+      metric = self._metrics[name]
+      buckets = metric["buckets"]
+      # Per-bucket counts followed by the sum and the count of all values.
+      sample = metric["samples"].get(labels)
+      if sample is None:
+        sample = metric["samples"][labels] = [0] * len(buckets) + [0, 0]
+      i = bisect.bisect_left(buckets, value)
+      if i < len(buckets):
+        sample[i] += 1
+      sample[-2] += value
+      sample[-1] += 1
+
+  def render(self) -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    with self._lock:
+      for name, metric in self._metrics.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        if metric["fn"] is not None:
+          lines.append(f"{name} {_format_metric_value(metric['fn']())}")
+          continue
+        for values, sample in sorted(metric["samples"].items()):
+          labels = dict(zip(metric["labelnames"], values))
+          if metric["type"] != "histogram":
+            lines.append(f"{name}{_format_metric_labels(labels)} {_format_metric_value(sample)}")
+            continue
+          cumulative = 0
+          for bound, count in zip(metric["buckets"], sample):
+            cumulative += count
+            bucket_labels = dict(labels, le=_format_metric_value(bound))
+            lines.append(f"{name}_bucket{_format_metric_labels(bucket_labels)} {cumulative}")
+          bucket_labels = dict(labels, le="+Inf")
+          lines.append(f"{name}_bucket{_format_metric_labels(bucket_labels)} {sample[-1]}")
+          lines.append(f"{name}_sum{_format_metric_labels(labels)} {_format_metric_value(sample[-2])}")
+          lines.append(f"{name}_count{_format_metric_labels(labels)} {sample[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+  """Answers GET /metrics with the metrics registry of the server."""
+
+  def do_GET(self):
+    if self.path.split("?", 1)[0] != "/metrics":
+      self.send_error(404)
+      return
+    body = self.server.metrics.render().encode("utf-8")
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    # Scrapes must not clutter the Ansible output.
+    pass
+
+
+class MetricsServer:
+  """Serves a Metrics registry over HTTP from a background thread.
+
+  Attributes:
+    port: The port the server listens on, useful if it was created with port 0.
+  """
+
+  def __init__(self, metrics: Metrics, address: str = "127.0.0.1", port: int = 0):
+    """Binds the server socket.
+
+    Args:
+      metrics: The registry to serve on /metrics.
+      address: Address to listen on.
+      port: Port to listen on, 0 picks a free port.
+
+    Raises:
+      OSError: If the socket cannot be bound.
+    """
+    self.server = http.server.ThreadingHTTPServer((address, port), _MetricsHandler)
+    self.server.daemon_threads = True
+    self.server.metrics = metrics
+    self.port = self.server.server_address[1]
+    self.thread = threading.Thread(
+        target=self.server.serve_forever, name="cloud-logging-metrics", daemon=True
+    )
+
+  def start(self) -> None:
+    """Starts serving requests."""
+    self.thread.start()
+
+  def close(self) -> None:
+    """Stops serving requests and closes the socket."""
+    if self.thread.is_alive():
+      self.server.shutdown()
+    self.server.server_close()
 
 
 class CallbackModule(callback.CallbackBase):
@@ -374,10 +1981,14 @@ class CallbackModule(callback.CallbackBase):
         limit="",
         env={},
     )
-    # self.tasks is a dictionary of tasks where key is (host, task_id).
-    # We use (host, task_id) for identifying a task because a task with
-    # the same ID can run on multiple hosts.
+    # self.tasks is a dictionary of running tasks where key is
+    # (host, task_id). We use (host, task_id) for identifying a task because a
+    # task with the same ID can run on multiple hosts. Entries are removed
+    # once the task end message has been sent.
     self.tasks = {}
+    # self.loops holds the LoopAggregator of every running looped task, keyed
+    # like self.tasks.
+    self.loops = {}
     # The DOCUMENTATION string works as default for the options specified
     # here.
     self.set_options()
@@ -391,15 +2002,58 @@ class CallbackModule(callback.CallbackBase):
     )
     # The optional deployment_name is passed in by Terraform.
     self.deployment_name = os.environ.get("DEPLOYMENT_NAME", "UNSET_DEPLOYMENT_NAME")
+    self.profile_dir = self.get_option("profile_dir")
+    self.profiler = TaskProfiler() if self.profile_dir else None
+    self.loop_events = self.get_option("loop_events")
+    self.metrics_port = int(self.get_option("metrics_port"))
+    self.metrics = None
+    self.metrics_server = None
+    if self.metrics_port:
+      self.metrics = Metrics()
+      self.metrics.counter(
+          "ansible_tasks_total",
+          "Number of finished tasks per role, host and status.",
+          ("role", "host", "status"),
+      )
+      self.metrics.histogram(
+          "ansible_task_duration_seconds",
+          "Duration of finished tasks per role and host.",
+          TASK_DURATION_BUCKETS,
+          ("role", "host"),
+      )
 
     self.logging_collector = CloudLoggingCollector(
-        project=self.project,
+        project=self.project or "",
         log_name=self.log_name,
         enable_async_logging=self.enable_async_logging,
         ignore_gcp_api_errors=self.ignore_gcp_api_errors,
+        batch_max_entries=int(self.get_option("batch_max_entries")),
+        batch_max_bytes=int(self.get_option("batch_max_bytes")),
+        batch_linger_ms=int(self.get_option("batch_linger_ms")),
+        sender_workers=int(self.get_option("sender_workers")),
+        queue_max_size=int(self.get_option("queue_max_size")),
+        overflow_policy=self.get_option("queue_overflow_policy"),
+        shutdown_timeout=float(self.get_option("shutdown_timeout")),
+        spool_path=os.path.join(
+            os.path.expanduser(self.get_option("spool_dir")), f"{self.id}.jsonl"
+        ),
+        sinks=self._build_sinks(),
+        metrics=self.metrics,
     )
     self.logging_collector.start_consuming()
 
+    if self.metrics is not None:
+      try:
+        self.metrics_server = MetricsServer(
+            self.metrics, self.get_option("metrics_address"), self.metrics_port
+        )
+      except OSError as e:
+        self._display.warning(
+            f"Cloud Logging: cannot serve metrics on port {self.metrics_port}: {e}"
+        )
+      else:
+        self.metrics_server.start()
+
     if self.print_uuid:
       # We register the _print_uuid function with atexit, because we want to
       # ensure that this function gets called at the end of the whole Ansible
@@ -427,6 +2081,49 @@ class CallbackModule(callback.CallbackBase):
         task_keys=task_keys, var_options=var_options, direct=direct
     )
 
+  def _build_sinks(self) -> list[LogSink]:
+    """Creates the sinks selected by the sinks option.
+
+    Returns:
+      The sinks in the order they are listed in the option.
+
+    Raises:
+      AnsibleRequiredOptionError: If a selected sink misses a required option.
+    """
+    sinks = []
+    for name in self.get_option("sinks"):
+      if name == "cloud_logging":
+        if not self.project:
+          raise AnsibleRequiredOptionError(
+              "The 'project' option is required for the cloud_logging sink."
+          )
+        sinks.append(
+            CloudLoggingSink(
+                max_retries=int(self.get_option("max_retries")),
+                retry_base_delay=float(self.get_option("retry_base_delay")),
+                retry_max_delay=float(self.get_option("retry_max_delay")),
+                compress_requests=convert_bool.boolean(self.get_option("compress_requests")),
+                compress_min_bytes=int(self.get_option("compress_min_bytes")),
+            )
+        )
+      elif name == "file":
+        sinks.append(
+            JsonlFileSink(
+                os.path.expanduser(self.get_option("sink_file_path")),
+                max_bytes=int(self.get_option("sink_file_max_bytes")),
+                backup_count=int(self.get_option("sink_file_backup_count")),
+            )
+        )
+      elif name == "stdout":
+        sinks.append(StdoutSink())
+      elif name == "unix_socket":
+        if not self.get_option("sink_socket_path"):
+          raise AnsibleRequiredOptionError(
+              "The 'sink_socket_path' option is required for the unix_socket sink."
+          )
+        sinks.append(UnixSocketSink(os.path.expanduser(self.get_option("sink_socket_path"))))
+    return sinks
+
   def _time_now(self) -> str:
     """Returns the current ISO 8601 timestamp for the UTC timezone.
 
@@ -464,28 +2161,104 @@ class CallbackModule(callback.CallbackBase):
     """
     host = result._host
     task = result._task
-
-    result_data = result._result.copy()
-    # Replace results that exceed Cloud Logging's 256KB payload limit with a warning
-    serialized = json.dumps(result_data)
-    if len(serialized.encode('utf-8')) > MAX_RESULT_SIZE:
-        result_data = {
-            "warning": f"Result omitted because it exceeded {MAX_RESULT_SIZE} bytes",
-        }
-    self.tasks[(host.get_name(), task._uuid)]["result"] = result_data
-    self.tasks[(host.get_name(), task._uuid)]["end_time"] = self._time_now()
-    self.tasks[(host.get_name(), task._uuid)]["status"] = status
+    # The task end message is only needed until it has been handed to the
+    # collector, so it is removed from self.tasks here. Otherwise every result
+    # of a long multi-host run would stay in memory until the playbook ends.
+    # Only the compact TaskTiming record is kept for the profile.
+    t = self.tasks.pop((host.get_name(), task._uuid), None)
+    loop = self.loops.pop((host.get_name(), task._uuid), None)
+    if t is None:
+      return
+    if loop is not None:
+      t["loop"] = loop.summary()
+
+    result_data = result._result
+    # Serialize once and keep the bytes for the request body. Results that
+    # exceed Cloud Logging's 256KB payload limit are truncated.
+    t["result"] = _encode_result(result_data)
+    t["end_time"] = self._time_now()
+    t["status"] = status
      # Setting WLM fields
     if status == "failed":
-      self.tasks[(host.get_name(), task._uuid)]["state"] = "failed"
-      self.tasks[(host.get_name(), task._uuid)]["error_message"] = result_data.get("stderr") or result_data.get("msg") or "No error message found in result (neither 'stderr' nor 'msg' present)."
+      t["state"] = "failed"
+      t["error_message"] = _truncate_value(result_data.get("stderr") or result_data.get("msg")) or "No error message found in result (neither 'stderr' nor 'msg' present)."
     elif status == "unreachable":
-      self.tasks[(host.get_name(), task._uuid)]["state"] = "failed"
-      self.tasks[(host.get_name(), task._uuid)]["error_message"] = "unreachable host"
+      t["state"] = "failed"
+      t["error_message"] = "unreachable host"
     elif status == "ok" or status == "skipped":
-      self.tasks[(host.get_name(), task._uuid)]["state"] = "success"
+      t["state"] = "success"
+
+    if self.profiler is not None or self.metrics is not None:
+      timing = TaskTiming(
+          task_id=task._uuid,
+          name=t["name"],
+          role=task._role.get_name() if task._role else "",
+          host=host.get_name(),
+          start=datetime.datetime.fromisoformat(t["start_time"]).timestamp(),
+          end=datetime.datetime.fromisoformat(t["end_time"]).timestamp(),
+          status=status,
+      )
+      if self.profiler is not None:
+        self.profiler.record(timing)
+      if self.metrics is not None:
+        self.metrics.inc("ansible_tasks_total", (timing["role"], timing["host"], status))
+        self.metrics.observe(
+            "ansible_task_duration_seconds",
+            timing["end"] - timing["start"],
+            (timing["role"], timing["host"]),
+        )
+
+    self.logging_collector.send(t)
+
+  def _store_item_result(
+      self, result: ansible.executor.task_result.TaskResult, status: str
+  ) -> None:
+    """Helper function to record the result of one loop item.
+
+    The item is added to the loop summary of its task. With loop_events set
+    to items, it is also sent as its own log entry.
 
-    self.logging_collector.send(self.tasks[(host.get_name(), task._uuid)])
+    Args:
+      result: The result object of type ansible.executor.result.Result
+      status: The status of the item (ok, failed, skipped)
+    """
+    host = result._host
+    task = result._task
+    key = (host.get_name(), task._uuid)
+    t = self.tasks.get(key)
+    if t is None:
+      return
+    loop = self.loops.get(key)
+    if loop is None:
+      loop = self.loops[key] = LoopAggregator(
+          datetime.datetime.fromisoformat(t["start_time"]).timestamp()
+      )
+    label = self._get_item_label(result._result)
+    if not isinstance(label, str):
+      label = json.dumps(label, separators=_JSON_SEPARATORS, default=str)
+    label = _truncate_value(label, MAX_ITEM_LABEL_SIZE)
+    end_time = datetime.datetime.now(datetime.timezone.utc)
+    start, duration = loop.add(label, status, end_time.timestamp())
+    if self.loop_events != "items":
+      return
+    self.logging_collector.send(
+        PlaybookTaskItemMessage(
+            id=self.id,
+            event_type="PLAYBOOK_TASK_ITEM",
+            task_id=task._uuid,
+            name=task.get_name(),
+            host=host.get_name(),
+            item=label,
+            start_time=datetime.datetime.fromtimestamp(
+                start, datetime.timezone.utc
+            ).isoformat(),
+            end_time=end_time.isoformat(),
+            duration_seconds=round(duration, 3),
+            status=status,
+            result=_encode_result(result._result),
+            deployment_name=self.deployment_name,
+        )
+    )
 
   def v2_playbook_on_start(self, playbook: ansible.playbook.Playbook) -> None:
     """Plugin function that gets called when a playbook starts.
@@ -548,6 +2321,7 @@ class CallbackModule(callback.CallbackBase):
             name=task.get_name(),
             host=host.get_name(),
             start_time=time_now,
+            handler=isinstance(task, Handler),
             # WLM fields
             state="task_start",
             deployment_name=self.deployment_name,
@@ -573,6 +2347,7 @@ class CallbackModule(callback.CallbackBase):
         timestamp="",
         deployment_name="",
         error_message="",
+        handler=isinstance(task, Handler),
     )
     t["id"] = self.id
     t["task_id"] = task._uuid
@@ -625,6 +2400,56 @@ class CallbackModule(callback.CallbackBase):
     """
     self._store_result_in_task(result, "unreachable")
 
+  def v2_runner_item_on_ok(
+      self, result: ansible.executor.task_result.TaskResult
+  ) -> None:
+    """Plugin function that gets called when a loop item succeeds.
+
+    Args:
+      result: The result object of type ansible.executor.result.Result
+    """
+    self._store_item_result(result, "ok")
+
+  def v2_runner_item_on_failed(
+      self, result: ansible.executor.task_result.TaskResult
+  ) -> None:
+    """Plugin function that gets called when a loop item fails.
+
+    Args:
+      result: The result object of type ansible.executor.result.Result
+    """
+    self._store_item_result(result, "failed")
+
+  def v2_runner_item_on_skipped(
+      self, result: ansible.executor.task_result.TaskResult
+  ) -> None:
+    """Plugin function that gets called when a loop item is skipped.
+
+    Args:
+      result: The result object of type ansible.executor.result.Result
+    """
+    self._store_item_result(result, "skipped")
+
+  def v2_playbook_on_notify(
+      self, handler: ansible.playbook.handler.Handler, host: ansible.inventory.host.Host
+  ) -> None:
+    """Plugin function that gets called when a task notifies a handler.
+
+    Args:
+      handler: The notified handler of type ansible.playbook.handler.Handler
+      host: The host object of type ansible.host.host
+    """
+    self.logging_collector.send(
+        PlaybookHandlerNotifyMessage(
+            id=self.id,
+            event_type="PLAYBOOK_HANDLER_NOTIFY",
+            name=handler.get_name(),
+            host=host.get_name(),
+            timestamp=self._time_now(),
+            deployment_name=self.deployment_name,
+        )
+    )
+
   def v2_playbook_on_stats(
       self, stats: ansible.executor.stats.AggregateStats
   ) -> None:
@@ -675,6 +2500,76 @@ class CallbackModule(callback.CallbackBase):
     }
     msg["file_name"] = self.start_msg["file_name"]
     self.logging_collector.send(msg)
-    if self.enable_async_logging:
-      self.logging_collector.send(None)
-      self.logging_collector.wait()
+    if self.profiler is not None:
+      report_path, trace_path = self.profiler.write(
+          os.path.expanduser(self.profile_dir), self.id
+      )
+      self._display.display(
+          f"Task profile written to {report_path}, Chrome trace written to {trace_path}"
+      )
+    self.logging_collector.wait()
+    if self.metrics_server is not None:
+      self.metrics_server.close()
+    self.logging_collector.check_fatal_error()
+    if self.logging_collector.dropped:
+      self._display.warning(
+          f"Cloud Logging: dropped {self.logging_collector.dropped} log messages"
+      )
+    if self.logging_collector.spilled:
+      self._display.warning(
+          f"Cloud Logging: spilled {self.logging_collector.spilled} log messages"
+          f" to {self.logging_collector.spool.path}"
+      )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+  """Replays spool files of log entries that could not be sent.
+
+  Run with the same Python interpreter as Ansible, for example:
+
+    python3 tools/callback_plugins/ansible_cloud_logging.py \
+      ~/.ansible/cloud_logging_spool/<execution UUID>.jsonl
+
+  Args:
+    argv: Command line arguments, defaults to sys.argv[1:].
+
+  Returns:
+    0 if every entry was sent, 1 otherwise.
+  """
+  parser = argparse.ArgumentParser(
+      description="Replay spooled Ansible Cloud Logging entries."
+  )
+  parser.add_argument("spool_files", nargs="+", help="Spool files to replay")
+  parser.add_argument(
+      "--max-retries", type=int, default=5, help="Retries per batch"
+  )
+  parser.add_argument(
+      "--compress", action="store_true", help="gzip-compress request bodies"
+  )
+  args = parser.parse_args(argv)
+
+  try:
+    sink = CloudLoggingSink(
+        max_retries=args.max_retries, compress_requests=args.compress
+    )
+  except ImportError as e:
+    parser.error(str(e))
+  # Spooled entries already carry their logName, so no project is needed.
+  collector = CloudLoggingCollector(
+      project="",
+      log_name="",
+      enable_async_logging=False,
+      ignore_gcp_api_errors=True,
+      sinks=[sink],
+  )
+  exit_code = 0
+  for path in args.spool_files:
+    sent, failed = collector.replay(path)
+    print(f"{path}: sent {sent} entries, {failed} failed")
+    if failed:
+      exit_code = 1
+  return exit_code
+
+
+if __name__ == "__main__":
+  sys.exit(main())
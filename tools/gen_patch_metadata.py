@@ -3,12 +3,18 @@
 """
 import argparse
 import base64
+import codecs
+import concurrent.futures
 import getpass
 import hashlib
+import html.parser
+import json
 import logging
 import os
 import re
-import shutil
+import sys
+import threading
+import time
 import typing
 import urllib
 import zipfile
@@ -20,6 +26,27 @@ USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 SEARCH_FORM = 'https://updates.oracle.com/Orion/SimpleSearch/process_form?search_type=patch&patch_number=%d&plat_lang=226P'
 DOWNLOAD_URL = r'https://updates[.]oracle[.]com/Orion/Download/process_form[^\"]*'
 LOGIN_FORM = r'https://updates[.]oracle[.]com/Orion/SavedSearches/switch_to_simple'
+# Patch zips are downloaded in ranges of DOWNLOAD_CHUNK_SIZE bytes over
+# DOWNLOAD_CONNECTIONS connections. Completed ranges are recorded next to the
+# partial file, so that an interrupted download resumes where it stopped.
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+READ_SIZE = 1024 * 1024
+# Blocks that arrive ahead of the hashed part of a download are kept in memory
+# up to this size; beyond it they are read back from the finished file.
+HASH_BUFFER_SIZE = 256 * 1024 * 1024
+# The digests of a downloaded file are kept in <file>.digests.json, valid while
+# the size and modification time of the file are unchanged.
+DIGESTS_SUFFIX = '.digests.json'
+# Patches are resolved to download URLs by up to URL_WORKERS concurrent searches.
+URL_WORKERS = 8
+OPATCH_PATCHNUM = 6880880
+# READMEs are read in blocks of TITLE_READ_SIZE bytes until their title ends.
+TITLE_READ_SIZE = 16 * 1024
+GI_PATCHES_FILE = 'roles/common/defaults/main/gi_patches.yml'
+RDBMS_PATCHES_FILE = 'roles/common/defaults/main/rdbms_patches.yml'
 
 def get_patch_auth(s: requests.Session) -> typing.List[str]:
     """Obtains auth for login in order to download patches."""
@@ -40,13 +67,228 @@ def get_patch_url(s: requests.Session, patchnum: int) -> typing.List[str]:
     assert url, f'Could not get a download URL from the patch form {SEARCH_FORM}; is the patch number correct?'
     return url
 
-def download_patch(s: requests.Session, url: str, patch_file: str) -> None:
-    """Downloads a given URL to a local file."""
+class _Progress:
+    """Reports the progress of a download at most once per second."""
+
+    def __init__(self, name: str, total: typing.Optional[int], done: int = 0):
+        self.name, self.total, self.done = name, total, done
+        self.start, self.last = time.monotonic(), 0.0
+        self.lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self.lock:
+            self.done += count
+            now = time.monotonic()
+            if now - self.last < 1 and self.done != self.total:
+                return
+            self.last = now
+            rate = self.done / max(now - self.start, 1e-3) / 1024 / 1024
+            if self.total:
+                line = f'{self.name}: {self.done * 100 // self.total}% of {self.total / 1024 / 1024:.0f} MiB, {rate:.1f} MiB/s'
+            else:
+                line = f'{self.name}: {self.done / 1024 / 1024:.0f} MiB, {rate:.1f} MiB/s'
+            if sys.stderr.isatty():
+                print('\r' + line, end='\n' if self.done == self.total else '', file=sys.stderr, flush=True)
+            else:
+                logging.info(line)
+
+class Digests(typing.NamedTuple):
+    md5: str     # base64, the form of the md5sum fields
+    sha256: str  # hex, the form of the sha256sum fields
+
+class _StreamHasher:
+    """Hashes the blocks of a download in file order, whatever order they arrive in."""
+
+    def __init__(self):
+        self.md5, self.sha256 = hashlib.md5(), hashlib.sha256()
+        self.offset = 0
+        self.pending = {}
+        self.pending_size = 0
+        self.lock = threading.Lock()
+
+    def _hash(self, block: bytes) -> None:
+        self.md5.update(block)
+        self.sha256.update(block)
+        self.offset += len(block)
+
+    def add(self, offset: int, block: bytes) -> None:
+        with self.lock:
+            if offset != self.offset:
+                if self.pending_size + len(block) <= HASH_BUFFER_SIZE:
+                    self.pending[offset] = block
+                    self.pending_size += len(block)
+                return
+            self._hash(block)
+            while self.offset in self.pending:
+                block = self.pending.pop(self.offset)
+                self.pending_size -= len(block)
+                self._hash(block)
+
+    def finish(self, path: str, size: int) -> Digests:
+        """Hashes what was not added in order, e.g. ranges of an earlier run, from the file."""
+        with self.lock:
+            if self.offset < size:
+                self._read_back(path, size)
+            self.pending.clear()
+        return Digests(base64.b64encode(self.md5.digest()).decode('ascii'), self.sha256.hexdigest())
+
+    def _read_back(self, path: str, size: int) -> None:
+        with open(path, 'rb') as f:
+            while self.offset < size:
+                block = self.pending.pop(self.offset, None)
+                if block is None:
+                    f.seek(self.offset)
+                    block = f.read(min([o for o in self.pending if o > self.offset] + [size, self.offset + READ_SIZE]) - self.offset)
+                    if not block:
+                        raise RuntimeError(f'{path} is shorter than {size} bytes')
+                self._hash(block)
+
+def _cached_digests(path: str) -> typing.Optional[Digests]:
+    """Returns the digests recorded for a file if it did not change since."""
+    try:
+        stat = os.stat(path)
+        with open(path + DIGESTS_SUFFIX) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cached.get('size'), cached.get('mtime_ns')) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return Digests(cached['md5'], cached['sha256'])
+
+def _save_digests(path: str, digests: Digests) -> None:
+    stat = os.stat(path)
+    try:
+        with open(path + DIGESTS_SUFFIX, 'w') as f:
+            json.dump(dict(digests._asdict(), size=stat.st_size, mtime_ns=stat.st_mtime_ns), f)
+    except OSError as e:
+        # e.g. a read-only mirror; the digests are computed again next time.
+        logging.warning('Cannot record the digests of %s: %s', path, e)
+
+def file_digests(path: str) -> Digests:
+    """Returns the digests of a file, reading it only if they are not recorded yet."""
+    digests = _cached_digests(path)
+    if digests is None:
+        digests = _StreamHasher().finish(path, os.path.getsize(path))
+        _save_digests(path, digests)
+    return digests
+
+def _probe(s: requests.Session, url: str) -> (str, typing.Optional[int], bool):
+    """Returns the URL after redirects, the size of the file and whether the server accepts ranges."""
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            with s.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+                r.raise_for_status()
+                m = re.match(r'bytes 0-0/(\d+)$', r.headers.get('Content-Range', ''))
+                if r.status_code == 206 and m:
+                    return r.url, int(m.group(1)), True
+                size = r.headers.get('Content-Length')
+                return r.url, int(size) if size else None, False
+        except requests.RequestException as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            logging.warning('Request for %s failed (attempt %d): %s', url, attempt + 1, e)
+            time.sleep(min(2 ** attempt, 30))
+
+def _download_range(s: requests.Session, url: str, fd: int, start: int, end: int, progress: _Progress,
+                    hasher: _StreamHasher) -> None:
+    """Writes bytes start to end, inclusive, of url to fd, resuming the range after a failure."""
+    offset = start
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            with s.get(url, headers={'Range': f'bytes={offset}-{end}'}, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+                if r.status_code != 206:
+                    raise requests.HTTPError(f'Got HTTP code {r.status_code} for bytes {offset}-{end}', response=r)
+                for block in r.iter_content(READ_SIZE):
+                    block = block[:end + 1 - offset]
+                    os.pwrite(fd, block, offset)
+                    hasher.add(offset, block)
+                    offset += len(block)
+                    progress.add(len(block))
+            if offset > end:
+                return
+            logging.debug('Got %d of %d bytes of range %d-%d', offset - start, end + 1 - start, start, end)
+        except requests.RequestException as e:
+            logging.warning('Download of bytes %d-%d failed (attempt %d): %s', offset, end, attempt + 1, e)
+        time.sleep(min(2 ** attempt, 30))
+    raise RuntimeError(f'Could not download bytes {start}-{end} of {url} after {DOWNLOAD_RETRIES + 1} attempts')
+
+def _download_ranges(s: requests.Session, url: str, part_file: str, size: int, connections: int, chunk_size: int,
+                     hasher: _StreamHasher) -> None:
+    """Downloads the missing chunks of part_file over several connections."""
+    state_file = part_file + '.json'
+    state = {'size': size, 'chunk_size': chunk_size, 'done': []}
+    if os.path.exists(part_file) and os.path.exists(state_file):
+        with open(state_file) as f:
+            saved = json.load(f)
+        if (saved.get('size'), saved.get('chunk_size')) == (size, chunk_size):
+            state = saved
+    done = set(state['done'])
+    chunks = [(i, i * chunk_size, min((i + 1) * chunk_size, size) - 1) for i in range((size + chunk_size - 1) // chunk_size)]
+    missing = [c for c in chunks if c[0] not in done]
+    if done:
+        logging.info('Resuming %s: %d of %d chunks already downloaded', part_file, len(done), len(chunks))
+    progress = _Progress(os.path.basename(part_file[:-len('.part')]), size, size - sum(e + 1 - b for _, b, e in missing))
+    lock = threading.Lock()
+
+    def fetch(chunk):
+        index, start, end = chunk
+        _download_range(s, url, fd, start, end, progress, hasher)
+        with lock:
+            done.add(index)
+            state['done'] = sorted(done)
+            with open(state_file + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(state_file + '.tmp', state_file)
+
+    fd = os.open(part_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=connections) as executor:
+            for future in [executor.submit(fetch, c) for c in missing]:
+                future.result()
+    finally:
+        os.close(fd)
+    os.remove(state_file)
+
+def download_patch(s: requests.Session, url: str, patch_file: str, connections: int = DOWNLOAD_CONNECTIONS,
+                   chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Digests:
+    """Downloads a given URL to a local file and returns the digests of the file.
+
+    The digests are computed while the file is downloaded. A complete file is
+    not downloaded again, and a partial download resumes from the ranges it
+    completed before.
+    """
+    digests = _cached_digests(patch_file)
+    if digests is not None:
+        logging.info('%s is already downloaded', patch_file)
+        return digests
+    url, size, ranges = _probe(s, url)
+    prefix = '{0.scheme}://{0.netloc}/'.format(urllib.parse.urlparse(url))
+    s.mount(prefix, requests.adapters.HTTPAdapter(max_retries=3, pool_maxsize=max(connections, 10)))
+    if size is not None and os.path.exists(patch_file) and os.path.getsize(patch_file) == size:
+        logging.info('%s is already downloaded', patch_file)
+        return file_digests(patch_file)
+
     logging.info('Downloading %s', url)
-    s.mount(url, requests.adapters.HTTPAdapter(max_retries=3))
-    with s.get(url, stream=True) as r:
-        with open(patch_file, 'wb') as f:
-            shutil.copyfileobj(r.raw, f)
+    part_file = patch_file + '.part'
+    hasher = _StreamHasher()
+    if ranges:
+        _download_ranges(s, url, part_file, size, connections, chunk_size, hasher)
+    else:
+        # Without range support, the download can only start over.
+        progress = _Progress(os.path.basename(patch_file), size)
+        with s.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as r, open(part_file, 'wb') as f:
+            r.raise_for_status()
+            for block in r.iter_content(READ_SIZE):
+                f.write(block)
+                hasher.add(hasher.offset, block)
+                progress.add(len(block))
+    if size is not None and os.path.getsize(part_file) != size:
+        raise RuntimeError(f'Downloaded {os.path.getsize(part_file)} bytes of {url}, expected {size}')
+    digests = hasher.finish(part_file, os.path.getsize(part_file))
+    os.replace(part_file, patch_file)
+    _save_digests(patch_file, digests)
+    return digests
 
 def get_min_opatch_version(op_patch_file: str) -> str:
     """Extracts numeric version from version.txt in OPatch zip."""
@@ -60,6 +302,50 @@ def get_min_opatch_version(op_patch_file: str) -> str:
             logging.warning('Could not find OPatch/version.txt in %s', op_patch_file)
             return "unknown"
 
+class _TitleParser(html.parser.HTMLParser):
+    """Collects the text of the first title element of an HTML document."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts, self.in_title, self.done = [], False, False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and not self.done:
+            self.in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self.in_title:
+            self.in_title, self.done = False, True
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.parts.append(data)
+
+def readme_title(z: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    """Returns the title of a README in a patch zip, or its doctitle meta tag if it has none.
+
+    The README is decompressed and parsed incrementally until the end of its
+    title element. Only a README without a non-empty title is parsed in full.
+    """
+    parser = _TitleParser()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with z.open(info) as f:
+        for block in iter(lambda: f.read(TITLE_READ_SIZE), b''):
+            parser.feed(decoder.decode(block))
+            if parser.done:
+                break
+    title = ''.join(parser.parts).strip()
+    if title:
+        return title
+
+    with z.open(info) as f:
+        c = bs4.BeautifulSoup(f.read(), 'lxml')
+    title = c.find('title').get_text().strip() if c.find('title') else ""
+    if not title:
+        meta_title = c.find('meta', attrs={'name': 'doctitle'})
+        title = meta_title['content'] if meta_title else ""
+    return title
+
 def parse_patch(patch_file: str, patchnum: int) -> (str, str, str, str, str, bool):
     """Parses patch metadata and identifies subdirectories."""
     is_gi = False
@@ -74,24 +360,22 @@ def parse_patch(patch_file: str, patchnum: int) -> (str, str, str, str, str, boo
             release = release_tag['name'] if release_tag else "unknown"
 
         gi_subdir, ojvm_subdir, db_subdir = None, None, None
-        for fname in z.namelist():
-            m = re.search(fr'^{patchnum}/(\d+)/README.html', fname)
+        # The central directory is read once by ZipFile; only the README
+        # members of the patch subdirectories are opened.
+        readme = re.compile(fr'{patchnum}/(\d+)/README.html')
+        for info in z.infolist():
+            m = readme.match(info.filename)
             if m:
                 subdir_candidate = m.group(1)
-                with z.open(fname) as f:
-                    c = bs4.BeautifulSoup(f.read(), 'lxml')
-                    title = c.find('title').get_text().strip() if c.find('title') else ""
-                    if not title:
-                        meta_title = c.find('meta', attrs={'name': 'doctitle'})
-                        title = meta_title['content'] if meta_title else ""
-                    logging.debug('Inspecting subdir %s with title: "%s"', subdir_candidate, title)
-
-                    if any(x in title for x in ['JavaVM', 'OJVM']):
-                        ojvm_subdir = subdir_candidate
-                    elif any(x in title for x in ['GI ', 'Grid Infrastructure', 'GI Release Update']):
-                        gi_subdir = subdir_candidate
-                    elif 'Database' in title and ('Release Update' in title or '% product_version %' in title):
-                        db_subdir = subdir_candidate
+                title = readme_title(z, info)
+                logging.debug('Inspecting subdir %s with title: "%s"', subdir_candidate, title)
+
+                if any(x in title for x in ['JavaVM', 'OJVM']):
+                    ojvm_subdir = subdir_candidate
+                elif any(x in title for x in ['GI ', 'Grid Infrastructure', 'GI Release Update']):
+                    gi_subdir = subdir_candidate
+                elif 'Database' in title and ('Release Update' in title or '% product_version %' in title):
+                    db_subdir = subdir_candidate
 
     if gi_subdir or "GI RELEASE UPDATE" in abstract.upper():
         is_gi = True
@@ -105,32 +389,26 @@ def parse_patch(patch_file: str, patchnum: int) -> (str, str, str, str, str, boo
     logging.debug('Final selection - GI: %s, DB: %s, OJVM: %s. is_gi: %s', gi_subdir, db_subdir, ojvm_subdir, is_gi)
     return (release, patch_release, ojvm_subdir, gi_subdir, db_subdir, is_gi)
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument('--patch', type=int, help='Patch number', required=True)
-    ap.add_argument('--mosuser', type=str, help='MOS username', required=True)
-    ap.add_argument('--debug', help='Debug logging', action=argparse.BooleanOptionalAction)
-    args = ap.parse_args()
-    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+def patch_file_name(url: str) -> str:
+    """Returns the file name of a patch download URL."""
+    return urllib.parse.parse_qs(urllib.parse.urlparse(url).query)['patch_file'][0]
 
-    s = requests.Session()
-    s.headers.update({'User-Agent': USER_AGENT})
-    s.auth = (args.mosuser, getpass.getpass(prompt='MOS Password: '))
+def major_version(patch_file: str) -> str:
+    """Returns the major version of a patch file name, e.g. 19000 of p123_190000_Linux-x86-64.zip."""
+    return os.path.basename(patch_file).split('_')[1][:5]
 
-    url_list = get_patch_url(s, args.patch)
-    patch_file = urllib.parse.parse_qs(urllib.parse.urlparse(url_list[0]).query)['patch_file'][0]
-    
-    if not (os.path.exists(patch_file) and os.path.getsize(patch_file) > 100*1024*1024):
-        download_patch(s, url_list[0], patch_file)
+def patch_number(patch_file: str) -> int:
+    """Returns the patch number of a patch file name, e.g. 123 of p123_190000_Linux-x86-64.zip."""
+    m = re.match(r'p(\d+)_\d+_', os.path.basename(patch_file))
+    if not m:
+        raise ValueError(f'Cannot derive a patch number from the file name {patch_file}')
+    return int(m.group(1))
 
-    md5 = hashlib.md5()
-    with open(patch_file, 'rb') as f:
-        while chunk := f.read(1024*1024):
-            md5.update(chunk)
-    md5_digest = base64.b64encode(md5.digest()).decode('ascii')
+def patch_entries(patchnum: int, patch_file: str, md5_digest: str, metadata: tuple,
+                  min_opatch: str) -> typing.List[typing.Tuple[str, str]]:
+    """Returns the metadata entries of a patch as (target file, YAML line) pairs."""
+    (release_name, patch_release, ojvm_subdir, gi_subdir, db_subdir, is_gi) = metadata
 
-    (release_name, patch_release, ojvm_subdir, gi_subdir, db_subdir, is_gi) = parse_patch(patch_file, args.patch)
-    
     # Set base releases and flags
     is_21c = release_name.startswith('21')
     if is_21c:
@@ -142,26 +420,132 @@ def main():
         prereq_flag = 'true'
         upgrade_flag = 'true'
 
-    op_url = get_patch_url(s, 6880880)
-    major_ver = patch_file.split('_')[1][:5]
-    op_match = [k for k in op_url if major_ver in k][0]
-    op_patch_file = urllib.parse.parse_qs(urllib.parse.urlparse(op_match).query)['patch_file'][0]
-    if not os.path.exists(op_patch_file):
-        download_patch(s, op_match, op_patch_file)
-    min_opatch = get_min_opatch_version(op_patch_file)
-
+    entries = []
     if is_gi:
-        print(f"Add to roles/common/defaults/main/gi_patches.yml:")
-        print(f'  - {{ category: "RU", base: "{base_release}", release: "{patch_release}", patchnum: "{args.patch}", patchfile: "{patch_file}", patch_subdir: "/{gi_subdir if gi_subdir is not None else ""}", prereq_check: false, method: "opatchauto apply", ocm: false, upgrade: false, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}')
+        entries.append((GI_PATCHES_FILE, f'  - {{ category: "RU", base: "{base_release}", release: "{patch_release}", patchnum: "{patchnum}", patchfile: "{patch_file}", patch_subdir: "/{gi_subdir if gi_subdir is not None else ""}", prereq_check: false, method: "opatchauto apply", ocm: false, upgrade: false, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}'))
         if release_name.startswith('19') and ojvm_subdir:
-            print(f"\nAdd to roles/common/defaults/main/rdbms_patches.yml:")
-            print(f'  - {{ category: "RU_Combo", base: "{base_release}", release: "{patch_release}", patchnum: "{args.patch}", patchfile: "{patch_file}", patch_subdir: "/{ojvm_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}')
+            entries.append((RDBMS_PATCHES_FILE, f'  - {{ category: "RU_Combo", base: "{base_release}", release: "{patch_release}", patchnum: "{patchnum}", patchfile: "{patch_file}", patch_subdir: "/{ojvm_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}'))
     else:
-        print(f"Add to roles/common/defaults/main/rdbms_patches.yml:")
         if release_name.startswith('19') and ojvm_subdir:
-            print(f'  - {{ category: "DB_OJVM_RU", base: "{base_release}", release: "{patch_release}", patchnum: "{args.patch}", patchfile: "{patch_file}", patch_subdir: "/{ojvm_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}')
+            entries.append((RDBMS_PATCHES_FILE, f'  - {{ category: "DB_OJVM_RU", base: "{base_release}", release: "{patch_release}", patchnum: "{patchnum}", patchfile: "{patch_file}", patch_subdir: "/{ojvm_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}'))
         if db_subdir is not None:
-            print(f'  - {{ category: "DB_RU", base: "{base_release}", release: "{patch_release}", patchnum: "{args.patch}", patchfile: "{patch_file}", patch_subdir: "/{db_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}')
+            entries.append((RDBMS_PATCHES_FILE, f'  - {{ category: "DB_RU", base: "{base_release}", release: "{patch_release}", patchnum: "{patchnum}", patchfile: "{patch_file}", patch_subdir: "/{db_subdir}", prereq_check: {prereq_flag}, method: "opatch apply", ocm: false, upgrade: {upgrade_flag}, md5sum: "{md5_digest}", minimum_opatch: "{min_opatch}" }}'))
+    return entries
+
+def print_entries(entries: typing.List[typing.Tuple[str, str]]) -> None:
+    """Prints the entries grouped by their target file, in the order they first appear."""
+    grouped = {}
+    for target, line in entries:
+        grouped.setdefault(target, []).append(line)
+    for i, (target, lines) in enumerate(grouped.items()):
+        if i:
+            print()
+        print(f'Add to {target}:')
+        for line in lines:
+            print(line)
+
+def _collect_entries(parsed: typing.Dict[int, typing.Tuple[str, Digests, concurrent.futures.Future]],
+                     min_opatch: typing.Dict[str, str]) -> typing.List[typing.Tuple[str, str]]:
+    """Returns the entries of the patches, whose metadata is parsed in the background."""
+    entries = []
+    for patchnum, (patch_file, digests, metadata) in parsed.items():
+        entries += patch_entries(patchnum, os.path.basename(patch_file), digests.md5, metadata.result(),
+                                 min_opatch[major_version(patch_file)])
+    return entries
+
+def generate_metadata(s: requests.Session, patches: typing.List[int],
+                      connections: int = DOWNLOAD_CONNECTIONS) -> typing.List[typing.Tuple[str, str]]:
+    """Downloads and parses the given patches and returns their metadata entries.
+
+    The download URLs of the patches and of OPatch are resolved concurrently.
+    Each patch is parsed in a separate process while the next one downloads,
+    and OPatch is downloaded once for each major version among the patches.
+    """
+    patches = list(dict.fromkeys(patches))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(patches) + 1, URL_WORKERS)) as executor:
+        op_urls = executor.submit(get_patch_url, s, OPATCH_PATCHNUM)
+        urls = dict(zip(patches, executor.map(lambda patchnum: get_patch_url(s, patchnum)[0], patches)))
+        op_urls = op_urls.result()
+
+    parsed = {}
+    with concurrent.futures.ProcessPoolExecutor() as pool:
+        for patchnum in patches:
+            patch_file = patch_file_name(urls[patchnum])
+            digests = download_patch(s, urls[patchnum], patch_file, connections)
+            logging.info('%s: MD5 %s, SHA-256 %s', patch_file, digests.md5, digests.sha256)
+            parsed[patchnum] = (patch_file, digests, pool.submit(parse_patch, patch_file, patchnum))
+
+        min_opatch = {}
+        for major_ver in dict.fromkeys(major_version(patch_file) for patch_file, _, _ in parsed.values()):
+            op_match = [k for k in op_urls if major_ver in k][0]
+            op_patch_file = patch_file_name(op_match)
+            download_patch(s, op_match, op_patch_file, connections)
+            min_opatch[major_ver] = get_min_opatch_version(op_patch_file)
+
+        return _collect_entries(parsed, min_opatch)
+
+def generate_local_metadata(patch_files: typing.List[str],
+                            opatch_files: typing.List[str]) -> typing.List[typing.Tuple[str, str]]:
+    """Parses local patch zips and returns their metadata entries, without access to MOS.
+
+    The patch numbers are taken from the file names. OPatch zips among the
+    patch files serve as OPatch files unless opatch_files has one of the same
+    major version. The patches are hashed and parsed in separate processes.
+    """
+    patches, op_files = {}, {}
+    for patch_file in patch_files:
+        patchnum = patch_number(patch_file)
+        if patchnum == OPATCH_PATCHNUM:
+            op_files.setdefault(major_version(patch_file), patch_file)
+        else:
+            patches.setdefault(patchnum, patch_file)
+    # OPatch files given explicitly take precedence over those among the patches.
+    op_files.update((major_version(op_patch_file), op_patch_file) for op_patch_file in opatch_files)
+    missing = {major_version(patch_file) for patch_file in patches.values()} - set(op_files)
+    if missing:
+        raise ValueError(f'No OPatch file (p{OPATCH_PATCHNUM}_<version>_*.zip) for major versions {", ".join(sorted(missing))}')
+
+    with concurrent.futures.ProcessPoolExecutor() as pool:
+        hashing = {patchnum: pool.submit(file_digests, patch_file) for patchnum, patch_file in patches.items()}
+        parsing = {patchnum: pool.submit(parse_patch, patch_file, patchnum) for patchnum, patch_file in patches.items()}
+        min_opatch = {major_ver: get_min_opatch_version(op_files[major_ver])
+                      for major_ver in {major_version(patch_file) for patch_file in patches.values()}}
+        parsed = {}
+        for patchnum, patch_file in patches.items():
+            digests = hashing[patchnum].result()
+            logging.info('%s: MD5 %s, SHA-256 %s', patch_file, digests.md5, digests.sha256)
+            parsed[patchnum] = (patch_file, digests, parsing[patchnum])
+        return _collect_entries(parsed, min_opatch)
+
+def main():
+    ap = argparse.ArgumentParser()
+    source = ap.add_mutually_exclusive_group(required=True)
+    source.add_argument('--patch', type=int, nargs='+', help='Patch numbers, e.g. all patches of a quarterly release')
+    source.add_argument('--from-file', nargs='+', metavar='PATCH_FILE',
+                        help='Local patch zips, e.g. of a mirror directory, parsed without MOS access')
+    ap.add_argument('--opatch-file', nargs='+', default=[], metavar='OPATCH_FILE',
+                    help='Local OPatch zips, one per major version, for --from-file')
+    ap.add_argument('--mosuser', type=str, help='MOS username, required with --patch')
+    ap.add_argument('--debug', help='Debug logging', action=argparse.BooleanOptionalAction)
+    ap.add_argument('--connections', type=int, default=DOWNLOAD_CONNECTIONS, help='Connections per download')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    if args.from_file:
+        try:
+            entries = generate_local_metadata(args.from_file, args.opatch_file)
+        except ValueError as e:
+            ap.error(str(e))
+        print_entries(entries)
+        return
+    if not args.mosuser:
+        ap.error('--mosuser is required with --patch')
+
+    s = requests.Session()
+    s.headers.update({'User-Agent': USER_AGENT})
+    s.auth = (args.mosuser, getpass.getpass(prompt='MOS Password: '))
+
+    print_entries(generate_metadata(s, args.patch, args.connections))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,1113 @@
+import gzip
+import http.server
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+import requests
+import yaml
+
+# The tests live outside of callback_plugins, because Ansible tries to load
+# every Python file in a callback plugin directory as a plugin.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'callback_plugins'))
+import ansible_cloud_logging  # noqa: E402
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, text='{}', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class FakeGcpSession:
+    """Stands in for GcpSession and records every entries:write request."""
+
+    # Tests set this to block full_post until the event is set.
+    release = None
+
+    def __init__(self, module, product):
+        self.module = module
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def full_post(self, url, data=None, json=None, **kwargs):
+        if self.release is not None:
+            self.release.wait()
+        with self.lock:
+            self.requests.append({'url': url, 'data': data, 'headers': kwargs.get('headers')})
+        return FakeResponse()
+
+    def sent_entries(self):
+        entries = []
+        for request in self.requests:
+            data = request['data']
+            if request['headers'].get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            entries.extend(json.loads(data)['entries'])
+        return entries
+
+
+class StubLoggingHandler(http.server.BaseHTTPRequestHandler):
+    """Answers entries:write requests with the status codes scripted on the server."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.bodies.append(body)
+            status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGcpSession:
+    """Stands in for GcpSession and posts to the stub server without authentication."""
+
+    def __init__(self, module, product):
+        self.module = module
+
+    def full_post(self, url, data=None, json=None, **kwargs):
+        try:
+            return requests.post(url, data=data, json=json, headers=kwargs.get('headers'), timeout=5)
+        except requests.RequestException as e:
+            self.module.fail_json(msg=str(e))
+
+
+def _task_message(i, size=0):
+    return {
+        'id': 'execution-id',
+        'event_type': 'PLAYBOOK_TASK_START',
+        'task_id': 'task-%d' % i,
+        'name': 'task %d' % i,
+        'host': 'host-1',
+        'padding': 'x' * size,
+    }
+
+
+class TestDocumentation(unittest.TestCase):
+
+    def test_documentation_is_valid_yaml(self):
+        doc = yaml.safe_load(ansible_cloud_logging.DOCUMENTATION)
+        self.assertEqual(doc['name'], 'ansible_cloud_logging')
+        self.assertIn('sinks', doc['options'])
+
+
+class TestCloudLoggingCollector(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ansible_cloud_logging, 'GcpSession', FakeGcpSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, FakeGcpSession, 'release', None)
+
+    def _collector(self, **kwargs):
+        return ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project',
+            log_name='ansible_cloud_logging',
+            enable_async_logging=True,
+            **kwargs,
+        )
+
+    def _run(self, collector, messages):
+        collector.start_consuming()
+        for msg in messages:
+            collector.send(msg)
+        collector.wait()
+        return collector.sinks[0].gcp_session
+
+    def test_entries_are_batched_by_count(self):
+        collector = self._collector(batch_max_entries=10, batch_linger_ms=1000, sender_workers=1)
+        session = self._run(collector, [_task_message(i) for i in range(25)])
+
+        self.assertEqual(len(session.requests), 3)
+        entries = session.sent_entries()
+        self.assertEqual([e['jsonPayload']['task_id'] for e in entries], ['task-%d' % i for i in range(25)])
+        self.assertEqual(entries[0]['logName'], 'projects/my-project/logs/ansible_cloud_logging')
+        self.assertEqual(session.requests[0]['url'], ansible_cloud_logging.ENTRIES_WRITE_URL)
+        self.assertEqual(session.requests[0]['headers'], {'Content-Type': 'application/json'})
+
+    def test_entries_are_batched_by_size(self):
+        collector = self._collector(batch_max_entries=1000, batch_max_bytes=10000, batch_linger_ms=1000)
+        session = self._run(collector, [_task_message(i, size=3000) for i in range(10)])
+
+        self.assertEqual(len(session.sent_entries()), 10)
+        self.assertGreater(len(session.requests), 1)
+        for request in session.requests:
+            self.assertLessEqual(len(request['data']), 10000)
+
+    def test_oversized_entry_is_sent_alone(self):
+        collector = self._collector(batch_max_bytes=1000, batch_linger_ms=1000, sender_workers=1)
+        session = self._run(collector, [_task_message(0), _task_message(1, size=5000), _task_message(2)])
+
+        self.assertEqual([len(json.loads(r['data'])['entries']) for r in session.requests], [1, 1, 1])
+
+    def test_linger_flushes_partial_batch(self):
+        collector = self._collector(batch_max_entries=100, batch_linger_ms=10)
+        collector.start_consuming()
+        collector.send(_task_message(0))
+        for _ in range(200):
+            if collector.sinks[0].gcp_session.requests:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(len(collector.sinks[0].gcp_session.requests), 1)
+        collector.wait()
+
+    def test_batch_max_bytes_is_capped_at_api_limit(self):
+        collector = self._collector(batch_max_bytes=50 * 1000 * 1000)
+        self.assertEqual(collector.batch_max_bytes, ansible_cloud_logging.MAX_REQUEST_SIZE)
+
+    def test_sender_pool_delivers_every_entry(self):
+        collector = self._collector(batch_max_entries=7, batch_linger_ms=5, sender_workers=4)
+        session = self._run(collector, [_task_message(i) for i in range(500)])
+
+        self.assertEqual(len(collector.consumers), 4)
+        task_ids = sorted(e['jsonPayload']['task_id'] for e in session.sent_entries())
+        self.assertEqual(task_ids, sorted('task-%d' % i for i in range(500)))
+        self.assertEqual(collector.dropped, 0)
+
+    def test_idle_workers_block_until_shutdown(self):
+        collector = self._collector(sender_workers=4)
+        with patch.object(collector.queue, 'get', wraps=collector.queue.get) as get:
+            collector.start_consuming()
+            time.sleep(0.3)
+            # Each worker waits in a single get() instead of polling the queue.
+            self.assertEqual(get.call_count, 4)
+
+            started = time.monotonic()
+            collector.wait()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(any(consumer.is_alive() for consumer in collector.consumers))
+
+    def test_drop_oldest_policy_discards_oldest_messages(self):
+        FakeGcpSession.release = threading.Event()
+        collector = self._collector(
+            sender_workers=1, batch_max_entries=1, queue_max_size=5, overflow_policy='drop_oldest')
+        collector.start_consuming()
+        collector.send(_task_message(0))
+        # Wait until the worker is stuck sending the first message.
+        while not collector.queue.empty():
+            threading.Event().wait(0.01)
+        for i in range(1, 11):
+            collector.send(_task_message(i))
+        FakeGcpSession.release.set()
+        collector.wait()
+
+        task_ids = [e['jsonPayload']['task_id'] for e in collector.sinks[0].gcp_session.sent_entries()]
+        self.assertEqual(task_ids, ['task-0'] + ['task-%d' % i for i in range(6, 11)])
+        self.assertEqual(collector.dropped, 5)
+
+    def test_spill_policy_writes_overflow_to_spool(self):
+        FakeGcpSession.release = threading.Event()
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool_path = os.path.join(spool_dir, 'execution-id.jsonl')
+            collector = self._collector(
+                sender_workers=1, queue_max_size=2, overflow_policy='spill', spool_path=spool_path)
+            for i in range(5):
+                collector.send(_task_message(i))
+            FakeGcpSession.release.set()
+            collector.start_consuming()
+            collector.wait()
+
+            with open(spool_path) as f:
+                spooled = [json.loads(line)['jsonPayload']['task_id'] for line in f]
+        self.assertEqual(spooled, ['task-2', 'task-3', 'task-4'])
+        self.assertEqual(collector.spilled, 3)
+        self.assertEqual(len(collector.sinks[0].gcp_session.sent_entries()), 2)
+
+    def test_spill_policy_requires_spool_path(self):
+        with self.assertRaises(ValueError):
+            self._collector(overflow_policy='spill')
+
+    def test_unknown_overflow_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self._collector(overflow_policy='ignore')
+
+    def test_wait_gives_up_after_shutdown_timeout(self):
+        FakeGcpSession.release = threading.Event()
+        collector = self._collector(sender_workers=1, batch_max_entries=1, shutdown_timeout=0.2)
+        collector.start_consuming()
+        for i in range(10):
+            collector.send(_task_message(i))
+
+        started = time.monotonic()
+        collector.wait()
+        self.assertLess(time.monotonic() - started, 2)
+        # One message is stuck in the blocked request, the rest never left the queue.
+        self.assertEqual(collector.dropped, 9)
+        FakeGcpSession.release.set()
+
+    def test_sync_logging_sends_one_request_per_message(self):
+        collector = ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project',
+            log_name='ansible_cloud_logging',
+            enable_async_logging=False,
+        )
+        for i in range(3):
+            collector.send(_task_message(i))
+        self.assertEqual(len(collector.sinks[0].gcp_session.requests), 3)
+
+
+def _typical_install_messages(tasks=300, hosts=2):
+    """Returns the payloads of a RAC-like install run with realistic result sizes."""
+    env = {'ANSIBLE_%d' % i: '/opt/ansible/value-%d' % i for i in range(40)}
+    env['PATH'] = '/usr/local/bin:/usr/bin:/bin'
+    extra_vars = {'var_%d' % i: 'value-%d' % i for i in range(150)}
+    messages = [{'id': 'execution-id', 'event_type': 'PLAYBOOK_START', 'env': env, 'extra_vars': extra_vars}]
+    inventory_lines = ['Patch  %d     : applied on Mon Jan 01 00:00:00 UTC 2024' % (30000000 + i) for i in range(40)]
+    for t in range(tasks):
+        for h in range(hosts):
+            task = {
+                'id': 'execution-id', 'task_id': 'task-%d' % t, 'name': 'role | task number %d' % t,
+                'host': 'rac-node%d' % h, 'start_time': '2024-01-01T00:00:00+00:00',
+            }
+            messages.append(dict(task, event_type='PLAYBOOK_TASK_START'))
+            lines = inventory_lines if t % 10 == 0 else ['ok']
+            result = {'changed': t % 3 == 0, 'rc': 0, 'stdout': '\n'.join(lines), 'stdout_lines': lines,
+                      'stderr': '', 'stderr_lines': [], 'cmd': 'opatch lsinventory'}
+            messages.append(dict(task, event_type='PLAYBOOK_TASK_END', status='ok', end_time='2024-01-01T00:00:01+00:00',
+                                 result=ansible_cloud_logging._encode_result(result)))
+    return messages
+
+
+class TestRequestCompression(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ansible_cloud_logging, 'GcpSession', FakeGcpSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _collector(self, **kwargs):
+        return ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project', log_name='ansible_cloud_logging', enable_async_logging=False,
+            sinks=[ansible_cloud_logging.CloudLoggingSink(**kwargs)])
+
+    def test_large_bodies_are_compressed(self):
+        collector = self._collector(compress_requests=True, compress_min_bytes=1024)
+        collector.send(_task_message(0, size=10000))
+
+        request = collector.sinks[0].gcp_session.requests[0]
+        self.assertEqual(request['headers']['Content-Encoding'], 'gzip')
+        self.assertLess(len(request['data']), 1024)
+        self.assertEqual(collector.sinks[0].gcp_session.sent_entries()[0]['jsonPayload']['task_id'], 'task-0')
+
+    def test_small_bodies_are_not_compressed(self):
+        collector = self._collector(compress_requests=True, compress_min_bytes=1024)
+        collector.send(_task_message(0))
+
+        self.assertNotIn('Content-Encoding', collector.sinks[0].gcp_session.requests[0]['headers'])
+
+    def test_compression_is_off_by_default(self):
+        collector = self._collector()
+        collector.send(_task_message(0, size=10000))
+
+        self.assertNotIn('Content-Encoding', collector.sinks[0].gcp_session.requests[0]['headers'])
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkRequestCompression(unittest.TestCase):
+    """Reports bytes on the wire and CPU time for a typical install run.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s tools/test_ansible_cloud_logging.py -k Benchmark
+    """
+
+    def setUp(self):
+        patcher = patch.object(ansible_cloud_logging, 'GcpSession', FakeGcpSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compression_benchmark(self):
+        messages = _typical_install_messages()
+        print('\n%-12s %-10s %12s %12s %8s' % ('batch', 'compress', 'wire bytes', 'cpu ms', 'ratio'))
+        for batch_max_entries in (1, 50, 500):
+            raw_bytes = None
+            for compress in (False, True):
+                collector = ansible_cloud_logging.CloudLoggingCollector(
+                    project='my-project', log_name='ansible_cloud_logging', enable_async_logging=False,
+                    batch_max_entries=batch_max_entries, sinks=[
+                        ansible_cloud_logging.CloudLoggingSink(compress_requests=compress, compress_min_bytes=0)])
+                entries = [collector._encode_entry(m) for m in messages]
+                started = time.process_time()
+                for i in range(0, len(entries), batch_max_entries):
+                    collector._send(entries[i:i + batch_max_entries])
+                cpu_ms = (time.process_time() - started) * 1000
+                wire_bytes = sum(len(r['data']) for r in collector.sinks[0].gcp_session.requests)
+                raw_bytes = raw_bytes or wire_bytes
+                print('%-12d %-10s %12d %12.1f %8.2f' % (
+                    batch_max_entries, compress, wire_bytes, cpu_ms, raw_bytes / wire_bytes))
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkPipelineThroughput(unittest.TestCase):
+    """Reports how many events per second the pipeline writes to a local file sink.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s tools/test_ansible_cloud_logging.py -k Benchmark
+    """
+
+    def test_pipeline_throughput(self):
+        messages = _typical_install_messages(tasks=2000)
+        print('\n%-8s %12s %12s' % ('workers', 'events', 'events/s'))
+        for workers in (1, 2, 4):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                collector = ansible_cloud_logging.CloudLoggingCollector(
+                    project='my-project', log_name='ansible_cloud_logging', enable_async_logging=True,
+                    sender_workers=workers,
+                    sinks=[ansible_cloud_logging.JsonlFileSink(os.path.join(tmpdir, 'events.jsonl'))])
+                started = time.perf_counter()
+                collector.start_consuming()
+                for msg in messages:
+                    collector.send(msg)
+                collector.wait()
+                elapsed = time.perf_counter() - started
+            print('%-8d %12d %12.0f' % (workers, len(messages), len(messages) / elapsed))
+
+
+class TestResultSerialization(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ansible_cloud_logging, 'GcpSession', FakeGcpSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_small_result_is_kept_as_is(self):
+        result = {'changed': False, 'stdout': 'ok', 'stdout_lines': ['ok'], 'rc': 0}
+        encoded = ansible_cloud_logging._encode_result(result)
+
+        self.assertIsInstance(encoded, ansible_cloud_logging.EncodedJSON)
+        self.assertEqual(json.loads(encoded), result)
+
+    def test_large_fields_are_truncated_by_head_and_tail(self):
+        lines = ['line %06d' % i for i in range(100000)]
+        result = {'rc': 0, 'stdout': '\n'.join(lines), 'stdout_lines': lines, 'stderr': ''}
+        encoded = ansible_cloud_logging._encode_result(result)
+        decoded = json.loads(encoded)
+
+        self.assertLessEqual(len(encoded), ansible_cloud_logging.MAX_RESULT_SIZE)
+        self.assertEqual(decoded['rc'], 0)
+        self.assertEqual(decoded['stderr'], '')
+        self.assertEqual(decoded['stdout_lines'][0], 'line 000000')
+        self.assertEqual(decoded['stdout_lines'][-1], 'line 099999')
+        self.assertRegex(' '.join(decoded['stdout_lines']), r'\.\.\. \d+ lines omitted \.\.\.')
+        self.assertTrue(decoded['stdout'].startswith('line 000000'))
+        self.assertTrue(decoded['stdout'].endswith('line 099999'))
+        self.assertIn('characters omitted', decoded['stdout'])
+
+    def test_loop_item_output_is_truncated(self):
+        lines = ['line %04d' % i for i in range(100)]
+        result = {'changed': True, 'results': [
+            {'item': i, 'rc': 0, 'stdout': '\n'.join(lines), 'stdout_lines': lines, 'stderr': 'e' * 1000}
+            for i in range(500)]}
+        encoded = ansible_cloud_logging._encode_result(result)
+        decoded = json.loads(encoded)
+
+        self.assertLessEqual(len(encoded), ansible_cloud_logging.MAX_RESULT_SIZE)
+        self.assertTrue(decoded['changed'])
+        self.assertEqual(len(decoded['results']), 500)
+        item = decoded['results'][-1]
+        self.assertEqual((item['item'], item['rc']), (499, 0))
+        self.assertTrue(item['stdout'].startswith('line 0000'))
+        self.assertTrue(item['stdout'].endswith('line 0099'))
+        self.assertIn('characters omitted', item['stdout'])
+        self.assertIn('characters omitted', item['stderr'])
+        self.assertRegex(' '.join(item['stdout_lines']), r'\.\.\. \d+ lines omitted \.\.\.')
+        # The task's own result is left untouched.
+        self.assertEqual(result['results'][-1]['stdout_lines'], lines)
+
+    def test_result_that_cannot_be_truncated_is_replaced(self):
+        result = {'results': [{'msg': 'x' * 1000} for _ in range(1000)]}
+        decoded = json.loads(ansible_cloud_logging._encode_result(result))
+
+        self.assertEqual(list(decoded), ['warning'])
+
+    def test_encoded_result_is_spliced_into_entry(self):
+        collector = ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project', log_name='ansible_cloud_logging', enable_async_logging=False)
+        result = {'rc': 0, 'stdout': 'hello "world"'}
+        payload = dict(_task_message(0), result=ansible_cloud_logging._encode_result(result))
+
+        entry = json.loads(collector._encode_entry(payload))
+        self.assertEqual(entry['jsonPayload']['result'], result)
+        self.assertEqual(entry['jsonPayload']['task_id'], 'task-0')
+        self.assertEqual(entry['resource']['labels']['project_id'], 'my-project')
+        # The payload queued for sending is left untouched.
+        self.assertIsInstance(payload['result'], ansible_cloud_logging.EncodedJSON)
+
+
+class FailingSink(ansible_cloud_logging.LogSink):
+
+    name = 'failing'
+
+    def write(self, entries):
+        return False
+
+
+class TestLocalSinks(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+
+    def _collector(self, sinks, **kwargs):
+        return ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project', log_name='ansible_cloud_logging', sinks=sinks, **kwargs)
+
+    def test_file_sink_writes_jsonl(self):
+        path = os.path.join(self.tmpdir, 'logs', 'events.jsonl')
+        collector = self._collector([ansible_cloud_logging.JsonlFileSink(path)], enable_async_logging=True,
+                                    sender_workers=1)
+        collector.start_consuming()
+        for i in range(20):
+            collector.send(_task_message(i))
+        collector.wait()
+
+        with open(path) as f:
+            task_ids = [json.loads(line)['jsonPayload']['task_id'] for line in f]
+        self.assertEqual(task_ids, ['task-%d' % i for i in range(20)])
+
+    def test_file_sink_rotates(self):
+        path = os.path.join(self.tmpdir, 'events.jsonl')
+        sink = ansible_cloud_logging.JsonlFileSink(path, max_bytes=1000, backup_count=2)
+        collector = self._collector([sink], enable_async_logging=False)
+        for i in range(30):
+            collector.send(_task_message(i, size=100))
+        collector.wait()
+
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['events.jsonl', 'events.jsonl.1', 'events.jsonl.2'])
+        for name in os.listdir(self.tmpdir):
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmpdir, name)), 1000)
+        with open(path) as f:
+            last = [json.loads(line)['jsonPayload']['task_id'] for line in f][-1]
+        self.assertEqual(last, 'task-29')
+
+    def test_stdout_sink(self):
+        stream = io.BytesIO()
+        collector = self._collector([ansible_cloud_logging.StdoutSink(stream)], enable_async_logging=False)
+        collector.send(_task_message(0))
+        collector.send(_task_message(1))
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['jsonPayload']['task_id'] for line in lines], ['task-0', 'task-1'])
+
+    def test_unix_socket_sink(self):
+        path = os.path.join(self.tmpdir, 'collector.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(path)
+        server.listen(1)
+        sink = ansible_cloud_logging.UnixSocketSink(path)
+        collector = self._collector([sink], enable_async_logging=False)
+        collector.send(_task_message(0))
+        collector.send(_task_message(1))
+        collector.wait()
+
+        conn, _ = server.accept()
+        with conn, conn.makefile('rb') as f:
+            lines = f.read().splitlines()
+        self.assertEqual([json.loads(line)['jsonPayload']['task_id'] for line in lines], ['task-0', 'task-1'])
+
+    def test_unix_socket_sink_reports_unreachable_collector(self):
+        sink = ansible_cloud_logging.UnixSocketSink(os.path.join(self.tmpdir, 'missing.sock'))
+        self.assertFalse(sink.write([b'{}']))
+
+    def test_unix_socket_sink_reports_socket_creation_failure(self):
+        sink = ansible_cloud_logging.UnixSocketSink(os.path.join(self.tmpdir, 'collector.sock'))
+        with patch.object(ansible_cloud_logging.socket, 'socket', side_effect=OSError(24, 'Too many open files')):
+            self.assertFalse(sink.write([b'{}']))
+
+    def test_fan_out_to_several_sinks(self):
+        path = os.path.join(self.tmpdir, 'events.jsonl')
+        stream = io.BytesIO()
+        collector = self._collector(
+            [ansible_cloud_logging.JsonlFileSink(path), ansible_cloud_logging.StdoutSink(stream)],
+            enable_async_logging=False)
+        collector.send(_task_message(0))
+        collector.wait()
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), stream.getvalue())
+
+    def test_local_sink_failures_are_not_spooled(self):
+        spool_path = os.path.join(self.tmpdir, 'execution-id.jsonl')
+        collector = self._collector([FailingSink()], enable_async_logging=False, spool_path=spool_path)
+        collector.send(_task_message(0))
+
+        self.assertFalse(os.path.exists(spool_path))
+        self.assertEqual(collector.spilled, 0)
+
+
+def _timing(task_id, host, start, end, role='swlib', status='ok'):
+    return ansible_cloud_logging.TaskTiming(
+        task_id=task_id, name='%s : %s' % (role, task_id), role=role, host=host,
+        start=start, end=end, status=status)
+
+
+class TestTaskProfiler(unittest.TestCase):
+
+    def setUp(self):
+        # Two hosts running three tasks under the linear strategy: every task
+        # starts once the previous one finished on all hosts.
+        self.profiler = ansible_cloud_logging.TaskProfiler()
+        for timing in [
+            _timing('t1', 'node1', 0, 10),
+            _timing('t1', 'node2', 0, 4),
+            _timing('t2', 'node1', 11, 12, role='rdbms-setup'),
+            _timing('t2', 'node2', 11, 30, role='rdbms-setup'),
+            _timing('t3', 'node1', 31, 33, role='patch'),
+            _timing('t3', 'node2', 31, 32, role='patch'),
+        ]:
+            self.profiler.record(timing)
+
+    def test_report_totals(self):
+        report = self.profiler.report()
+
+        self.assertEqual(report['wall_clock_seconds'], 33)
+        self.assertEqual([r['role'] for r in report['roles']], ['rdbms-setup', 'swlib', 'patch'])
+        self.assertEqual(report['roles'][0]['wall_clock_seconds'], 19)
+        self.assertEqual(report['roles'][0]['total_seconds'], 20)
+        t2 = report['tasks'][0]
+        self.assertEqual((t2['task_id'], t2['slowest_host'], t2['skew_seconds']), ('t2', 'node2', 18))
+        hosts = {h['host']: h for h in report['hosts']}
+        self.assertEqual(hosts['node2']['busy_seconds'], 24)
+        self.assertEqual(hosts['node1']['skew_seconds'], 0)
+        self.assertEqual(hosts['node2']['skew_seconds'], 11)
+
+    def test_critical_path_follows_slowest_hosts(self):
+        path = self.profiler.report()['critical_path']
+
+        self.assertEqual([(t['task_id'], t['host']) for t in path['tasks']],
+                         [('t1', 'node1'), ('t2', 'node2'), ('t3', 'node1')])
+        self.assertEqual(path['task_seconds'], 31)
+        self.assertEqual(path['overhead_seconds'], 2)
+
+    def test_trace_has_one_thread_per_host(self):
+        events = self.profiler.trace()['traceEvents']
+
+        spans = [e for e in events if e['ph'] == 'X']
+        self.assertEqual(len(spans), 6)
+        self.assertEqual(spans[0]['ts'], 0)
+        self.assertEqual(max(e['dur'] for e in spans), 19 * 10**6)
+        names = {e['tid']: e['args']['name'] for e in events if e['ph'] == 'M'}
+        self.assertEqual(sorted(names.values()), ['node1', 'node2'])
+
+    def test_write_creates_report_and_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report_path, trace_path = self.profiler.write(os.path.join(tmpdir, 'profiles'), 'execution-id')
+            with open(report_path) as f:
+                self.assertEqual(json.load(f)['wall_clock_seconds'], 33)
+            with open(trace_path) as f:
+                self.assertIn('traceEvents', json.load(f))
+        self.assertTrue(report_path.endswith('execution-id.profile.json'))
+
+    def test_empty_profile(self):
+        profiler = ansible_cloud_logging.TaskProfiler()
+        self.assertEqual(profiler.report()['tasks'], [])
+        self.assertEqual(profiler.trace(), {'traceEvents': []})
+
+
+class TestCloudLoggingRetries(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ansible_cloud_logging, 'GcpSession', StubGcpSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubLoggingHandler)
+        self.server.lock = threading.Lock()
+        self.server.bodies = []
+        self.server.script = []
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/v2/entries:write' % self.server.server_address[1]
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.spool_path = os.path.join(tmpdir.name, 'execution-id.jsonl')
+
+    def _collector(self, **kwargs):
+        sink_kwargs = {'retry_base_delay': 0.01, 'retry_max_delay': 0.05, 'entries_write_url': self.url}
+        for name in ('max_retries', 'retry_max_delay'):
+            if name in kwargs:
+                sink_kwargs[name] = kwargs.pop(name)
+        kwargs.setdefault('ignore_gcp_api_errors', True)
+        kwargs.setdefault('enable_async_logging', False)
+        return ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project',
+            log_name='ansible_cloud_logging',
+            spool_path=self.spool_path,
+            sinks=[ansible_cloud_logging.CloudLoggingSink(**sink_kwargs)],
+            **kwargs,
+        )
+
+    def test_transient_errors_are_retried(self):
+        self.server.script = [(429, {}), (503, {}), (500, {})]
+        collector = self._collector(max_retries=3)
+        collector.send(_task_message(0))
+
+        self.assertEqual(len(self.server.bodies), 4)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_retry_after_header_is_honoured(self):
+        self.server.script = [(429, {'Retry-After': '0.3'})]
+        collector = self._collector(retry_max_delay=1)
+        started = time.monotonic()
+        collector.send(_task_message(0))
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(len(self.server.bodies), 2)
+
+    def test_retry_delay_is_capped(self):
+        collector = self._collector(retry_max_delay=0.05)
+        sink = collector.sinks[0]
+        self.assertLessEqual(sink._retry_delay(30, None), 0.05)
+        self.assertEqual(sink._retry_delay(0, FakeResponse(429, headers={'Retry-After': '120'})), 0.05)
+
+    def test_permanent_errors_are_not_retried(self):
+        self.server.script = [(400, {})]
+        collector = self._collector(max_retries=3)
+        collector.send(_task_message(0))
+
+        self.assertEqual(len(self.server.bodies), 1)
+        self.assertEqual(collector.spilled, 1)
+
+    def test_exhausted_retries_spool_entries(self):
+        self.server.script = [(503, {})] * 3
+        collector = self._collector(max_retries=2)
+        collector.send(_task_message(0))
+
+        with open(self.spool_path) as f:
+            spooled = [json.loads(line) for line in f]
+        self.assertEqual([e['jsonPayload']['task_id'] for e in spooled], ['task-0'])
+        self.assertEqual(spooled[0]['logName'], 'projects/my-project/logs/ansible_cloud_logging')
+
+    def test_connection_errors_are_retried_and_spooled(self):
+        collector = self._collector(max_retries=1)
+        collector.sinks[0].entries_write_url = 'http://127.0.0.1:1/v2/entries:write'
+        collector.send(_task_message(0))
+
+        self.assertEqual(collector.spilled, 1)
+
+    def test_errors_terminate_playbook_unless_ignored(self):
+        self.server.script = [(403, {})]
+        collector = self._collector(ignore_gcp_api_errors=False)
+        with self.assertRaises(SystemExit):
+            collector.send(_task_message(0))
+        self.assertEqual(collector.spilled, 1)
+
+    def test_sender_errors_terminate_playbook_on_callback_thread(self):
+        self.server.script = [(403, {})] * 100
+        collector = self._collector(ignore_gcp_api_errors=False, enable_async_logging=True, queue_max_size=2,
+                                    sender_workers=2, batch_max_entries=1)
+        collector.start_consuming()
+
+        started = time.monotonic()
+        with self.assertRaises(SystemExit):
+            for i in range(100):
+                collector.send(_task_message(i))
+        # The full queue does not block send() once the senders gave up.
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(collector.fatal_error.is_set())
+        self.assertFalse(any(consumer.is_alive() for consumer in collector.consumers))
+
+    def test_full_queue_without_consumers_spools_messages(self):
+        collector = self._collector(enable_async_logging=True, queue_max_size=1)
+        for i in range(3):
+            collector.send(_task_message(i))
+
+        self.assertEqual(collector.spilled, 2)
+        with open(self.spool_path) as f:
+            self.assertEqual([json.loads(line)['jsonPayload']['task_id'] for line in f], ['task-1', 'task-2'])
+
+    def test_replay_sends_spool_and_removes_it(self):
+        self.server.script = [(400, {})] * 3
+        collector = self._collector(max_retries=0)
+        for i in range(3):
+            collector.send(_task_message(i))
+
+        sent, failed = collector.replay(self.spool_path)
+        self.assertEqual((sent, failed), (3, 0))
+        self.assertFalse(os.path.exists(self.spool_path))
+        replayed = json.loads(self.server.bodies[-1])['entries']
+        self.assertEqual([e['jsonPayload']['task_id'] for e in replayed], ['task-0', 'task-1', 'task-2'])
+
+    def test_replay_keeps_entries_that_fail_again(self):
+        self.server.script = [(400, {})] * 3
+        collector = self._collector(max_retries=0, batch_max_entries=1)
+        for i in range(3):
+            collector.send(_task_message(i))
+        self.server.script = [(200, {}), (400, {}), (200, {})]
+
+        replay_collector = self._collector(max_retries=0, batch_max_entries=1)
+        replay_collector.spool = None
+        sent, failed = replay_collector.replay(self.spool_path)
+        self.assertEqual((sent, failed), (2, 1))
+        with open(self.spool_path) as f:
+            self.assertEqual([json.loads(line)['jsonPayload']['task_id'] for line in f], ['task-1'])
+
+    def test_main_replays_spool_files(self):
+        self.server.script = [(400, {})]
+        self._collector(max_retries=0).send(_task_message(0))
+        url = self.url
+
+        class StubSink(ansible_cloud_logging.CloudLoggingSink):
+            def __init__(self, **kwargs):
+                super().__init__(entries_write_url=url, **kwargs)
+
+        with patch.object(ansible_cloud_logging, 'CloudLoggingSink', StubSink):
+            self.assertEqual(ansible_cloud_logging.main([self.spool_path]), 0)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_main_reports_missing_collection(self):
+        error = ImportError('The cloud_logging sink requires the google.cloud Ansible collection.')
+        stderr = io.StringIO()
+        with patch.object(ansible_cloud_logging, '_gcp_session_class', side_effect=error), \
+                patch('sys.stderr', stderr), self.assertRaises(SystemExit) as cm:
+            ansible_cloud_logging.main([self.spool_path])
+        self.assertEqual(cm.exception.code, 2)
+        self.assertIn('requires the google.cloud Ansible collection', stderr.getvalue())
+
+
+_OPTION_DEFAULTS = {
+    name: spec.get('default')
+    for name, spec in yaml.safe_load(ansible_cloud_logging.DOCUMENTATION)['options'].items()
+}
+
+
+def _callback_module(sinks, **options):
+    """Creates a CallbackModule outside of Ansible with the given option values."""
+    values = dict(_OPTION_DEFAULTS, **options)
+    with patch.object(ansible_cloud_logging.CallbackModule, 'set_options'), \
+            patch.object(ansible_cloud_logging.CallbackModule, 'get_option', side_effect=values.get), \
+            patch.object(ansible_cloud_logging.CallbackModule, '_build_sinks', return_value=sinks):
+        return ansible_cloud_logging.CallbackModule()
+
+
+class FakeHost:
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class FakeTask:
+
+    def __init__(self, uuid, name, role=None):
+        self._uuid = uuid
+        self.name = name
+        self._role = role
+
+    def get_name(self):
+        return self.name
+
+
+class FakeTaskResult:
+
+    def __init__(self, host, task, result):
+        self._host = host
+        self._task = task
+        self._result = result
+
+
+class CountingSink(ansible_cloud_logging.LogSink):
+
+    name = 'counting'
+
+    def __init__(self):
+        self.entries = 0
+
+    def write(self, entries):
+        self.entries += len(entries)
+        return True
+
+
+class TestCallbackModuleMemory(unittest.TestCase):
+
+    def _run_tasks(self, callback, count, hosts=4):
+        for i in range(count):
+            task = FakeTask('task-%d' % i, 'md5 check %d' % i)
+            for h in range(hosts):
+                host = FakeHost('node%d' % h)
+                callback.v2_runner_on_start(host, task)
+                result = {'changed': False, 'stdout': 'x' * 4096, 'stdout_lines': ['x' * 64] * 32}
+                callback.v2_runner_on_ok(FakeTaskResult(host, task, result))
+
+    def test_task_end_message_is_released_after_sending(self):
+        sink = CountingSink()
+        callback = _callback_module([sink], enable_async_logging=False)
+        host, task = FakeHost('node1'), FakeTask('task-1', 'install')
+
+        callback.v2_runner_on_start(host, task)
+        self.assertIn(('node1', 'task-1'), callback.tasks)
+        callback.v2_runner_on_failed(FakeTaskResult(host, task, {'msg': 'boom'}))
+
+        self.assertEqual(callback.tasks, {})
+        self.assertEqual(sink.entries, 2)
+
+    def test_duplicate_terminal_event_is_ignored(self):
+        sink = CountingSink()
+        callback = _callback_module([sink], enable_async_logging=False)
+        host, task = FakeHost('node1'), FakeTask('task-1', 'install')
+
+        callback.v2_runner_on_start(host, task)
+        callback.v2_runner_on_ok(FakeTaskResult(host, task, {}))
+        callback.v2_runner_on_ok(FakeTaskResult(host, task, {}))
+
+        self.assertEqual(sink.entries, 2)
+
+    def test_profiler_keeps_compact_timings(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        callback = _callback_module([CountingSink()], enable_async_logging=False, profile_dir=tmpdir.name)
+
+        self._run_tasks(callback, 5, hosts=2)
+
+        self.assertEqual(callback.tasks, {})
+        report = callback.profiler.report()
+        self.assertEqual(len(report['tasks']), 5)
+        self.assertEqual(sorted(h['host'] for h in report['hosts']), ['node0', 'node1'])
+
+    def test_peak_memory_does_not_grow_with_task_count(self):
+        def peak(count, enable_async_logging):
+            # Small batches and queue keep the in-flight messages of async
+            # logging well below what fifty tasks already produce.
+            callback = _callback_module([CountingSink()], enable_async_logging=enable_async_logging,
+                                        batch_max_entries=50, queue_max_size=100)
+            tracemalloc.start()
+            try:
+                self._run_tasks(callback, count)
+                callback.logging_collector.wait()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        for enable_async_logging in (False, True):
+            with self.subTest(enable_async_logging=enable_async_logging):
+                small = peak(50, enable_async_logging)
+                large = peak(500, enable_async_logging)
+                # Ten times the tasks with ~6KB results each on four hosts would add
+                # more than 10MB if results were kept; allow for allocator noise only.
+                self.assertLess(large, small + 512 * 1024, (small, large))
+
+
+class RecordingSink(ansible_cloud_logging.LogSink):
+
+    name = 'recording'
+
+    def __init__(self):
+        self.payloads = []
+
+    def write(self, entries):
+        self.payloads.extend(json.loads(entry)['jsonPayload'] for entry in entries)
+        return True
+
+
+class TestLoopAggregator(unittest.TestCase):
+
+    def test_items_are_timed_from_previous_item(self):
+        loop = ansible_cloud_logging.LoopAggregator(start=100.0)
+
+        self.assertEqual(loop.add('a', 'ok', 102.0), (100.0, 2.0))
+        self.assertEqual(loop.add('b', 'failed', 107.0), (102.0, 5.0))
+        self.assertEqual(loop.add('c', 'skipped', 107.5), (107.0, 0.5))
+
+        summary = loop.summary()
+        self.assertEqual(summary['items'], 3)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['duration_seconds'], 7.5)
+        self.assertEqual([i['item'] for i in summary['slowest_items']], ['b', 'a', 'c'])
+
+    def test_only_slowest_items_are_kept(self):
+        loop = ansible_cloud_logging.LoopAggregator(start=0.0, slowest=3)
+        end = 0.0
+        for i in range(1000):
+            end += i % 97
+            loop.add('item-%d' % i, 'ok', end)
+
+        summary = loop.summary()
+        self.assertEqual(summary['items'], 1000)
+        self.assertEqual(len(loop._slowest), 3)
+        self.assertEqual([i['duration_seconds'] for i in summary['slowest_items']], [96, 96, 96])
+        self.assertEqual(summary['slowest_items'][0]['item'], 'item-96')
+
+
+class TestLoopAndHandlerEvents(unittest.TestCase):
+
+    def _run_loop(self, callback, items):
+        host, task = FakeHost('node1'), FakeTask('task-1', 'check md5')
+        callback.v2_runner_on_start(host, task)
+        for item, status in items:
+            result = FakeTaskResult(host, task, {'item': item, 'changed': False})
+            getattr(callback, 'v2_runner_item_on_%s' % status)(result)
+        callback.v2_runner_on_failed(FakeTaskResult(host, task, {'msg': 'One or more items failed'}))
+
+    def test_aggregate_mode_summarizes_loop_in_task_end_entry(self):
+        sink = RecordingSink()
+        callback = _callback_module([sink], enable_async_logging=False)
+
+        self._run_loop(callback, [('p1.zip', 'ok'), ('p2.zip', 'failed'), ({'name': 'p3.zip'}, 'skipped')])
+
+        self.assertEqual([p['event_type'] for p in sink.payloads], ['PLAYBOOK_TASK_START', 'PLAYBOOK_TASK_END'])
+        loop = sink.payloads[-1]['loop']
+        self.assertEqual((loop['items'], loop['failed'], loop['skipped']), (3, 1, 1))
+        self.assertEqual(sorted(i['item'] for i in loop['slowest_items']), ['p1.zip', 'p2.zip', '{"name":"p3.zip"}'])
+        self.assertEqual(callback.loops, {})
+
+    def test_items_mode_sends_one_entry_per_item(self):
+        sink = RecordingSink()
+        callback = _callback_module([sink], enable_async_logging=False, loop_events='items')
+
+        self._run_loop(callback, [('p1.zip', 'ok'), ('p2.zip', 'failed')])
+
+        items = [p for p in sink.payloads if p['event_type'] == 'PLAYBOOK_TASK_ITEM']
+        self.assertEqual([(p['item'], p['status']) for p in items], [('p1.zip', 'ok'), ('p2.zip', 'failed')])
+        self.assertEqual(items[0]['result']['item'], 'p1.zip')
+        self.assertEqual(items[1]['start_time'], items[0]['end_time'])
+        self.assertEqual(sink.payloads[-1]['loop']['items'], 2)
+
+    def test_no_log_item_labels_are_censored(self):
+        sink = RecordingSink()
+        callback = _callback_module([sink], enable_async_logging=False, loop_events='items')
+        host, task = FakeHost('node1'), FakeTask('task-1', 'set password')
+
+        callback.v2_runner_on_start(host, task)
+        callback.v2_runner_item_on_ok(FakeTaskResult(host, task, {'item': 'secret', '_ansible_no_log': True}))
+
+        self.assertNotIn('secret', sink.payloads[-1]['item'])
+
+    def test_tasks_without_loop_have_no_summary(self):
+        sink = RecordingSink()
+        callback = _callback_module([sink], enable_async_logging=False)
+        host, task = FakeHost('node1'), FakeTask('task-1', 'install')
+
+        callback.v2_runner_on_start(host, task)
+        callback.v2_runner_on_ok(FakeTaskResult(host, task, {}))
+
+        self.assertNotIn('loop', sink.payloads[-1])
+        self.assertFalse(sink.payloads[-1]['handler'])
+
+    def test_handler_notification_is_logged(self):
+        sink = RecordingSink()
+        callback = _callback_module([sink], enable_async_logging=False)
+
+        callback.v2_playbook_on_notify(FakeTask('handler-1', 'restart listener'), FakeHost('node1'))
+
+        self.assertEqual(sink.payloads[-1]['event_type'], 'PLAYBOOK_HANDLER_NOTIFY')
+        self.assertEqual(sink.payloads[-1]['name'], 'restart listener')
+        self.assertEqual(sink.payloads[-1]['host'], 'node1')
+
+
+class FakeRole:
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_counters_histograms_and_functions(self):
+        metrics = ansible_cloud_logging.Metrics()
+        metrics.counter('tasks_total', 'Finished tasks.', ('host', 'status'))
+        metrics.histogram('duration_seconds', 'Task durations.', (1, 0.5), ('host',))
+        metrics.function('queue_depth', 'gauge', 'Queued messages.', lambda: 7)
+
+        metrics.inc('tasks_total', ('node1', 'ok'))
+        metrics.inc('tasks_total', ('node1', 'ok'), 2)
+        metrics.inc('tasks_total', ('say "hi"\n', 'failed'))
+        for value in (0.2, 0.5, 0.75, 3):
+            metrics.observe('duration_seconds', value, ('node1',))
+
+        self.assertEqual(metrics.render(), '\n'.join([
+            '# HELP tasks_total Finished tasks.',
+            '# TYPE tasks_total counter',
+            'tasks_total{host="node1",status="ok"} 3',
+            'tasks_total{host="say \\"hi\\"\\n",status="failed"} 1',
+            '# HELP duration_seconds Task durations.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{host="node1",le="0.5"} 2',
+            'duration_seconds_bucket{host="node1",le="1"} 3',
+            'duration_seconds_bucket{host="node1",le="+Inf"} 4',
+            'duration_seconds_sum{host="node1"} 4.45',
+            'duration_seconds_count{host="node1"} 4',
+            '# HELP queue_depth Queued messages.',
+            '# TYPE queue_depth gauge',
+            'queue_depth 7',
+        ]) + '\n')
+
+    def test_server_serves_metrics(self):
+        metrics = ansible_cloud_logging.Metrics()
+        metrics.function('up', 'gauge', 'Always one.', lambda: 1)
+        server = ansible_cloud_logging.MetricsServer(metrics, '127.0.0.1', 0)
+        server.start()
+        self.addCleanup(server.close)
+
+        resp = requests.get('http://127.0.0.1:%d/metrics' % server.port, timeout=5)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('\nup 1\n', resp.text)
+        self.assertEqual(requests.get('http://127.0.0.1:%d/' % server.port, timeout=5).status_code, 404)
+
+    def test_collector_records_pipeline_metrics(self):
+        metrics = ansible_cloud_logging.Metrics()
+        collector = ansible_cloud_logging.CloudLoggingCollector(
+            project='my-project', log_name='ansible_cloud_logging', enable_async_logging=True,
+            sender_workers=1, batch_max_entries=10, sinks=[RecordingSink(), FailingSink()], metrics=metrics)
+        collector.start_consuming()
+        for i in range(25):
+            collector.send(_task_message(i))
+        collector.wait()
+
+        text = metrics.render()
+        self.assertIn('ansible_cloud_logging_entries_total{sink="recording",outcome="written"} 25', text)
+        self.assertIn('ansible_cloud_logging_entries_total{sink="failing",outcome="failed"} 25', text)
+        self.assertIn('ansible_cloud_logging_sink_write_seconds_count{sink="recording"} 3', text)
+        self.assertIn('ansible_cloud_logging_batch_entries_count 3', text)
+        self.assertIn('\nansible_cloud_logging_queue_depth 0\n', text)
+        self.assertIn('\nansible_cloud_logging_dropped_total 0\n', text)
+
+    def test_callback_serves_task_metrics(self):
+        server_class = ansible_cloud_logging.MetricsServer
+        with patch.object(ansible_cloud_logging, 'MetricsServer',
+                          lambda metrics, address, port: server_class(metrics, address, 0)):
+            callback = _callback_module([RecordingSink()], enable_async_logging=False, metrics_port=9464)
+        self.addCleanup(callback.metrics_server.close)
+        host = FakeHost('node1')
+        for i, role in enumerate(['swlib', 'swlib', '']):
+            task = FakeTask('task-%d' % i, 'task %d' % i, FakeRole(role) if role else None)
+            callback.v2_runner_on_start(host, task)
+            callback.v2_runner_on_ok(FakeTaskResult(host, task, {}))
+
+        text = requests.get('http://127.0.0.1:%d/metrics' % callback.metrics_server.port, timeout=5).text
+        self.assertIn('ansible_tasks_total{role="swlib",host="node1",status="ok"} 2', text)
+        self.assertIn('ansible_tasks_total{role="",host="node1",status="ok"} 1', text)
+        self.assertIn('ansible_task_duration_seconds_count{role="swlib",host="node1"} 2', text)
+        self.assertIn('ansible_cloud_logging_entries_total{sink="recording",outcome="written"} 6', text)
+
+    def test_metrics_are_disabled_by_default(self):
+        callback = _callback_module([RecordingSink()], enable_async_logging=False)
+
+        self.assertIsNone(callback.metrics)
+        self.assertIsNone(callback.metrics_server)
+
+
+if __name__ == '__main__':
+    unittest.main()
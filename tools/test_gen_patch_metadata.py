@@ -0,0 +1,422 @@
+import base64
+import contextlib
+import hashlib
+import io
+import http.server
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest.mock import call, patch
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import gen_patch_metadata  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+PATCHES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'patches')
+
+
+class PatchHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the server's payload with range support and injected failures."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.headers.get('Range'))
+            fail = server.fail_requests > 0
+            server.fail_requests -= fail
+            cut = server.cut_responses > 0 and not fail
+            server.cut_responses -= cut
+            refuse = server.max_requests is not None and len(server.requests) > server.max_requests
+        if fail or refuse:
+            self.send_error(503)
+            return
+
+        payload = server.payload
+        start, end = 0, len(payload) - 1
+        m = re.match(r'bytes=(\d+)-(\d+)$', self.headers.get('Range') or '')
+        if m and server.ranges:
+            start, end = int(m.group(1)), min(int(m.group(2)), len(payload) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+        body = payload[start:end + 1]
+        # A cut response ends the connection after half of its body.
+        self.wfile.write(body[:len(body) // 2] if cut and len(body) > 1 else body)
+        if cut:
+            self.close_connection = True
+
+
+class TestDownloadPatch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PatchHandler)
+        self.server.lock = threading.Lock()
+        self.server.payload = os.urandom(10 * CHUNK_SIZE + 1234)
+        self.server.requests = []
+        self.server.fail_requests = 0
+        self.server.cut_responses = 0
+        self.server.max_requests = None
+        self.server.ranges = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/p123_190000_Linux-x86-64.zip' % self.server.server_address[1]
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.patch_file = os.path.join(self.tmpdir, 'p123_190000_Linux-x86-64.zip')
+        sleep = patch('time.sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _download(self, connections=4):
+        return gen_patch_metadata.download_patch(requests.Session(), self.url, self.patch_file, connections, CHUNK_SIZE)
+
+    def _assert_downloaded(self, digests):
+        with open(self.patch_file, 'rb') as f:
+            self.assertEqual(f.read(), self.server.payload)
+        self.assertEqual(digests.md5, base64.b64encode(hashlib.md5(self.server.payload).digest()).decode('ascii'))
+        self.assertEqual(digests.sha256, hashlib.sha256(self.server.payload).hexdigest())
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), [os.path.basename(self.patch_file),
+                                                           os.path.basename(self.patch_file) + '.digests.json'])
+
+    def _ranges(self):
+        return sorted(int(r.split('=')[1].split('-')[0]) for r in self.server.requests[1:])
+
+    def test_download_in_ranges(self):
+        self._assert_downloaded(self._download())
+        # The probe and one request per chunk.
+        self.assertEqual(self.server.requests[0], 'bytes=0-0')
+        self.assertEqual(self._ranges(), [i * CHUNK_SIZE for i in range(11)])
+
+    def test_failed_and_cut_ranges_are_retried(self):
+        self.server.cut_responses = 3
+        self._download()
+        self.server.fail_requests = 4
+        os.remove(self.patch_file)
+        os.remove(self.patch_file + '.digests.json')
+        self._assert_downloaded(self._download(connections=2))
+
+    def test_interrupted_download_resumes(self):
+        # The probe and four chunks over one connection succeed.
+        self.server.max_requests = 5
+        with self.assertRaises(RuntimeError):
+            self._download(connections=1)
+        with open(self.patch_file + '.part.json') as f:
+            self.assertEqual(json.load(f)['done'], [0, 1, 2, 3])
+
+        self.server.max_requests = None
+        self.server.requests = []
+        self._assert_downloaded(self._download())
+        self.assertEqual(self._ranges(), [i * CHUNK_SIZE for i in range(4, 11)])
+
+    def test_truncated_file_is_downloaded_again(self):
+        with open(self.patch_file, 'wb') as f:
+            f.write(self.server.payload[:-1])
+        self._assert_downloaded(self._download())
+
+    def test_complete_file_is_not_downloaded_again(self):
+        with open(self.patch_file, 'wb') as f:
+            f.write(self.server.payload)
+        self._assert_downloaded(self._download())
+        self.assertEqual(self.server.requests, ['bytes=0-0'])
+
+    def test_digests_are_computed_while_downloading(self):
+        with patch.object(gen_patch_metadata._StreamHasher, '_read_back', side_effect=AssertionError('file read back')):
+            digests = self._download()
+        self._assert_downloaded(digests)
+
+    def test_digests_beyond_the_hash_buffer_are_read_back(self):
+        with patch.object(gen_patch_metadata, 'HASH_BUFFER_SIZE', 0):
+            self._assert_downloaded(self._download())
+
+    def test_recorded_digests_are_reused(self):
+        digests = self._download()
+        self.server.requests = []
+        with patch.object(gen_patch_metadata._StreamHasher, 'finish', side_effect=AssertionError('file hashed')):
+            self.assertEqual(self._download(), digests)
+        self.assertEqual(self.server.requests, [])
+
+        # A truncated file is downloaded again.
+        with open(self.patch_file, 'r+b') as f:
+            f.truncate(len(self.server.payload) - 1)
+        self._assert_downloaded(self._download())
+
+    def test_server_without_ranges(self):
+        self.server.ranges = False
+        self._assert_downloaded(self._download())
+        self.assertEqual(self.server.requests, ['bytes=0-0', None])
+
+
+def _write_patch(path, patchnum, abstract, release, titles, members=0, body=''):
+    """Writes a patch zip with the given README titles by subdirectory and other members."""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('PatchSearch.xml', f'<results><patch><abstract>{abstract}</abstract>'
+                                      f'<release name="{release}"/></patch></results>')
+        for subdir, title in titles.items():
+            z.writestr(f'{patchnum}/{subdir}/README.html',
+                       f'<html><head><title>{title}</title></head><body>{body}</body></html>')
+            z.writestr(f'{patchnum}/{subdir}/README.txt', title)
+        for i in range(members):
+            z.writestr(f'{patchnum}/{min(titles)}/files/lib/member{i}.o', b'')
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        self.addCleanup(os.chdir, cwd)
+
+        _write_patch('p101_190000_Linux-x86-64.zip', 101, 'GI RELEASE UPDATE 19.25.0.0.0', '19.0.0.0.0',
+                     {'201': 'GI Release Update 19.25.0.0.0', '202': 'Oracle JavaVM Component Release Update'})
+        _write_patch('p102_190000_Linux-x86-64.zip', 102, 'DATABASE RELEASE UPDATE 19.25.0.0.0', '19.0.0.0.0',
+                     {'203': 'Database Release Update 19.25.0.0.0'})
+        _write_patch('p103_210000_Linux-x86-64.zip', 103, 'DATABASE RELEASE UPDATE 21.16.0.0.0', '21.0.0.0.0',
+                     {'204': 'Database Release Update 21.16.0.0.0'})
+        for major, version in (('190000', '12.2.0.1.44'), ('210000', '12.2.0.1.45')):
+            with zipfile.ZipFile(f'p6880880_{major}_Linux-x86-64.zip', 'w') as z:
+                z.writestr('OPatch/version.txt', f'OPATCH_VERSION:{version}\n')
+
+        def url(patch_file):
+            return 'https://updates.oracle.com/Orion/Download/process_form?patch_file=' + patch_file
+        self.urls = {
+            101: [url('p101_190000_Linux-x86-64.zip')],
+            102: [url('p102_190000_Linux-x86-64.zip')],
+            103: [url('p103_210000_Linux-x86-64.zip')],
+            6880880: [url('p6880880_210000_Linux-x86-64.zip'), url('p6880880_190000_Linux-x86-64.zip')],
+        }
+        get_patch_url = patch.object(gen_patch_metadata, 'get_patch_url', side_effect=lambda s, n: self.urls[n])
+        self.get_patch_url = get_patch_url.start()
+        self.addCleanup(get_patch_url.stop)
+        download_patch = patch.object(gen_patch_metadata, 'download_patch',
+                                      side_effect=lambda s, url, patch_file, connections: gen_patch_metadata.file_digests(patch_file))
+        self.download_patch = download_patch.start()
+        self.addCleanup(download_patch.stop)
+
+    def _md5(self, patch_file):
+        return gen_patch_metadata.file_digests(patch_file).md5
+
+    def test_batch(self):
+        entries = gen_patch_metadata.generate_metadata(requests.Session(), [101, 102, 103, 102])
+        md5 = {n: self._md5(f'p{n}_{m}_Linux-x86-64.zip') for n, m in ((101, 190000), (102, 190000), (103, 210000))}
+        self.assertEqual(entries, [
+            (gen_patch_metadata.GI_PATCHES_FILE, f'  - {{ category: "RU", base: "19.3.0.0.0", release: "19.25.0.0.0", patchnum: "101", patchfile: "p101_190000_Linux-x86-64.zip", patch_subdir: "/201", prereq_check: false, method: "opatchauto apply", ocm: false, upgrade: false, md5sum: "{md5[101]}", minimum_opatch: "12.2.0.1.44" }}'),
+            (gen_patch_metadata.RDBMS_PATCHES_FILE, f'  - {{ category: "RU_Combo", base: "19.3.0.0.0", release: "19.25.0.0.0", patchnum: "101", patchfile: "p101_190000_Linux-x86-64.zip", patch_subdir: "/202", prereq_check: true, method: "opatch apply", ocm: false, upgrade: true, md5sum: "{md5[101]}", minimum_opatch: "12.2.0.1.44" }}'),
+            (gen_patch_metadata.RDBMS_PATCHES_FILE, f'  - {{ category: "DB_RU", base: "19.3.0.0.0", release: "19.25.0.0.0", patchnum: "102", patchfile: "p102_190000_Linux-x86-64.zip", patch_subdir: "/203", prereq_check: true, method: "opatch apply", ocm: false, upgrade: true, md5sum: "{md5[102]}", minimum_opatch: "12.2.0.1.44" }}'),
+            (gen_patch_metadata.RDBMS_PATCHES_FILE, f'  - {{ category: "DB_RU", base: "21.3.0.0.0", release: "21.16.0.0.0", patchnum: "103", patchfile: "p103_210000_Linux-x86-64.zip", patch_subdir: "/", prereq_check: false, method: "opatch apply", ocm: false, upgrade: false, md5sum: "{md5[103]}", minimum_opatch: "12.2.0.1.45" }}'),
+        ])
+        # Each patch is resolved and downloaded once, and OPatch once per major version.
+        self.assertEqual(sorted(c.args[1] for c in self.get_patch_url.call_args_list), [101, 102, 103, 6880880])
+        self.assertEqual([c.args[2] for c in self.download_patch.call_args_list], [
+            'p101_190000_Linux-x86-64.zip', 'p102_190000_Linux-x86-64.zip', 'p103_210000_Linux-x86-64.zip',
+            'p6880880_190000_Linux-x86-64.zip', 'p6880880_210000_Linux-x86-64.zip'])
+
+    def test_entries_are_grouped_by_file(self):
+        entries = [('gi.yml', 'gi1'), ('rdbms.yml', 'rdbms1'), ('gi.yml', 'gi2'), ('rdbms.yml', 'rdbms2')]
+        with patch('builtins.print') as print_:
+            gen_patch_metadata.print_entries(entries)
+        self.assertEqual(print_.call_args_list, [
+            call('Add to gi.yml:'), call('gi1'), call('gi2'), call(), call('Add to rdbms.yml:'), call('rdbms1'),
+            call('rdbms2')])
+
+
+class TestReadmeTitle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.patch_file = os.path.join(self.tmpdir, 'p101_190000_Linux-x86-64.zip')
+
+    def _title(self, readme):
+        with zipfile.ZipFile(self.patch_file, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('README.html', readme)
+        with zipfile.ZipFile(self.patch_file) as z:
+            return gen_patch_metadata.readme_title(z, z.getinfo('README.html'))
+
+    def test_title_is_read_incrementally(self):
+        readme = ('<html><head><meta charset="utf-8">' + '<!-- padding -->' * 5000
+                  + '<title>\n  Oracle\u00ae Database Release Update &amp; more\n</title></head><body>'
+                  + '<p>text</p>' * 100000 + '</body></html>')
+        read = []
+        read_ = zipfile.ZipExtFile.read
+
+        def counting_read(f, n=-1):
+            data = read_(f, n)
+            read.append(len(data))
+            return data
+        with patch.object(gen_patch_metadata.bs4, 'BeautifulSoup', side_effect=AssertionError('parsed in full')), \
+             patch.object(zipfile.ZipExtFile, 'read', counting_read):
+            self.assertEqual(self._title(readme), 'Oracle\u00ae Database Release Update & more')
+        # Reading stops at the end of the title, before the body.
+        self.assertLess(sum(read), len(readme) // 4)
+
+    def test_doctitle_without_title(self):
+        self.assertEqual(self._title('<html><head><meta name="doctitle" content="Oracle JavaVM Component Release Update">'
+                                     '</head><body></body></html>'), 'Oracle JavaVM Component Release Update')
+        self.assertEqual(self._title('<html><head><title> </title><meta name="doctitle" content="GI Release Update">'
+                                     '</head></html>'), 'GI Release Update')
+        self.assertEqual(self._title('<html><body>no title</body></html>'), '')
+
+    def test_many_members(self):
+        titles = {'201': 'GI Release Update 19.25.0.0.0', '202': 'Oracle JavaVM Component Release Update'}
+        _write_patch(self.patch_file, 101, 'GI RELEASE UPDATE 19.25.0.0.0', '19.0.0.0.0', titles, members=5000)
+        self.assertEqual(gen_patch_metadata.parse_patch(self.patch_file, 101),
+                         ('19.0.0.0.0', '19.25.0.0.0', '202', '201', None, True))
+
+
+class TestLocalPatches(unittest.TestCase):
+    """Parses the patch zips of the fixtures in testdata/patches, zipped at setup."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        for name in os.listdir(PATCHES_DIR):
+            with zipfile.ZipFile(self._zip(name), 'w', zipfile.ZIP_DEFLATED) as z:
+                for d, _, files in os.walk(os.path.join(PATCHES_DIR, name)):
+                    for f in sorted(files):
+                        z.write(os.path.join(d, f), os.path.relpath(os.path.join(d, f), os.path.join(PATCHES_DIR, name)))
+
+    def _zip(self, name):
+        return os.path.join(self.tmpdir, name if name.endswith('.zip') else name + '.zip')
+
+    def _md5(self, name):
+        return gen_patch_metadata.file_digests(self._zip(name)).md5
+
+    def test_parse_patch(self):
+        for name, patchnum, expected in (
+                ('p36866740_190000_Linux-x86-64', 36866740,
+                 ('19.0.0.0.0', '19.24.0.0.240716', '36878697', '36916690', None, True)),
+                ('p36582781_190000_Linux-x86-64', 36582781,
+                 ('19.0.0.0.0', '19.24.0.0.0', None, None, '36582781', False)),
+                ('p36696109_210000_Linux-x86-64', 36696109,
+                 ('21.0.0.0.0', '21.15.0.0.0', None, '', None, True))):
+            with self.subTest(name):
+                self.assertEqual(gen_patch_metadata.parse_patch(self._zip(name), patchnum), expected)
+
+    def test_get_min_opatch_version(self):
+        self.assertEqual(gen_patch_metadata.get_min_opatch_version(self._zip('p6880880_190000_Linux-x86-64')),
+                         '12.2.0.1.43')
+        self.assertEqual(gen_patch_metadata.get_min_opatch_version(self._zip('p6880880_210000_Linux-x86-64')),
+                         '12.2.0.1.44')
+        with zipfile.ZipFile(self._zip('p6880880_230000_Linux-x86-64'), 'w') as z:
+            z.writestr('OPatch/opatch', '#!/bin/sh\n')
+        self.assertEqual(gen_patch_metadata.get_min_opatch_version(self._zip('p6880880_230000_Linux-x86-64')), 'unknown')
+
+    def test_digests_of_read_only_mirror(self):
+        patch_file = self._zip('p36582781_190000_Linux-x86-64')
+        # A directory in place of the digests file makes writing it fail.
+        os.mkdir(patch_file + gen_patch_metadata.DIGESTS_SUFFIX)
+        with self.assertLogs(level='WARNING') as logs:
+            digests = gen_patch_metadata.file_digests(patch_file)
+        with open(patch_file, 'rb') as f:
+            self.assertEqual(digests.sha256, hashlib.sha256(f.read()).hexdigest())
+        self.assertIn('Cannot record the digests of ' + patch_file, logs.output[0])
+
+    def test_patch_number(self):
+        self.assertEqual(gen_patch_metadata.patch_number('/mirror/p36866740_190000_Linux-x86-64.zip'), 36866740)
+        with self.assertRaises(ValueError):
+            gen_patch_metadata.patch_number('/mirror_p1/LINUX.X64_193000_db_home.zip')
+
+    def test_local_metadata(self):
+        md5 = {n: self._md5(f'p{n}_{m}_Linux-x86-64') for n, m in
+               ((36866740, 190000), (36582781, 190000), (36696109, 210000))}
+        entries = gen_patch_metadata.generate_local_metadata(
+            [self._zip(f) for f in sorted(os.listdir(PATCHES_DIR)) if not f.startswith('p6880880')],
+            [self._zip('p6880880_190000_Linux-x86-64'), self._zip('p6880880_210000_Linux-x86-64')])
+        self.assertEqual(entries, [
+            (gen_patch_metadata.RDBMS_PATCHES_FILE, f'  - {{ category: "DB_RU", base: "19.3.0.0.0", release: "19.24.0.0.0", patchnum: "36582781", patchfile: "p36582781_190000_Linux-x86-64.zip", patch_subdir: "/36582781", prereq_check: true, method: "opatch apply", ocm: false, upgrade: true, md5sum: "{md5[36582781]}", minimum_opatch: "12.2.0.1.43" }}'),
+            (gen_patch_metadata.GI_PATCHES_FILE, f'  - {{ category: "RU", base: "21.3.0.0.0", release: "21.15.0.0.0", patchnum: "36696109", patchfile: "p36696109_210000_Linux-x86-64.zip", patch_subdir: "/", prereq_check: false, method: "opatchauto apply", ocm: false, upgrade: false, md5sum: "{md5[36696109]}", minimum_opatch: "12.2.0.1.44" }}'),
+            (gen_patch_metadata.GI_PATCHES_FILE, f'  - {{ category: "RU", base: "19.3.0.0.0", release: "19.24.0.0.240716", patchnum: "36866740", patchfile: "p36866740_190000_Linux-x86-64.zip", patch_subdir: "/36916690", prereq_check: false, method: "opatchauto apply", ocm: false, upgrade: false, md5sum: "{md5[36866740]}", minimum_opatch: "12.2.0.1.43" }}'),
+            (gen_patch_metadata.RDBMS_PATCHES_FILE, f'  - {{ category: "RU_Combo", base: "19.3.0.0.0", release: "19.24.0.0.240716", patchnum: "36866740", patchfile: "p36866740_190000_Linux-x86-64.zip", patch_subdir: "/36878697", prereq_check: true, method: "opatch apply", ocm: false, upgrade: true, md5sum: "{md5[36866740]}", minimum_opatch: "12.2.0.1.43" }}'),
+        ])
+
+    def test_local_metadata_matches_mos(self):
+        names = ['p36866740_190000_Linux-x86-64', 'p36696109_210000_Linux-x86-64']
+        local = gen_patch_metadata.generate_local_metadata(
+            [self._zip(name) for name in names + ['p6880880_190000_Linux-x86-64', 'p6880880_210000_Linux-x86-64']], [])
+
+        urls = {gen_patch_metadata.patch_number(name): ['https://updates.oracle.com/Orion/Download/process_form?patch_file='
+                                                        + name + '.zip'] for name in names}
+        urls[gen_patch_metadata.OPATCH_PATCHNUM] = ['https://updates.oracle.com/Orion/Download/process_form?patch_file='
+                                                    + f'p6880880_{major}_Linux-x86-64.zip' for major in ('190000', '210000')]
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        self.addCleanup(os.chdir, cwd)
+        with patch.object(gen_patch_metadata, 'get_patch_url', side_effect=lambda s, n: urls[n]), \
+             patch.object(gen_patch_metadata, 'download_patch',
+                          side_effect=lambda s, url, patch_file, connections: gen_patch_metadata.file_digests(patch_file)):
+            online = gen_patch_metadata.generate_metadata(requests.Session(), [36866740, 36696109])
+        self.assertEqual(local, online)
+
+    def test_offline_main(self):
+        argv = ['gen_patch_metadata.py', '--from-file', self._zip('p36582781_190000_Linux-x86-64'),
+                '--opatch-file', self._zip('p6880880_190000_Linux-x86-64')]
+        out = io.StringIO()
+        with patch.object(sys, 'argv', argv), contextlib.redirect_stdout(out), \
+             patch.object(gen_patch_metadata.getpass, 'getpass', side_effect=AssertionError('password prompted')), \
+             patch.object(gen_patch_metadata, 'get_patch_url', side_effect=AssertionError('MOS searched')):
+            gen_patch_metadata.main()
+        self.assertEqual(out.getvalue().splitlines()[0], 'Add to roles/common/defaults/main/rdbms_patches.yml:')
+        self.assertIn('patchnum: "36582781"', out.getvalue())
+
+    def test_missing_opatch_file(self):
+        with self.assertRaisesRegex(ValueError, 'major versions 21000'):
+            gen_patch_metadata.generate_local_metadata(
+                [self._zip('p36696109_210000_Linux-x86-64')], [self._zip('p6880880_190000_Linux-x86-64')])
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class BenchmarkParsePatch(unittest.TestCase):
+    """
+    Compares the time of parse_patch on synthetic patch zips with thousands of
+    members and large READMEs, with the READMEs parsed incrementally up to
+    their title and in full.
+
+    Run with: RUN_BENCHMARKS=1 python -m pytest -s tools/test_gen_patch_metadata.py -k Benchmark
+    """
+
+    def test_parse_patch_benchmark(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        titles = {str(200 + i): 'Database Release Update 19.25.0.0.0' for i in range(20)}
+        body = '<p>Apply the patch with opatch.</p>' * 20000
+
+        def full_title(z, info):
+            with z.open(info) as f:
+                c = gen_patch_metadata.bs4.BeautifulSoup(f.read(), 'lxml')
+            return c.find('title').get_text().strip()
+
+        for members in (1000, 10000, 50000):
+            patch_file = os.path.join(tmpdir, 'p101_%d.zip' % members)
+            _write_patch(patch_file, 101, 'DATABASE RELEASE UPDATE 19.25.0.0.0', '19.0.0.0.0', titles,
+                         members=members, body=body)
+            for label, title in (('incremental', gen_patch_metadata.readme_title), ('full', full_title)):
+                with patch.object(gen_patch_metadata, 'readme_title', title):
+                    start = time.perf_counter()
+                    result = gen_patch_metadata.parse_patch(patch_file, 101)
+                    elapsed = time.perf_counter() - start
+                self.assertEqual(result[4], '219')
+                print('\n%d members, %d READMEs of %d KiB, %s titles: %.3fs'
+                      % (members, len(titles), len(body) // 1024, label, elapsed))
+
+
+if __name__ == '__main__':
+    unittest.main()